@@ -0,0 +1,169 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+#
+# Compares Avery 5389 imposition using shared form XObjects against the old
+# PyPDF2 mergeTranslatedPage() implementation on a synthetic deck of cards.
+#
+# Usage: python3 benchmarks/avery5389.py [-n CARDS] [--old-max CARDS]
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from pycook import impose
+
+def old_to_avery5389(infile, front_out, back_out=None):
+    """The imposition code as it was before form XObjects"""
+    from PyPDF2 import PdfFileReader, PdfFileWriter
+    from PyPDF2.pdf import PageObject
+
+    inpdf = PdfFileReader(infile)
+    front_out_pdf = PdfFileWriter()
+    if back_out:
+        back_out_pdf = PdfFileWriter()
+    else:
+        back_out_pdf = front_out_pdf
+
+    num_in_pages = inpdf.getNumPages()
+    num_out_sheets = (num_in_pages + 3) // 4
+    for i in range(num_out_sheets):
+        front = PageObject.createBlankPage(None, 612, 792)
+        back = PageObject.createBlankPage(None, 612, 792)
+
+        front.mergeTranslatedPage(inpdf.getPage(i * 4 + 0), 90, 396)
+        if i * 4 + 2 < num_in_pages:
+            front.mergeTranslatedPage(inpdf.getPage(i * 4 + 2), 90, 108)
+        if i * 4 + 1 < num_in_pages:
+            back.mergeTranslatedPage(inpdf.getPage(i * 4 + 1), 90, 396)
+        if i * 4 + 3 < num_in_pages:
+            back.mergeTranslatedPage(inpdf.getPage(i * 4 + 3), 90, 108)
+
+        front_out_pdf.addPage(front)
+        back_out_pdf.addPage(back)
+
+    with open(front_out, 'wb') as f:
+        front_out_pdf.write(f)
+    if back_out:
+        with open(back_out, 'wb') as f:
+            back_out_pdf.write(f)
+
+def generate_deck(path, num_cards):
+    """Writes a PDF of 4x6 cards sharing a font and a background image"""
+    from PyPDF2 import PdfFileWriter
+    from PyPDF2.generic import (DecodedStreamObject, DictionaryObject,
+                                NameObject, NumberObject)
+
+    writer = PdfFileWriter()
+    font = writer._addObject(DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    }))
+
+    image = DecodedStreamObject()
+    image.setData(bytes((x * y) & 0xff for y in range(256)
+                        for x in range(256)))
+    image.update({
+        NameObject('/Type'): NameObject('/XObject'),
+        NameObject('/Subtype'): NameObject('/Image'),
+        NameObject('/Width'): NumberObject(256),
+        NameObject('/Height'): NumberObject(256),
+        NameObject('/ColorSpace'): NameObject('/DeviceGray'),
+        NameObject('/BitsPerComponent'): NumberObject(8),
+    })
+    image = writer._addObject(image.flateEncode())
+
+    for i in range(num_cards):
+        page = writer.addBlankPage(432, 288)
+        lines = ['q 432 0 0 288 0 0 cm /Bg Do Q', 'BT /F1 10 Tf 20 260 Td',
+                 '(Recipe {}) Tj'.format(i)]
+        for j in range(30):
+            lines.append('0 -8 Td (Step {}: stir the pot for {} minutes.) Tj'
+                         .format(j, i % 60))
+        lines.append('ET')
+        content = DecodedStreamObject()
+        content.setData('\n'.join(lines).encode())
+        page[NameObject('/Contents')] = \
+            writer._addObject(content.flateEncode())
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({
+                NameObject('/F1'): font,
+            }),
+            NameObject('/XObject'): DictionaryObject({
+                NameObject('/Bg'): image,
+            }),
+        })
+
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+def measure(func, *args):
+    gc.collect()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--cards', type=int, nargs='+',
+                        default=[100, 1000],
+                        help='Number of cards in each deck to test')
+    parser.add_argument('--old-max', type=int, default=1000,
+                        help="Skip the old implementation for decks larger "
+                             "than this")
+    args = parser.parse_args()
+
+    from PyPDF2 import PdfFileReader
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for num_cards in args.cards:
+            deck = os.path.join(tmpdir, 'deck.pdf')
+            generate_deck(deck, num_cards)
+            print('{} cards ({} KiB)'.format(num_cards,
+                                             os.path.getsize(deck) // 1024))
+
+            impls = [('xobject', impose.avery5389)]
+            if num_cards <= args.old_max:
+                impls.append(('merge', old_to_avery5389))
+            for name, func in impls:
+                out = os.path.join(tmpdir, name + '.pdf')
+                elapsed, peak = measure(func, deck, out)
+                with open(out, 'rb') as f:
+                    num_sheets = PdfFileReader(f).getNumPages()
+                print('  {:8} {:8.3f} s {:8.1f} MiB peak {:8} KiB out, '
+                      '{} pages'.format(name, elapsed, peak / (1 << 20),
+                                        os.path.getsize(out) // 1024,
+                                        num_sheets))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+#
+# Measures how long common entry points spend importing modules, using
+# python -X importtime, and checks them against a time budget.  Each case
+# also lists packages it must not import at all; Mako and PyYAML are only
+# needed once something is actually rendered or loaded.
+#
+# Exits with status 1 if any case goes over budget or imports something it
+# shouldn't so it can be run as a check before committing.
+#
+# Usage: python3 benchmarks/importtime.py [-r REPEAT] [-b CASE=MS]... [-v]
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# (name, python arguments, budget in ms, forbidden top-level packages)
+CASES = [
+    ('help', [os.path.join(ROOT, 'pycook.py'), '--help'], 100,
+     ['mako', 'yaml', 'PyPDF2']),
+    ('units', ['-c', 'import pycook.units'], 30,
+     ['mako', 'yaml', 'PyPDF2']),
+    ('recipe', ['-c', 'from pycook.recipe import Recipe'], 60,
+     ['mako', 'PyPDF2']),
+    ('cookbook', ['-c', 'from pycook import Cookbook'], 100,
+     ['mako', 'PyPDF2']),
+]
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+def import_times(args):
+    """Returns {module: self time in µs} for running python with args"""
+    p = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=ROOT,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                       universal_newlines=True, check=True)
+    times = {}
+    for line in p.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            times[m.group(4)] = int(m.group(1))
+    return times
+
+def measure(args, baseline, repeat):
+    """Returns the best total import time in ms and the modules imported
+
+    Modules the interpreter imports on its own at startup are not counted.
+    """
+    best = None
+    for _ in range(repeat):
+        times = import_times(args)
+        total = sum(us for mod, us in times.items() if mod not in baseline)
+        if best is None or total < best[0]:
+            best = (total, times)
+    total, times = best
+    return total / 1000, { mod: us for mod, us in times.items()
+                           if mod not in baseline }
+
+def parse_budget(s):
+    name, _, ms = s.partition('=')
+    return name, float(ms)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Runs per case; the fastest one counts')
+    parser.add_argument('-b', '--budget', type=parse_budget, action='append',
+                        default=[], metavar='CASE=MS',
+                        help='Override the budget for a case')
+    parser.add_argument('-v', '--verbose', action='store_const',
+                        const=True, default=False,
+                        help='List the slowest modules of each case')
+    args = parser.parse_args()
+
+    budgets = dict(args.budget)
+    for name in budgets:
+        assert name in [c[0] for c in CASES], 'Unknown case: ' + name
+
+    baseline = set(import_times(['-c', 'pass']))
+
+    failed = False
+    for name, py_args, budget, forbidden in CASES:
+        budget = budgets.get(name, budget)
+        ms, modules = measure(py_args, baseline, args.repeat)
+
+        problems = []
+        if ms > budget:
+            problems.append('over budget')
+        imported = sorted(set(mod.split('.')[0] for mod in modules) &
+                          set(forbidden))
+        if imported:
+            problems.append('imports ' + ', '.join(imported))
+
+        print('{:10} {:7.1f} ms  (budget {:.0f} ms)  {}'.format(
+              name, ms, budget, '; '.join(problems) or 'ok'))
+        if args.verbose:
+            slowest = sorted(modules.items(), key=lambda m: -m[1])[:8]
+            for mod, us in slowest:
+                print('    {:7.1f} ms  {}'.format(us / 1000, mod))
+        failed |= bool(problems)
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
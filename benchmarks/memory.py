@@ -0,0 +1,70 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+#
+# Reports how much memory a loaded cookbook takes per recipe.
+#
+# Usage: python3 benchmarks/memory.py [-c CHAPTERS] [-r RECIPES] [COOKBOOK]
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import synthetic
+from pycook import Cookbook
+
+def measure(cookbook_path):
+    gc.collect()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    c = Cookbook.load(cookbook_path)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    num_recipes = sum(len(ch.recipes) for ch in c.chapters)
+    return size, num_recipes
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--chapters', type=int, default=10,
+                        help='Number of chapters to generate')
+    parser.add_argument('-r', '--recipes', type=int, default=200,
+                        help='Number of recipes per chapter to generate')
+    parser.add_argument('cookbook', nargs='?',
+                        help='Measure an existing cookbook.yaml instead')
+    args = parser.parse_args()
+
+    if args.cookbook:
+        size, num_recipes = measure(args.cookbook)
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = synthetic.generate(tmpdir, args.chapters, args.recipes)
+            size, num_recipes = measure(path)
+
+    print('{} recipes, {} bytes total, {:.0f} bytes per recipe'.format(
+          num_recipes, size, size / num_recipes))
+
+if __name__ == '__main__':
+    main()
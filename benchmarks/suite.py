@@ -0,0 +1,259 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+#
+# Times each stage of a build on a synthetic cookbook and reports
+# throughput and peak memory.  Results can be written as JSON and compared
+# against an earlier run to spot regressions between commits.
+#
+# Usage: python3 benchmarks/suite.py [-c CHAPTERS] [-r RECIPES] [-o OUT.json]
+#                                    [--compare OLD.json] [--latexmk]
+#                                    [--sphinx]
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import synthetic
+from pycook import Cookbook, latex, recipe, rst, yaml_util
+
+def _recipe_strings(cookbook_path):
+    """Returns every ingredient and instruction string in a cookbook"""
+    strings = []
+    cb_dir = os.path.dirname(os.path.abspath(cookbook_path))
+    for dirpath, dirnames, filenames in sorted(os.walk(cb_dir)):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if fname in ('index.yaml', 'cookbook.yaml') or \
+               not fname.endswith('.yaml'):
+                continue
+            data = yaml_util.read_yaml_file(os.path.join(dirpath, fname))
+            strings.append(data['name'])
+            strings.extend(data.get('ingredients', []))
+            strings.extend(data.get('instructions', []))
+            if 'note' in data:
+                strings.append(data['note'])
+    return strings
+
+def _measure(func, repeat):
+    """Runs func repeat times and returns (best seconds, peak bytes, result)
+
+    Peak memory is measured in a separate run because tracemalloc slows
+    down allocation-heavy code considerably.
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best, peak, result
+
+def _stage(results, name, func, items, unit, repeat):
+    """Measures one stage and records it in results
+
+    items is either the number of items the stage processes or a function
+    which computes it from the stage's result.
+    """
+    seconds, peak, result = _measure(func, repeat)
+    if callable(items):
+        items = items(result)
+    results[name] = {
+        'seconds': seconds,
+        'items': items,
+        'unit': unit,
+        'throughput': items / seconds if seconds else None,
+        'peak_bytes': peak,
+    }
+    return result
+
+def _skip(results, name, reason):
+    results[name] = { 'skipped': reason }
+
+def _git_commit():
+    try:
+        p = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                           cwd=os.path.dirname(os.path.abspath(__file__)),
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                           universal_newlines=True)
+    except OSError:
+        return None
+    return p.stdout.strip() or None
+
+def run(cookbook_path, tmpdir, repeat=3, jobs=1, run_latexmk=False,
+        run_sphinx=False):
+    stages = {}
+
+    c = _stage(stages, 'load',
+               lambda: Cookbook.load(cookbook_path, jobs=jobs),
+               lambda c: sum(len(ch.recipes) for ch in c.chapters),
+               'recipes', repeat)
+    num_recipes = stages['load']['items']
+
+    bundle_path = os.path.join(tmpdir, 'cookbook.bundle')
+    _stage(stages, 'bundle-write', lambda: c.write_bundle(bundle_path),
+           num_recipes, 'recipes', repeat)
+
+    def load_bundle():
+        # Decode every recipe so this is comparable with 'load'
+        b = Cookbook.load_bundle(bundle_path)
+        for ch in b.chapters:
+            for r in ch.recipes:
+                r.ingredients
+        return b
+    _stage(stages, 'bundle-load', load_bundle, num_recipes, 'recipes', repeat)
+
+    strings = _recipe_strings(cookbook_path)
+    _stage(stages, 'tokenize',
+           lambda: [recipe._TOKENIZER.tokenize(s) for s in strings],
+           lambda tokens: sum(len(t) for t in tokens), 'tokens', repeat)
+
+    for style in ('cookbook', '4x6cards'):
+        tex = _stage(stages, 'latex-' + style,
+                     lambda: latex.render_cookbook(c, style=style),
+                     num_recipes, 'recipes', repeat)
+        with open(os.path.join(tmpdir, style + '.tex'), 'w') as f:
+            f.write(tex)
+        del tex
+
+    rst_dirs = []
+    def dump_rst():
+        # Use a fresh directory each time so every file is written
+        rst_dirs.append(tempfile.mkdtemp(dir=tmpdir, prefix='rst-'))
+        return rst.dump_cookbook(c, rst_dirs[-1])
+    _stage(stages, 'rst', dump_rst, num_recipes, 'recipes', repeat)
+
+    if not run_latexmk:
+        _skip(stages, 'latexmk', 'not requested')
+    elif shutil.which('latexmk') is None:
+        _skip(stages, 'latexmk', 'latexmk not found')
+    else:
+        tex_path = os.path.join(tmpdir, 'cookbook.tex')
+        def compile_pdf():
+            subprocess.run(['latexmk', '-cd', '-pdf', '-gg', '-quiet',
+                            tex_path], stdout=subprocess.DEVNULL,
+                           check=True)
+        _stage(stages, 'latexmk', compile_pdf, num_recipes, 'recipes', 1)
+
+    if not run_sphinx:
+        _skip(stages, 'sphinx', 'not requested')
+    elif shutil.which('sphinx-build') is None:
+        _skip(stages, 'sphinx', 'sphinx-build not found')
+    else:
+        def build_html():
+            out = tempfile.mkdtemp(dir=tmpdir, prefix='html-')
+            subprocess.run(['sphinx-build', '-q', '-b', 'html',
+                            rst_dirs[-1], out], check=True)
+        _stage(stages, 'sphinx', build_html, num_recipes, 'recipes', 1)
+
+    return stages
+
+def _print_stages(stages, baseline=None):
+    for name, s in stages.items():
+        if 'skipped' in s:
+            print('{:16} skipped ({})'.format(name, s['skipped']))
+            continue
+        line = '{:16} {:9.4f} s {:12.0f} {}/s {:10.1f} MiB peak'.format(
+               name, s['seconds'], s['throughput'], s['unit'],
+               s['peak_bytes'] / (1 << 20))
+        old = (baseline or {}).get(name, {})
+        if 'seconds' in old:
+            line += '  {:+.1f}% time'.format(
+                    (s['seconds'] / old['seconds'] - 1) * 100)
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--chapters', type=int, default=10,
+                        help='Number of chapters to generate')
+    parser.add_argument('-r', '--recipes', type=int, default=100,
+                        help='Number of recipes per chapter to generate')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='Random seed for the generated cookbook')
+    parser.add_argument('-n', '--repeat', type=int, default=3,
+                        help='Number of times to time each stage')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of processes to load recipes with')
+    parser.add_argument('-o', '--output', help='Write results as JSON')
+    parser.add_argument('--compare',
+                        help='JSON results of an earlier run to compare to')
+    parser.add_argument('--latexmk', action='store_true',
+                        help='Also time compiling the PDF with latexmk')
+    parser.add_argument('--sphinx', action='store_true',
+                        help='Also time building HTML with sphinx-build')
+    parser.add_argument('cookbook', nargs='?',
+                        help='Benchmark an existing cookbook.yaml instead')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.cookbook:
+            cookbook_path = args.cookbook
+        else:
+            cookbook_path = synthetic.generate(os.path.join(tmpdir, 'src'),
+                                               args.chapters, args.recipes,
+                                               args.seed)
+        stages = run(cookbook_path, tmpdir, repeat=args.repeat,
+                     jobs=args.jobs, run_latexmk=args.latexmk,
+                     run_sphinx=args.sphinx)
+
+    results = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'params': {
+            'cookbook': args.cookbook,
+            'chapters': args.chapters,
+            'recipes': args.recipes,
+            'seed': args.seed,
+            'jobs': args.jobs,
+        },
+        'stages': stages,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['stages']
+    _print_stages(stages, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+if __name__ == '__main__':
+    main()
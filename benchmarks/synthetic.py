@@ -0,0 +1,131 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+#
+# Generates synthetic cookbooks for benchmarking.
+#
+# Usage: python3 benchmarks/synthetic.py [-c CHAPTERS] [-r RECIPES] OUTPUT_DIR
+
+import argparse
+import os
+import random
+
+_UNITS = ['cup', 'cups', 'tbsp', 'tsp', 'lb', 'oz', 'g', 'ml', 'can', 'cans',
+          'clove', 'cloves', 'pkg', 'gal']
+_AMOUNTS = ['1', '2', '3', '1/2', '1/4', '3/4', '1/3', '1 1/2', '2 1/4',
+            '0.5', '1.5', '250', '1-2', '2 - 3', '1/2-1']
+_INGREDIENTS = ['All-purpose flour', 'Whole wheat flour', 'Sugar',
+                'Brown sugar', 'Baking powder', 'Baking soda', 'Salt',
+                'Butter, melted', 'Milk', 'Eggs', 'Vanilla extract',
+                'Olive oil', 'Garlic, minced', 'Onion, diced', 'Carrots',
+                'Celery', 'Chicken broth', 'Beef chuck', 'Rice', 'Black beans',
+                'Tomatoes, crushed', 'Black pepper', 'Cumin', 'Paprika',
+                'Parmesan cheese', 'Heavy cream', 'Lemon juice', 'Honey']
+_STEPS = [
+    'Preheat the oven to {temp} [degF].',
+    'Mix the dry ingredients together in a large bowl.',
+    'Whisk {amount} [cup] of the milk with the eggs.',
+    'Heat {amount} [tbsp] of oil in a {size} [in] skillet over medium heat.',
+    'Add the onion and cook for {time} [min], stirring occasionally.',
+    'Stir in {amount} [tsp] of salt and simmer for {time} [min].',
+    'Bake for {time}-{time2} [min] or until golden brown.',
+    'Let rest for {hours} [hours] before serving.',
+    'Fold the wet ingredients into the dry until just combined.',
+    'Pour into a {cm} [cm] pan and spread evenly.',
+]
+_WORDS = ['Grandma', 'Easy', 'Spicy', 'Classic', 'Weeknight', 'Holiday',
+          'Lemon', 'Garlic', 'Smoky', 'Creamy', 'Pancakes', 'Stew', 'Soup',
+          'Bread', 'Casserole', 'Salad', 'Chili', 'Muffins', 'Tacos', 'Pie']
+
+def _letters(n):
+    s = ''
+    while True:
+        s = chr(ord('a') + n % 26) + s
+        n //= 26
+        if n == 0:
+            return s
+
+def _recipe_yaml(rand, name):
+    lines = ['name: ' + name]
+    if rand.random() < 0.5:
+        lines.append('from: ' + rand.choice(_WORDS) + ' Family')
+    lines.append('ingredients:')
+    for _ in range(rand.randint(4, 14)):
+        ingredient = rand.choice(_INGREDIENTS)
+        r = rand.random()
+        if r < 0.75:
+            ingredient = '{} [{}] {}'.format(rand.choice(_AMOUNTS),
+                                             rand.choice(_UNITS), ingredient)
+        elif r < 0.9:
+            ingredient = '{} {}'.format(rand.choice(_AMOUNTS), ingredient)
+        lines.append('  - ' + ingredient)
+    lines.append('instructions:')
+    for _ in range(rand.randint(3, 10)):
+        time = rand.randint(2, 45)
+        step = rand.choice(_STEPS).format(
+            temp=rand.choice([325, 350, 375, 400, 425]),
+            amount=rand.choice(['1', '2', '1/2', '1/4', '1 1/2']),
+            size=rand.choice([8, 10, 12]), time=time,
+            time2=time + rand.randint(1, 10), hours=rand.randint(1, 4),
+            cm=rand.choice([20, 23, 25]))
+        lines.append('  - ' + step)
+    if rand.random() < 0.3:
+        lines.append('note: Keeps for {} [day] in the fridge.'.format(
+                     rand.randint(2, 5)))
+    return '\n'.join(lines) + '\n'
+
+def generate(path, num_chapters=10, num_recipes=100, seed=0):
+    """Writes a cookbook with num_recipes recipes in each chapter to path
+
+    Returns the path to the generated cookbook.yaml.
+    """
+    rand = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    cookbook_path = os.path.join(path, 'cookbook.yaml')
+    with open(cookbook_path, 'w') as f:
+        f.write('title: Synthetic Cookbook\nauthor: PyCook Benchmarks\n')
+
+    for c in range(num_chapters):
+        chapter_dir = os.path.join(path, 'chapter-' + _letters(c))
+        os.makedirs(chapter_dir, exist_ok=True)
+        with open(os.path.join(chapter_dir, 'index.yaml'), 'w') as f:
+            f.write('title: Chapter {}\n'.format(_letters(c).upper()))
+
+        for r in range(num_recipes):
+            # Recipe names go through the tokenizer so avoid digits
+            name = '{} {} {}'.format(rand.choice(_WORDS), rand.choice(_WORDS),
+                                     _letters(c * num_recipes + r).upper())
+            with open(os.path.join(chapter_dir, 'recipe-{}.yaml'.format(r)),
+                      'w') as f:
+                f.write(_recipe_yaml(rand, name))
+
+    return cookbook_path
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--chapters', type=int, default=10,
+                        help='Number of chapters')
+    parser.add_argument('-r', '--recipes', type=int, default=100,
+                        help='Number of recipes per chapter')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='Random seed')
+    parser.add_argument('output', help='Directory to write the cookbook to')
+    args = parser.parse_args()
+    generate(args.output, args.chapters, args.recipes, args.seed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+#
+# Measures tokenizer throughput on instruction-heavy text, comparing the
+# single-pass lexer against the old split-and-rematch tokenizer.
+#
+# Usage: python3 benchmarks/tokenizer.py [-n LINES] [-r REPEAT]
+
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from pycook import recipe, units
+
+class _SplitTokenizer(object):
+    """The tokenizer as it was before the single-pass lexer
+
+    The input is split on one big alternation and then every chunk is
+    matched against each class's regular expression again, which in turn
+    re-parses it with yet another regular expression.
+    """
+    def __init__(self, classes):
+        self.classes = classes
+        chunks = []
+        for c in classes:
+            chunks.append(r'(?:' + c.RE.pattern + ')')
+        self.re = re.compile('(' + '|'.join(chunks) + ')')
+
+    def _str_to_token(self, s):
+        for c in self.classes:
+            if c.RE.match(s):
+                return c.from_match(s)
+        return s
+
+    def tokenize(self, s):
+        return [self._str_to_token(c) for c in self.re.split(s) if c]
+
+_WORDS = ['mix', 'the', 'flour', 'and', 'sugar', 'in', 'a', 'large', 'bowl',
+          'until', 'combined', 'bake', 'for', 'about', 'or', 'golden']
+_QUANTITIES = ['1 [cup]', '1/2 [cup]', '2 [tbsp]', '1 1/2 [tsp]',
+               '350 [degF]', '175 [degC]', '20 [min]', '1-2 [hours]',
+               '9 [in]', '2.5 [cm]', '3', '1/4']
+
+def _gen_lines(num_lines, seed=0):
+    rand = random.Random(seed)
+    lines = []
+    for _ in range(num_lines):
+        words = []
+        for _ in range(rand.randint(8, 24)):
+            if rand.random() < 0.15:
+                words.append(rand.choice(_QUANTITIES))
+            else:
+                words.append(rand.choice(_WORDS))
+        line = ' '.join(words)
+        lines.append(line[0].upper() + line[1:] + '.')
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--lines', type=int, default=5000,
+                        help='Number of instruction lines to tokenize')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Number of timing runs (best is reported)')
+    args = parser.parse_args()
+
+    lines = _gen_lines(args.lines)
+    old = _SplitTokenizer([units.Quantity, units.Unit,
+                           recipe._NumberTokenizer])
+    new = recipe._TOKENIZER
+
+    # Make sure we're comparing like with like
+    for l in lines:
+        assert recipe._content_tuple(old.tokenize(l)) == \
+               recipe._content_tuple(new.tokenize(l))
+    num_tokens = sum(len(new.tokenize(l)) for l in lines)
+
+    results = {}
+    for name, tok in (('before', old), ('after', new)):
+        t = min(timeit.repeat(lambda: [tok.tokenize(l) for l in lines],
+                              number=1, repeat=args.repeat))
+        results[name] = num_tokens / t
+        print('{:>6}: {:12.0f} tokens/sec'.format(name, results[name]))
+
+    print('speedup: {:.2f}x'.format(results['after'] / results['before']))
+
+if __name__ == '__main__':
+    main()
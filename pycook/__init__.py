@@ -13,5 +13,22 @@
 # You should have received a copy of the GNU General Public License along with
 # PyCook.  If not, see <https://www.gnu.org/licenses/>.
 
-from .recipe import Recipe
-from .cookbook import Cookbook, Chapter
+import importlib as _importlib
+
+# The public classes are imported on first use so that scripts which only
+# need part of the package, such as pycook.units, don't pay for the rest.
+_LAZY_ATTRS = {
+    'Recipe': 'recipe',
+    'Cookbook': 'cookbook',
+    'Chapter': 'cookbook',
+}
+
+def __getattr__(name):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(
+                             __name__, name))
+    return getattr(_importlib.import_module('.' + module, __name__), name)
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRS))
@@ -0,0 +1,248 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Whole-cookbook scaling and unit conversion
+
+Rather than walking every Quantity and doing Fraction arithmetic on it one
+at a time, all of the quantities in a cookbook are gathered into a columnar
+QuantityTable of numerators, denominators and unit IDs.  Scaling is then a
+handful of passes over flat integer arrays and conversion happens once per
+distinct quantity before the results are scattered back into new recipes.
+"""
+
+from . import cookbook, recipe, units
+import array
+import decimal
+import fractions
+import math
+
+_NO_UNIT = -1
+
+# Row flags
+_SCALABLE = 0x1
+_DECIMAL = 0x2
+_RANGE_MIN = 0x4
+
+# These units measure time, heat or size.  Doubling a recipe doesn't make
+# the oven hotter or the pan bigger.
+_UNSCALABLE_DIMENSIONS = frozenset([
+    units.TIME,
+    units.TEMPERATURE,
+    units.LENGTH,
+])
+
+# Denominators we know how to print nicely; see units._VULGAR_FRACTIONSS
+_PRINTABLE_DENOMINATORS = frozenset([1, 2, 3, 4, 5, 6, 8])
+
+# Keep scaled numbers comfortably inside the 64-bit columns
+_MAX_DENOMINATOR = 1 << 20
+_MAX_INT64 = (1 << 63) - 1
+
+def _is_scalable(qty, in_ingredient_list):
+    if qty.unit is None:
+        # Bare numbers in the ingredient list are counts ("2 Eggs");
+        # elsewhere they may be anything ("step 2").
+        return in_ingredient_list
+    if qty.unit.dimension is None:
+        # Cans, cloves, etc.
+        return True
+    # Volumes and masses scale wherever they appear ("add half of the 2
+    # cups of stock")
+    return qty.unit.dimension not in _UNSCALABLE_DIMENSIONS
+
+class QuantityTable(object):
+    """All of the quantities in a set of recipes, stored by column
+
+    Each Quantity takes one row, or two for a Range.  refs records where
+    each Quantity came from so the table can be written back out.
+    """
+    def __init__(self):
+        self.numerators = array.array('q')
+        self.denominators = array.array('q')
+        self.unit_ids = array.array('h')
+        self.flags = array.array('B')
+        self.refs = []
+
+    def __len__(self):
+        return len(self.numerators)
+
+    def _add_number(self, n, unit_id, flags):
+        if isinstance(n, decimal.Decimal):
+            flags |= _DECIMAL
+        f = fractions.Fraction(n).limit_denominator(_MAX_DENOMINATOR)
+        self.numerators.append(f.numerator)
+        self.denominators.append(f.denominator)
+        self.unit_ids.append(unit_id)
+        self.flags.append(flags)
+
+    def add(self, qty, ref, scalable):
+        unit_id = _NO_UNIT if qty.unit is None else qty.unit.id
+        flags = _SCALABLE if scalable else 0
+        self.refs.append((len(self.numerators), ref))
+        if isinstance(qty.num, units.Range):
+            self._add_number(qty.num.min_num, unit_id, flags | _RANGE_MIN)
+            self._add_number(qty.num.max_num, unit_id, flags)
+        else:
+            self._add_number(qty.num, unit_id, flags)
+
+    def scale(self, factor):
+        """Multiplies every scalable row by factor in place"""
+        factor = fractions.Fraction(factor)
+        if factor <= 0:
+            raise Exception('Scale must be greater than zero, not {}'.format(
+                            factor))
+        factor = factor.limit_denominator(_MAX_DENOMINATOR)
+        if factor == 0:
+            raise Exception('Scale is too small')
+        p, q = factor.numerator, factor.denominator
+        nums = self.numerators
+        dens = self.denominators
+        flags = self.flags
+
+        new_nums = [n * p if f & _SCALABLE else n for n, f in zip(nums, flags)]
+        new_dens = [d * q if f & _SCALABLE else d for d, f in zip(dens, flags)]
+        gcds = list(map(math.gcd, new_nums, new_dens))
+        new_nums = list(map(int.__floordiv__, new_nums, gcds))
+        new_dens = list(map(int.__floordiv__, new_dens, gcds))
+
+        # Products of two large denominators need limiting again to fit
+        for i, (n, d) in enumerate(zip(new_nums, new_dens)):
+            if d > _MAX_DENOMINATOR or n > _MAX_INT64:
+                f = fractions.Fraction(n, d).limit_denominator(
+                    _MAX_DENOMINATOR)
+                if f.numerator > _MAX_INT64:
+                    raise Exception('Scaling by {} makes amounts too '
+                                    'large'.format(factor))
+                f = f or fractions.Fraction(1, _MAX_DENOMINATOR)
+                new_nums[i] = f.numerator
+                new_dens[i] = f.denominator
+
+        self.numerators = array.array('q', new_nums)
+        self.denominators = array.array('q', new_dens)
+
+    def _number(self, i):
+        n = fractions.Fraction(self.numerators[i], self.denominators[i])
+        if self.flags[i] & _DECIMAL:
+            if n.denominator == 1:
+                return int(n)
+            d = decimal.Decimal(n.numerator) / decimal.Decimal(n.denominator)
+            d = d.quantize(decimal.Decimal('0.01')).normalize()
+            # Quantities can't be zero so keep tiny amounts at the smallest
+            # one we print
+            return d if d != 0 else decimal.Decimal('0.01')
+        if n.denominator not in _PRINTABLE_DENOMINATORS:
+            n = fractions.Fraction(round(n * 8), 8) or fractions.Fraction(1, 8)
+        return int(n) if n.denominator == 1 else n
+
+    def _quantity(self, row):
+        unit_id = self.unit_ids[row]
+        unit = None if unit_id == _NO_UNIT else units.Unit.from_id(unit_id)
+        if self.flags[row] & _RANGE_MIN:
+            num = units.Range(units.intern_number(self._number(row)),
+                              units.intern_number(self._number(row + 1)))
+        else:
+            num = units.intern_number(self._number(row))
+        return units._intern_quantity(num, unit)
+
+    def quantities(self):
+        """Yields (ref, Quantity) for each Quantity in the table"""
+        # Most rows are repeats of a few distinct quantities so only build
+        # each distinct one once.
+        nums = self.numerators
+        dens = self.denominators
+        unit_ids = self.unit_ids
+        flags = self.flags
+        built = {}
+        for row, ref in self.refs:
+            key = (nums[row], dens[row], unit_ids[row], flags[row])
+            if flags[row] & _RANGE_MIN:
+                key += (nums[row + 1], dens[row + 1])
+            qty = built.get(key)
+            if qty is None:
+                qty = built[key] = self._quantity(row)
+            yield ref, qty
+
+def _collect_tokens(table, tokens, ref, in_ingredient_list=False):
+    for i, t in enumerate(tokens):
+        if isinstance(t, units.Quantity):
+            table.add(t, ref + (i,), _is_scalable(t, in_ingredient_list))
+
+def collect(recipes):
+    """Builds a QuantityTable from a list of recipes
+
+    Recipe names are left out; we don't want to turn "Pancakes for 2" into
+    "Pancakes for 4".
+    """
+    table = QuantityTable()
+    for r_idx, r in enumerate(recipes):
+        for i, ingredient in enumerate(r.ingredients):
+            if ingredient.qty is not None:
+                table.add(ingredient.qty, (r_idx, 'ingredients', i),
+                          _is_scalable(ingredient.qty, True))
+        for i, step in enumerate(r.instructions):
+            _collect_tokens(table, step, (r_idx, 'instructions', i))
+        if r.note:
+            _collect_tokens(table, r.note, (r_idx, 'note'))
+    return table
+
+def _copy_recipe(r):
+    new = recipe.Recipe()
+    new.name = r.name
+    new.from_name = r.from_name
+    new.from_url = r.from_url
+    new.ingredients = list(r.ingredients)
+    new.instructions = [list(step) for step in r.instructions]
+    new.note = list(r.note) if r.note else r.note
+    return new
+
+def apply(recipes, table, system=None):
+    """Returns new recipes with the quantities from table
+
+    If system is given, every quantity is also converted to that system.
+    """
+    new_recipes = [_copy_recipe(r) for r in recipes]
+    for ref, qty in table.quantities():
+        if system is not None:
+            qty = units.convert(qty, system)
+
+        r = new_recipes[ref[0]]
+        if ref[1] == 'ingredients':
+            old = r.ingredients[ref[2]]
+            r.ingredients[ref[2]] = recipe.Ingredient(old.name, qty)
+        elif ref[1] == 'instructions':
+            r.instructions[ref[2]][ref[3]] = qty
+        else:
+            assert ref[1] == 'note'
+            r.note[ref[2]] = qty
+    return new_recipes
+
+def transform_cookbook(cb, scale=None, system=None):
+    """Returns a scaled and/or unit-converted copy of a cookbook
+
+    scale is anything fractions.Fraction() accepts, such as 2, '1/2' or
+    '1.5'.  system is units.ENGLISH or units.METRIC.
+    """
+    recipes = [r for c in cb.chapters for r in c.recipes]
+    table = collect(recipes)
+    if scale is not None:
+        table.scale(scale)
+    new_recipes = iter(apply(recipes, table, system))
+
+    chapters = []
+    for c in cb.chapters:
+        chapter_recipes = [next(new_recipes) for _ in c.recipes]
+        chapters.append(cookbook.Chapter(c.title, c.description,
+                                         chapter_recipes))
+    return cookbook.Cookbook(cb.title, cb.author, chapters)
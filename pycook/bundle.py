@@ -0,0 +1,435 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+#
+# A cookbook bundle is a whole, already parsed cookbook in a single binary
+# file which can be memory-mapped and read without any YAML parsing or
+# tokenizing.  The file is a short header followed by a number of sections,
+# each of which is either UTF-8 text or an array of little-endian 32-bit
+# unsigned integers:
+#
+#   STRING_DATA     Every distinct string, concatenated
+#   STRING_OFFSETS  Where string i starts and ends: offsets[i], offsets[i + 1]
+#   UNITS           The string ID of each unit's name
+#   NUMBERS         (kind, a, b) for each number; see the _NUM_* kinds
+#   QUANTITIES      (number ID, unit index or NONE) for each quantity
+#   TOKENS          Tagged token references; see the _TAG_* tags
+#   INGREDIENTS     (name string ID, quantity ID or NONE)
+#   INSTRUCTIONS    (first token, end token) for each instruction
+#   RECIPES         _RECIPE_FIELDS integers per recipe, in chapter order
+#   CHAPTERS        (title, description, first recipe, end recipe)
+#   COOKBOOK        (title, author)
+#
+# Units are stored by name rather than by units.Unit.id so a bundle stays
+# valid if units are added or reordered.
+#
+
+from . import recipe, tokenizer, units
+import array
+import collections.abc
+import decimal
+import fractions
+import functools
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+MAGIC = b'PYCOOKB\0'
+VERSION = 1
+
+NONE = 0xffffffff
+
+(_STRING_DATA, _STRING_OFFSETS, _UNITS, _NUMBERS, _QUANTITIES, _TOKENS,
+ _INGREDIENTS, _INSTRUCTIONS, _RECIPES, _CHAPTERS, _COOKBOOK) = range(11)
+_NUM_SECTIONS = 11
+
+_HEADER = struct.Struct('<8sII')
+_SECTION = struct.Struct('<II')
+
+_TAG_TEXT = 0
+_TAG_NUMBER = 1
+_TAG_QUANTITY = 2
+_TAG_UNIT = 3
+
+_NUM_INT = 0
+_NUM_FRACTION = 1
+_NUM_DECIMAL = 2
+_NUM_RANGE = 3
+
+# name start, name end, from, url, first ingredient, end ingredient,
+# first instruction, end instruction, note start, note end
+_RECIPE_FIELDS = 10
+
+def is_bundle(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+class _Writer(object):
+    def __init__(self):
+        self._strings = {}
+        self._units = {}
+        self._numbers = {}
+        self._quantities = {}
+        self.sections = [array.array('I') for _ in range(_NUM_SECTIONS)]
+        self.sections[_STRING_DATA] = bytearray()
+        self.sections[_STRING_OFFSETS].append(0)
+
+    def string(self, s):
+        if s is None:
+            return NONE
+        s = str(s)
+        i = self._strings.get(s)
+        if i is None:
+            i = len(self._strings)
+            self._strings[s] = i
+            data = self.sections[_STRING_DATA]
+            data += s.encode('utf-8')
+            self.sections[_STRING_OFFSETS].append(len(data))
+        return i
+
+    def unit(self, unit):
+        if unit is None:
+            return NONE
+        i = self._units.get(unit.name)
+        if i is None:
+            i = len(self._units)
+            self._units[unit.name] = i
+            self.sections[_UNITS].append(self.string(unit.name))
+        return i
+
+    def number(self, n):
+        key = units._number_key(n)
+        i = self._numbers.get(key)
+        if i is None:
+            if isinstance(n, units.Range):
+                entry = (_NUM_RANGE, self.number(n.min_num),
+                         self.number(n.max_num))
+            elif isinstance(n, fractions.Fraction):
+                entry = (_NUM_FRACTION, self.string(n), 0)
+            elif isinstance(n, decimal.Decimal):
+                entry = (_NUM_DECIMAL, self.string(n), 0)
+            elif isinstance(n, int):
+                entry = (_NUM_INT, self.string(n), 0)
+            else:
+                assert False, 'Not a number type'
+            i = len(self._numbers)
+            self._numbers[key] = i
+            self.sections[_NUMBERS].extend(entry)
+        return i
+
+    def quantity(self, q):
+        if q is None:
+            return NONE
+        key = (q.unit, units._number_key(q.num))
+        i = self._quantities.get(key)
+        if i is None:
+            i = len(self._quantities)
+            self._quantities[key] = i
+            self.sections[_QUANTITIES].extend((self.number(q.num),
+                                               self.unit(q.unit)))
+        return i
+
+    def tokens(self, t):
+        """Appends a list of tokens and returns its (start, end)"""
+        if t is None:
+            return NONE, NONE
+        out = self.sections[_TOKENS]
+        start = len(out)
+        for tok in t:
+            if isinstance(tok, str):
+                out.append(self.string(tok) << 2 | _TAG_TEXT)
+            elif isinstance(tok, units.Quantity):
+                out.append(self.quantity(tok) << 2 | _TAG_QUANTITY)
+            elif isinstance(tok, units.Unit):
+                out.append(self.unit(tok) << 2 | _TAG_UNIT)
+            else:
+                out.append(self.number(tok) << 2 | _TAG_NUMBER)
+        return start, len(out)
+
+    def recipe(self, r):
+        ingredients = self.sections[_INGREDIENTS]
+        ing_start = len(ingredients) // 2
+        for i in r.ingredients:
+            ingredients.extend((self.string(i.name), self.quantity(i.qty)))
+
+        instructions = self.sections[_INSTRUCTIONS]
+        instr_start = len(instructions) // 2
+        for i in r.instructions:
+            instructions.extend(self.tokens(i))
+
+        self.sections[_RECIPES].extend(self.tokens(r.name) + (
+            self.string(r.from_name),
+            self.string(r.from_url),
+            ing_start, len(ingredients) // 2,
+            instr_start, len(instructions) // 2,
+        ) + self.tokens(r.note))
+
+    def to_bytes(self):
+        sections = []
+        for s in self.sections:
+            if isinstance(s, array.array):
+                if sys.byteorder != 'little':
+                    s = array.array('I', s)
+                    s.byteswap()
+                s = s.tobytes()
+            sections.append(bytes(s))
+
+        header_size = _HEADER.size + _SECTION.size * _NUM_SECTIONS
+        table = []
+        offset = header_size
+        for s in sections:
+            # Keep every section 4-byte aligned so it can be cast in place
+            offset = (offset + 3) & ~3
+            table.append(_SECTION.pack(offset, len(s)))
+            offset += len(s)
+
+        out = bytearray(_HEADER.pack(MAGIC, VERSION, _NUM_SECTIONS))
+        for entry in table:
+            out += entry
+        for s in sections:
+            out += b'\0' * (-len(out) & 3)
+            out += s
+        return bytes(out)
+
+def _release(r):
+    release = getattr(r, 'release', None)
+    if release is not None:
+        release()
+
+def write(cb, path):
+    """Writes the cookbook cb to path as a bundle
+
+    The file is replaced atomically so readers which already have the old
+    bundle mapped keep seeing the old contents.
+    """
+    w = _Writer()
+    for c in cb.chapters:
+        first = len(w.sections[_RECIPES]) // _RECIPE_FIELDS
+        for r in c.recipes:
+            w.recipe(r)
+            _release(r)
+        end = len(w.sections[_RECIPES]) // _RECIPE_FIELDS
+        w.sections[_CHAPTERS].extend((w.string(c.title),
+                                      w.string(c.description), first, end))
+    w.sections[_COOKBOOK].extend((w.string(cb.title), w.string(cb.author)))
+    data = w.to_bytes()
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               prefix='.bundle-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+
+class _RecipeList(collections.abc.Sequence):
+    """The recipes of one chapter, created as they are first looked at"""
+    def __init__(self, bundle, start, end):
+        self._bundle = bundle
+        self._start = start
+        self._recipes = [None] * (end - start)
+
+    def __len__(self):
+        return len(self._recipes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        r = self._recipes[i]
+        if r is None:
+            if i < 0:
+                i += len(self)
+            r = self._bundle.lazy_recipe(self._start + i)
+            self._recipes[i] = r
+        return r
+
+class Bundle(object):
+    """A memory-mapped cookbook bundle
+
+    Nothing is decoded until it is asked for, and strings, numbers and
+    quantities are only decoded once.  Since the file is mapped read-only,
+    processes reading the same bundle share its pages.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._map) < _HEADER.size:
+            raise Exception('{} is not a cookbook bundle'.format(path))
+        magic, version, num_sections = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise Exception('{} is not a cookbook bundle'.format(path))
+        if version != VERSION or num_sections != _NUM_SECTIONS:
+            raise Exception('{} is a version {} cookbook bundle; '
+                            'this is version {}'.format(path, version,
+                                                        VERSION))
+
+        self._sections = []
+        for i in range(num_sections):
+            offset, size = _SECTION.unpack_from(
+                self._map, _HEADER.size + i * _SECTION.size)
+            if offset + size > len(self._map):
+                raise Exception('{} is truncated'.format(path))
+            self._sections.append((offset, size))
+
+        self._string_data = self._bytes(_STRING_DATA)
+        self._string_offsets = self._u32(_STRING_OFFSETS)
+        self._tokens = self._u32(_TOKENS)
+        self._numbers = self._u32(_NUMBERS)
+        self._quantities = self._u32(_QUANTITIES)
+        self._ingredients = self._u32(_INGREDIENTS)
+        self._instructions = self._u32(_INSTRUCTIONS)
+        self._recipes = self._u32(_RECIPES)
+        self._chapters = self._u32(_CHAPTERS)
+
+        self._string_cache = [None] * (len(self._string_offsets) - 1)
+        self._number_cache = [None] * (len(self._numbers) // 3)
+        self._quantity_cache = [None] * (len(self._quantities) // 2)
+        self._token_cache = {}
+        self._units = [units.Unit.from_name(self.string(i))
+                       for i in self._u32(_UNITS)]
+
+        self.num_recipes = len(self._recipes) // _RECIPE_FIELDS
+
+    def _bytes(self, section):
+        offset, size = self._sections[section]
+        return memoryview(self._map)[offset:offset + size]
+
+    def _u32(self, section):
+        data = self._bytes(section)
+        if sys.byteorder == 'little':
+            return data.cast('I')
+        a = array.array('I', data)
+        a.byteswap()
+        return a
+
+    def string(self, i):
+        if i == NONE:
+            return None
+        s = self._string_cache[i]
+        if s is None:
+            start, end = self._string_offsets[i], self._string_offsets[i + 1]
+            s = tokenizer.intern_text(
+                str(self._string_data[start:end], 'utf-8'))
+            self._string_cache[i] = s
+        return s
+
+    def number(self, i):
+        n = self._number_cache[i]
+        if n is None:
+            kind, a, b = self._numbers[i * 3:i * 3 + 3]
+            if kind == _NUM_RANGE:
+                n = units.Range(self.number(a), self.number(b))
+            elif kind == _NUM_FRACTION:
+                n = fractions.Fraction(self.string(a))
+            elif kind == _NUM_DECIMAL:
+                n = decimal.Decimal(self.string(a))
+            elif kind == _NUM_INT:
+                n = int(self.string(a))
+            else:
+                raise Exception('Invalid number in cookbook bundle')
+            n = units.intern_number(n)
+            self._number_cache[i] = n
+        return n
+
+    def quantity(self, i):
+        if i == NONE:
+            return None
+        q = self._quantity_cache[i]
+        if q is None:
+            num, unit = self._quantities[i * 2:i * 2 + 2]
+            q = units._intern_quantity(self.number(num),
+                                       None if unit == NONE
+                                       else self._units[unit])
+            self._quantity_cache[i] = q
+        return q
+
+    def _token(self, tok):
+        tag = tok & 3
+        i = tok >> 2
+        if tag == _TAG_TEXT:
+            return self.string(i)
+        elif tag == _TAG_QUANTITY:
+            return self.quantity(i)
+        elif tag == _TAG_UNIT:
+            return self._units[i]
+        else:
+            return self.number(i)
+
+    def tokens(self, start, end):
+        if start == NONE:
+            return None
+        toks = self._tokens[start:end]
+        cache = self._token_cache
+        try:
+            return [cache[tok] for tok in toks]
+        except KeyError:
+            for tok in toks:
+                if tok not in cache:
+                    cache[tok] = self._token(tok)
+            return [cache[tok] for tok in toks]
+
+    def _recipe_fields(self, i):
+        return self._recipes[i * _RECIPE_FIELDS:(i + 1) * _RECIPE_FIELDS]
+
+    def recipe_name(self, i):
+        fields = self._recipe_fields(i)
+        return self.tokens(fields[0], fields[1])
+
+    def recipe(self, i):
+        (name_start, name_end, from_name, from_url, ing_start, ing_end,
+         instr_start, instr_end, note_start, note_end) = self._recipe_fields(i)
+
+        r = recipe.Recipe()
+        r.name = self.tokens(name_start, name_end)
+        r.from_name = self.string(from_name)
+        r.from_url = self.string(from_url)
+        ingredients = self._ingredients[ing_start * 2:ing_end * 2]
+        r.ingredients = [recipe.Ingredient(self.string(name),
+                                           self.quantity(qty))
+                         for name, qty in zip(ingredients[0::2],
+                                              ingredients[1::2])]
+        instructions = self._instructions[instr_start * 2:instr_end * 2]
+        r.instructions = [self.tokens(start, end)
+                          for start, end in zip(instructions[0::2],
+                                                instructions[1::2])]
+        r.note = self.tokens(note_start, note_end)
+        return r
+
+    def lazy_recipe(self, i):
+        return recipe.LazyRecipe(functools.partial(self.recipe, i),
+                                 self.recipe_name(i))
+
+    def to_cookbook(self):
+        from .cookbook import Chapter, Cookbook
+
+        chapters = []
+        for i in range(0, len(self._chapters), 4):
+            title, description, start, end = self._chapters[i:i + 4]
+            chapters.append(Chapter(self.string(title),
+                                    self.string(description),
+                                    _RecipeList(self, start, end)))
+        title, author = self._u32(_COOKBOOK)
+        return Cookbook(self.string(title), self.string(author), chapters)
+
+def load(path):
+    return Bundle(path).to_cookbook()
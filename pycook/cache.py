@@ -0,0 +1,226 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+from . import recipe, units
+import hashlib
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+# Bump this whenever the pickled representation of recipes changes
+CACHE_VERSION = 2
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+def default_cache_dir(cookbook_path):
+    return os.path.join(os.path.dirname(os.path.abspath(cookbook_path)),
+                        '.pycook-cache')
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _units_stamp():
+    h = hashlib.sha256()
+    h.update(str(CACHE_VERSION).encode())
+    h.update(str(pickle.HIGHEST_PROTOCOL).encode())
+    for name, u in sorted(units.Unit._name_to_unit.items()):
+        h.update(repr((name, u.name, u.text, u.plural,
+                       u.is_english, u.is_metric,
+                       u.dimension, u.factor)).encode())
+    return h.hexdigest()[:16]
+
+_TMP_PREFIX = '.tmp-'
+_TMP_MAX_AGE = 60 * 60
+
+def _unlink_quietly(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+class Cache(object):
+    """A content-addressed on-disk store of pickled objects
+
+    Entries live in <path>/<name>-<version>/ so that changing the version
+    stamp orphans every old entry; those are removed by prune().  Writes go
+    through a temporary file and os.replace() so concurrent builds sharing a
+    cache never see a partially written entry.
+    """
+    def __init__(self, path, name, version, max_size=DEFAULT_MAX_SIZE):
+        self.root = path
+        self.name = name
+        if path is None:
+            self.path = None
+        else:
+            self.path = os.path.join(path, name + '-' + version)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        if self.path is None:
+            self.misses += 1
+            return None
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                obj = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            # Treat anything we can't unpickle as a miss; the entry will
+            # get overwritten by the next put().
+            self.misses += 1
+            return None
+
+        # Bump the mtime so that prune() evicts least-recently-used entries
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return obj
+
+    def put(self, key, obj):
+        """Stores obj under key
+
+        The cache only saves time so if the entry can't be written, say
+        because the disk is full or read-only, it is quietly skipped.
+        """
+        if self.path is None:
+            return
+
+        entry_path = self._entry_path(key)
+        entry_dir = os.path.dirname(entry_path)
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix=_TMP_PREFIX)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry_path)
+        except OSError:
+            _unlink_quietly(tmp_path)
+        except:
+            _unlink_quietly(tmp_path)
+            raise
+
+    def prune(self):
+        if self.path is None:
+            return
+
+        # Throw away anything left behind by other versions of this cache
+        prefix = self.name + '-'
+        try:
+            with os.scandir(self.root) as it:
+                for d in it:
+                    if d.name.startswith(prefix) and d.path != self.path and \
+                       d.is_dir():
+                        shutil.rmtree(d.path, ignore_errors=True)
+        except FileNotFoundError:
+            return
+
+        entries = []
+        total_size = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            for fname in filenames:
+                fpath = os.path.join(dirpath, fname)
+                try:
+                    st = os.stat(fpath)
+                except FileNotFoundError:
+                    continue
+                # Leave other processes' writes in progress alone, but not
+                # ones abandoned long ago
+                if fname.startswith(_TMP_PREFIX) and \
+                   time.time() - st.st_mtime < _TMP_MAX_AGE:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fpath))
+                total_size += st.st_size
+
+        if total_size <= self.max_size:
+            return
+
+        entries.sort()
+        for _, size, fpath in entries:
+            try:
+                os.unlink(fpath)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            if total_size <= self.max_size:
+                break
+
+class RecipeCache(Cache):
+    """Cache of parsed recipes
+
+    On top of the on-disk store, recipes are remembered in memory keyed on
+    their path, mtime and size.  Long-running processes which load the same
+    cookbook repeatedly (such as watch mode) only re-read files which have
+    changed.  If path is None, only the in-memory layer is used.
+    """
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        super().__init__(path, 'recipes', _units_stamp(), max_size)
+        self._memo = {}
+
+    def __getstate__(self):
+        # The memo is only useful to the process that owns it; don't ship
+        # it off to worker processes.
+        state = self.__dict__.copy()
+        state['_memo'] = {}
+        return state
+
+    def memoized(self, path):
+        """Returns a (recipe, stamp) pair for path
+
+        The recipe is None if the file is not in the memo or has changed
+        since it was memoized.  The stamp should be passed back to
+        memoize() once the recipe has been loaded.
+        """
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        entry = self._memo.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1], stamp
+        return None, stamp
+
+    def memoize(self, path, stamp, r):
+        self._memo[path] = (stamp, r)
+
+    def load_recipe(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        key = hash_bytes(data)
+
+        r = self.get(key)
+        if r is None:
+            r = recipe.Recipe.load(io.BytesIO(data))
+            self.put(key, r)
+        return r
+
+class FragmentCache(Cache):
+    """Caches rendered output fragments such as per-recipe LaTeX"""
+    def __init__(self, path, name, max_size=DEFAULT_MAX_SIZE):
+        super().__init__(path, name, _units_stamp(), max_size)
@@ -0,0 +1,298 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+from . import cache, recipe, units, yaml_util
+import os
+import pickle
+import tempfile
+
+# Bump this whenever the checks change so files which passed are re-checked
+CHECK_VERSION = 1
+
+_STR_TAG = 'tag:yaml.org,2002:str'
+
+_REQUIRED_SECTIONS = {
+    'cookbook': ['title', 'author'],
+    'chapter': ['title'],
+    'recipe': recipe.Recipe._REQUIRED_SECTIONS,
+}
+
+class Problem(object):
+    def __init__(self, path, mark, message):
+        self.path = path
+        # YAML marks count from zero but editors count from one
+        self.line = mark.line + 1 if mark is not None else None
+        self.column = mark.column + 1 if mark is not None else None
+        self.message = message
+
+    def sort_key(self):
+        return (self.path, self.line or 0, self.column or 0)
+
+    def __str__(self):
+        if self.line is None:
+            return '{}: {}'.format(self.path, self.message)
+        return '{}:{}:{}: {}'.format(self.path, self.line, self.column,
+                                     self.message)
+
+class _Mark(object):
+    def __init__(self, line, column):
+        self.line = line
+        self.column = column
+
+def _unit_problems(path, node):
+    problems = []
+    for m in units.Unit._RE.finditer(node.value):
+        if m.group('unit') in units.Unit._name_to_unit:
+            continue
+        mark = node.start_mark
+        # Only plain one-line scalars map directly onto the file
+        if not node.style and node.end_mark.line == mark.line:
+            mark = _Mark(mark.line, mark.column + m.start())
+        problems.append(Problem(path, mark,
+                                'Unknown unit "{}"'.format(m.group(0))))
+    return problems
+
+def _check_text(path, node, parse, problems, any_scalar=False):
+    import yaml
+
+    if not isinstance(node, yaml.ScalarNode) or \
+       (node.tag != _STR_TAG and not any_scalar):
+        problems.append(Problem(path, node.start_mark, 'Expected text'))
+        return
+
+    unit_problems = _unit_problems(path, node)
+    if unit_problems:
+        problems += unit_problems
+        return
+
+    try:
+        parse(node.value)
+    except Exception as e:
+        problems.append(Problem(path, node.start_mark,
+                                str(e) or type(e).__name__))
+
+def _check_list(path, node, parse, problems):
+    import yaml
+
+    if not isinstance(node, yaml.SequenceNode):
+        problems.append(Problem(path, node.start_mark, 'Expected a list'))
+        return
+    for item in node.value:
+        _check_text(path, item, parse, problems)
+
+def _check_recipe(path, sections, problems):
+    import yaml
+
+    for name, (key, value) in sections.items():
+        if name not in recipe.Recipe._SECTIONS:
+            problems.append(Problem(path, key.start_mark,
+                                    'Invalid section "{}"'.format(name)))
+        elif name == 'ingredients':
+            _check_list(path, value, recipe.Ingredient.parse, problems)
+        elif name == 'instructions':
+            _check_list(path, value, recipe._tokenize_str, problems)
+        elif name == 'note':
+            _check_text(path, value, recipe._tokenize_str, problems)
+        elif name == 'name':
+            # Names are passed through str() first so numbers are fine too
+            _check_text(path, value, recipe._tokenize_str, problems,
+                        any_scalar=True)
+        elif not isinstance(value, yaml.ScalarNode):
+            problems.append(Problem(path, value.start_mark, 'Expected text'))
+
+def check_file(path, kind, data):
+    """Checks the contents of a YAML file from a cookbook
+
+    kind is "cookbook", "chapter" or "recipe".  Returns a list of Problems,
+    which is empty if the file is fine.
+    """
+    import yaml
+
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        return [Problem(path, None, 'Not valid UTF-8: ' + str(e))]
+
+    try:
+        node = yaml_util.compose_yaml(text)
+    except yaml.MarkedYAMLError as e:
+        return [Problem(path, e.problem_mark or e.context_mark,
+                        e.problem or str(e))]
+    except yaml.YAMLError as e:
+        return [Problem(path, None, str(e))]
+
+    if not isinstance(node, yaml.MappingNode):
+        return [Problem(path, node.start_mark if node is not None else None,
+                        'Expected a mapping of sections')]
+
+    problems = []
+    sections = {}
+    for key, value in node.value:
+        name = key.value
+        if name in sections:
+            problems.append(Problem(path, key.start_mark,
+                                    'Duplicate section "{}"'.format(name)))
+        sections[name] = (key, value)
+
+    for name in _REQUIRED_SECTIONS[kind]:
+        if name not in sections:
+            problems.append(Problem(path, node.start_mark,
+                                    'Missing section "{}"'.format(name)))
+
+    if kind == 'recipe':
+        _check_recipe(path, sections, problems)
+
+    return problems
+
+def _check_files(files):
+    return [check_file(path, kind, data) for path, kind, data in files]
+
+def find_files(cb_dir):
+    """Returns (path, kind) for the chapter and recipe files in cb_dir
+
+    This finds the same files Cookbook.load() reads but, unlike it, doesn't
+    parse any of them.
+    """
+    files = []
+    with os.scandir(cb_dir) as cit:
+        for c in sorted(cit, key=lambda c: c.name):
+            index_path = os.path.join(c.path, 'index.yaml')
+            if not c.is_dir() or not os.path.exists(index_path):
+                continue
+            files.append((index_path, 'chapter'))
+            with os.scandir(c.path) as rit:
+                for r in sorted(rit, key=lambda r: r.name):
+                    if r.name.endswith('.yaml') and r.name != 'index.yaml':
+                        files.append((r.path, 'recipe'))
+    return files
+
+class PassCache(object):
+    """The content hashes of files which passed every check
+
+    The whole set is kept in one file since it is consulted for every file
+    in the cookbook.  It is only valid for one version of the checks and
+    one set of units.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.version = (CHECK_VERSION, cache._units_stamp())
+        self.passed = set()
+        if path is None:
+            return
+        try:
+            with open(path, 'rb') as f:
+                version, passed = pickle.load(f)
+        except Exception:
+            return
+        if version == self.version:
+            self.passed = passed
+
+    def save(self, passed):
+        if self.path is None or passed == self.passed:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path),
+                                        prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((self.version, passed), f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.passed = passed
+
+def pass_cache_path(cache_dir):
+    return os.path.join(cache_dir, 'check-passed')
+
+class CheckResult(object):
+    def __init__(self):
+        self.problems = []
+        self.checked = 0
+        self.unchanged = 0
+
+def check_cookbook(path, jobs=1, pass_cache=None, only=None):
+    """Checks a cookbook.yaml and every chapter and recipe it contains
+
+    Files whose contents passed before, according to pass_cache, are
+    skipped; the rest are checked using jobs processes.  If only is given,
+    just the files it names are checked.
+    """
+    if pass_cache is None:
+        pass_cache = PassCache()
+    if jobs is None or jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    result = CheckResult()
+    with open(path, 'rb') as f:
+        data = f.read()
+    result.problems = check_file(path, 'cookbook', data)
+    result.checked = 1
+    if result.problems:
+        return result
+
+    config = yaml_util.read_yaml_file(path)
+    cb_dir = config.get('path', os.path.dirname(os.path.abspath(path)))
+    files = find_files(cb_dir)
+    if only is not None:
+        only = set(os.path.realpath(p) for p in only)
+        files = [f for f in files if os.path.realpath(f[0]) in only]
+
+    passed = set()
+    todo = []
+    todo_hashes = []
+    for file_path, kind in files:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        # The same contents can be fine as a recipe but not as a chapter
+        h = cache.hash_bytes(kind.encode() + b'\0' + data)
+        if h in pass_cache.passed:
+            passed.add(h)
+            result.unchanged += 1
+        else:
+            todo.append((file_path, kind, data))
+            todo_hashes.append(h)
+
+    if jobs == 1 or len(todo) <= 1:
+        checked = _check_files(todo)
+    else:
+        import concurrent.futures
+
+        # Checking one file is quick, so hand them out in batches
+        chunksize = max(1, len(todo) // (jobs * 4))
+        chunks = [todo[i:i + chunksize]
+                  for i in range(0, len(todo), chunksize)]
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            checked = [p for c in executor.map(_check_files, chunks)
+                       for p in c]
+
+    for h, problems in zip(todo_hashes, checked):
+        if problems:
+            result.problems += problems
+        else:
+            passed.add(h)
+    result.checked += len(todo)
+    result.problems.sort(key=Problem.sort_key)
+
+    # When only some files were looked at, remember the others too
+    if only is not None:
+        passed |= pass_cache.passed
+    pass_cache.save(passed)
+
+    return result
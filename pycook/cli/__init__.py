@@ -16,14 +16,35 @@
 # PyCook.  If not, see <https://www.gnu.org/licenses/>.
 
 import argparse as _argparse
+from . import build as _build
+from . import bundle as _bundle
+from . import check as _check
 from . import pdf as _pdf
 from . import html as _html
+from . import pantry as _pantry
+from . import search as _search
+from . import shop as _shop
+from . import watch as _watch
 
 def run():
     parser = _argparse.ArgumentParser()
     subparsers = parser.add_subparsers()
     _pdf.setup_subparser(subparsers.add_parser('pdf', help='PDF help'))
     _html.setup_subparser(subparsers.add_parser('html', help='HTML help'))
+    _build.setup_subparser(subparsers.add_parser('build',
+        help='Build every target listed in cookbook.yaml at once'))
+    _bundle.setup_subparser(subparsers.add_parser('bundle',
+        help='Write a cookbook as a single binary file for fast loading'))
+    _check.setup_subparser(subparsers.add_parser('check',
+        help='Check every recipe in a cookbook for mistakes'))
+    _pantry.setup_subparser(subparsers.add_parser('pantry',
+        help='Find recipes by ingredient'))
+    _search.setup_subparser(subparsers.add_parser('search',
+        help='Search the recipes in a cookbook'))
+    _shop.setup_subparser(subparsers.add_parser('shop',
+        help='Make a shopping list for a set of recipes'))
+    _watch.setup_subparser(subparsers.add_parser('watch',
+        help='Rebuild a PDF or HTML cookbook whenever its sources change'))
     args = parser.parse_args()
     try:
         args.func(args)
@@ -0,0 +1,157 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+# Only what building the argument parser needs is imported up front.  The
+# rest of pycook is imported by the functions which use it so that --help
+# and the lighter subcommands start quickly.
+from .. import timing, units
+import argparse
+import fractions
+import sys
+
+def _scale_factor(s):
+    try:
+        factor = fractions.Fraction(s)
+    except (ValueError, ZeroDivisionError):
+        raise argparse.ArgumentTypeError('invalid scale "{}"'.format(s))
+    if factor <= 0:
+        raise argparse.ArgumentTypeError(
+            'scale must be greater than zero, not {}'.format(s))
+    return factor
+
+def add_cache_arguments(subparser, no_cache_help='Do not read or write '
+                                                'cached build data'):
+    subparser.add_argument('--cache-dir',
+                           help='Directory for cached build data '
+                                '(default: .pycook-cache next to the input)')
+    subparser.add_argument('--no-cache', action='store_const',
+                           const=True, default=False, help=no_cache_help)
+
+def add_load_arguments(subparser):
+    subparser.add_argument('-j', '--jobs', type=int, default=1,
+                           help='Number of parallel jobs '
+                                '(0 for one per CPU)')
+    add_cache_arguments(subparser)
+    subparser.add_argument('--scale', type=_scale_factor,
+                           help='Scale every recipe by this factor '
+                                '(e.g. 2, 1/2 or 1.5)')
+    subparser.add_argument('--units', choices=[units.ENGLISH, units.METRIC],
+                           help='Convert all quantities to this system')
+    subparser.add_argument('--rev', metavar='REV',
+                           help='Read the cookbook from this git revision '
+                                'instead of the working tree')
+
+def cache_dir(args):
+    from .. import cache
+    if args.cache_dir:
+        return args.cache_dir
+    return cache.default_cache_dir(args.input)
+
+def report_skipped_recipes(errors):
+    for path, e in errors:
+        print('Skipping {}: {}'.format(path, str(e) or type(e).__name__),
+              file=sys.stderr)
+
+def recipe_cache(args):
+    if args.no_cache:
+        return None
+    from .. import cache
+    return cache.RecipeCache(cache_dir(args))
+
+def fragment_cache(args, name):
+    if args.no_cache:
+        return None
+    from .. import cache
+    return cache.FragmentCache(cache_dir(args), name)
+
+def add_template_arguments(subparser):
+    subparser.add_argument('--templates', metavar='DIR',
+                           help='Directory of .mako files to use in place of '
+                                'the built-in templates of the same name '
+                                '(e.g. latex-recipe.mako)')
+
+def apply_template_arguments(args):
+    if args.templates:
+        from .. import templates
+        templates.set_override_dir(args.templates)
+
+def add_timing_arguments(subparser):
+    subparser.add_argument('--timings', action='store_const',
+                           const=True, default=False,
+                           help='Print how long each build phase took')
+    subparser.add_argument('--timings-json', metavar='FILE',
+                           help='Write build phase timings to FILE as JSON')
+    subparser.add_argument('--trace-memory', action='store_const',
+                           const=True, default=False,
+                           help='Also measure the peak Python heap use of '
+                                'each phase with tracemalloc (slow); '
+                                'implies --timings')
+    subparser.add_argument('--profile', metavar='FILE',
+                           help='Run the build under cProfile and write the '
+                                'profile to FILE')
+
+def make_timings(args):
+    if not args.timings and not args.timings_json and not args.trace_memory:
+        return None
+    return timing.Timings(trace_memory=args.trace_memory)
+
+def report_timings(args, timings):
+    if timings is None:
+        return
+    if args.timings or args.trace_memory:
+        print(timings.to_str(), file=sys.stderr)
+    if args.timings_json:
+        with open(args.timings_json, 'w') as f:
+            f.write(timings.to_json() + '\n')
+
+def run_instrumented(args, func):
+    """Calls func(timings) honoring --timings, --timings-json and --profile
+
+    timings is None if no timings were asked for.
+    """
+    timings = make_timings(args)
+    if args.profile:
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.runcall(func, timings)
+        finally:
+            profile.dump_stats(args.profile)
+    else:
+        func(timings)
+    report_timings(args, timings)
+
+def load_cookbook(args, cache=None, timings=None):
+    from .. import batch, bundle
+    from ..cookbook import Cookbook
+
+    if timings is None:
+        timings = timing.NULL_TIMINGS
+    if bundle.is_bundle(args.input):
+        if args.rev is not None:
+            raise Exception('--rev cannot be used with a bundle')
+        with timings.phase('load'):
+            c = Cookbook.load_bundle(args.input)
+    else:
+        if cache is None:
+            cache = recipe_cache(args)
+        with timings.phase('load'):
+            c = Cookbook.load(args.input, jobs=args.jobs, cache=cache,
+                              timings=timings, rev=args.rev)
+    if args.scale is not None or args.units is not None:
+        with timings.phase('transform'):
+            c = batch.transform_cookbook(c, scale=args.scale,
+                                         system=args.units)
+    return c
@@ -0,0 +1,242 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from . import _common
+from . import html as _html
+from . import pdf as _pdf
+from .. import timing, yaml_util
+
+_PDF_STYLES = ['cookbook', '4x6cards', 'avery5389']
+_HTML_ENGINES = ['sphinx', 'native']
+
+class Target(object):
+    def __init__(self, name, format, output, options):
+        self.name = name
+        self.format = format
+        self.output = output
+        self.options = options
+        self.steps = []
+        self.seconds = None
+        self.error = None
+        self.log = None
+
+def _parse_target(t, base_dir):
+    if not isinstance(t, dict):
+        raise Exception('Each target must be a mapping')
+    t = dict(t)
+    format = t.pop('format', None)
+    if format == 'pdf':
+        options = {
+            'style': t.pop('style', 'cookbook'),
+            'separate': bool(t.pop('separate', False)),
+            'background': t.pop('background', None),
+        }
+        if options['style'] not in _PDF_STYLES:
+            raise Exception('Invalid PDF style "{}"'.format(options['style']))
+        if options['background']:
+            options['background'] = os.path.join(base_dir,
+                                                 options['background'])
+        name = 'pdf-' + options['style']
+    elif format == 'html':
+        options = { 'engine': t.pop('engine', 'sphinx') }
+        if options['engine'] not in _HTML_ENGINES:
+            raise Exception('Invalid HTML engine "{}"'.format(
+                            options['engine']))
+        name = 'html-' + options['engine']
+    else:
+        raise Exception('Target format must be "pdf" or "html"')
+
+    name = str(t.pop('name', name))
+    if 'output' not in t:
+        raise Exception('Target "{}" has no output'.format(name))
+    output = os.path.join(base_dir, str(t.pop('output')))
+    if t:
+        raise Exception('Target "{}" has unknown options: {}'.format(
+                        name, ', '.join(sorted(str(k) for k in t))))
+    return Target(name, format, output, options)
+
+def load_targets(path):
+    """Reads the list of targets from the "targets" section of a YAML file
+
+    Relative paths are relative to the directory containing the file.
+    """
+    config = yaml_util.read_yaml_file(path)
+    if not isinstance(config, dict) or not config.get('targets'):
+        raise Exception('No targets in ' + path)
+    if not isinstance(config['targets'], list):
+        raise Exception('targets must be a list in ' + path)
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    targets = []
+    for t in config['targets']:
+        target = _parse_target(t, base_dir)
+        if target.name in [t.name for t in targets]:
+            raise Exception('Duplicate target "{}" in {}'.format(target.name,
+                                                                path))
+        targets.append(target)
+    return targets
+
+async def _build_pdf(sched, c, t, fragments):
+    style = t.options['style']
+    tmpdir = tempfile.mkdtemp(prefix='cookbook')
+    try:
+        tex_path = await sched.render(t.steps, _pdf.write_sources, c,
+                                      tmpdir, style, t.options['background'],
+                                      fragments)
+        await sched.run(t.steps, 'latexmk',
+                        _pdf.quiet_latexmk_command(tex_path))
+        await sched.call(t.steps,
+                         'impose' if style == 'avery5389' else 'copy',
+                         _pdf.finish, tmpdir, style, t.output,
+                         t.options['separate'])
+    finally:
+        shutil.rmtree(tmpdir)
+
+async def _build_html(sched, c, t, build_dir, jobs):
+    if t.options['engine'] == 'native':
+        await sched.render(t.steps,
+                           functools.partial(c.dump_html, jobs=jobs),
+                           t.output)
+        return
+
+    tmpdir = None
+    if build_dir is None:
+        build_dir = tmpdir = tempfile.mkdtemp(prefix='cookbook')
+    try:
+        await sched.render(t.steps, _html.write_sphinx_sources, c, build_dir)
+        await sched.run(t.steps, 'sphinx-build',
+                        _html.sphinx_build_command(build_dir, t.output))
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+async def _build_target(sched, c, t, args, fragments):
+    from .. import scheduler
+
+    start = time.perf_counter()
+    try:
+        out_dir = os.path.dirname(os.path.abspath(t.output))
+        os.makedirs(out_dir, exist_ok=True)
+        if t.format == 'pdf':
+            await _build_pdf(sched, c, t, fragments)
+        else:
+            build_dir = None
+            if not args.no_cache:
+                build_dir = os.path.join(_common.cache_dir(args), 'build',
+                                         t.name)
+            await _build_html(sched, c, t, build_dir, args.jobs)
+    except scheduler.ProcessFailed as e:
+        t.error = str(e)
+        t.log = e.output
+    except Exception as e:
+        t.error = str(e) or type(e).__name__
+    t.seconds = time.perf_counter() - start
+
+async def _build_all(c, targets, args, fragments):
+    import asyncio
+    from .. import scheduler
+
+    sched = scheduler.Scheduler(args.max_procs or os.cpu_count() or 1)
+    try:
+        await asyncio.gather(*[_build_target(sched, c, t, args, fragments)
+                               for t in targets])
+    finally:
+        sched.close()
+
+def build(c, targets, args, timings=None):
+    """Builds each of targets from the cookbook c
+
+    Failures are recorded in each target's error rather than raised so one
+    broken target doesn't stop the others.
+    """
+    import asyncio
+
+    if timings is None:
+        timings = timing.NULL_TIMINGS
+
+    fragments = _common.fragment_cache(args, 'latex')
+    with timings.phase('build targets'):
+        asyncio.run(_build_all(c, targets, args, fragments))
+    if fragments is not None:
+        fragments.prune()
+
+def _report(targets):
+    for t in targets:
+        steps = ', '.join('{} {:.2f} s'.format(step, seconds)
+                          for step, seconds in t.steps)
+        print('{:24} {:6} {:8.2f} s  {}'.format(
+              t.name, 'ok' if t.error is None else 'FAILED', t.seconds,
+              steps))
+
+    for t in targets:
+        if t.error is None:
+            continue
+        print('', file=sys.stderr)
+        print('{} failed: {}'.format(t.name, t.error), file=sys.stderr)
+        if t.log:
+            sys.stderr.write(t.log)
+
+def main(args):
+    from .. import bundle
+
+    _common.apply_template_arguments(args)
+
+    if args.targets:
+        targets = load_targets(args.targets)
+    elif bundle.is_bundle(args.input):
+        raise Exception('Bundles have no targets; use --targets FILE')
+    else:
+        targets = load_targets(args.input)
+
+    if args.target:
+        by_name = { t.name: t for t in targets }
+        for name in args.target:
+            if name not in by_name:
+                raise Exception('Unknown target "{}"'.format(name))
+        targets = [by_name[name] for name in args.target]
+
+    def run(timings):
+        build(_common.load_cookbook(args, timings=timings), targets, args,
+              timings)
+    _common.run_instrumented(args, run)
+
+    _report(targets)
+    if any(t.error is not None for t in targets):
+        sys.exit(1)
+
+def setup_subparser(subparser):
+    subparser.add_argument('-P', '--max-procs', type=int, default=0,
+                           help='Maximum number of external tools to run at '
+                                'once (default: one per CPU)')
+    subparser.add_argument('--targets', metavar='FILE',
+                           help='Read the targets from FILE instead of the '
+                                'input cookbook.yaml')
+    _common.add_load_arguments(subparser)
+    _common.add_timing_arguments(subparser)
+    _common.add_template_arguments(subparser)
+    subparser.add_argument('input', help='Name of input file')
+    subparser.add_argument('target', nargs='*',
+                           help='Names of the targets to build '
+                                '(default: all of them)')
+    subparser.set_defaults(func=main)
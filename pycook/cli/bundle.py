@@ -0,0 +1,46 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+from . import _common
+from .. import timing
+
+def main(args):
+    def run(timings):
+        if timings is None:
+            timings = timing.NULL_TIMINGS
+        c = _common.load_cookbook(args, timings=timings)
+        with timings.phase('write bundle'):
+            c.write_bundle(args.output)
+        if args.verbose:
+            num_recipes = sum(len(ch.recipes) for ch in c.chapters)
+            print('{} recipes in {} chapters, {} bytes'.format(
+                  num_recipes, len(c.chapters),
+                  os.path.getsize(args.output)), file=sys.stderr)
+    _common.run_instrumented(args, run)
+
+def setup_subparser(subparser):
+    subparser.add_argument('-v', '--verbose', action='store_const',
+                           const=True, default=False,
+                           help='Print the size of the bundle')
+    _common.add_load_arguments(subparser)
+    _common.add_timing_arguments(subparser)
+    subparser.add_argument('input', help='Name of input file')
+    subparser.add_argument('output', help='Name of the bundle to write')
+    subparser.set_defaults(func=main)
@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+
+from . import _common
+
+def main(args):
+    from .. import check
+
+    if args.no_cache:
+        pass_cache = check.PassCache()
+    else:
+        pass_cache = check.PassCache(
+            check.pass_cache_path(_common.cache_dir(args)))
+
+    result = check.check_cookbook(args.input, jobs=args.jobs,
+                                  pass_cache=pass_cache,
+                                  only=args.files or None)
+    for problem in result.problems:
+        print(problem)
+
+    if args.verbose or result.problems:
+        print('{} files checked, {} unchanged since they last passed, '
+              '{} problems'.format(result.checked, result.unchanged,
+                                   len(result.problems)), file=sys.stderr)
+    if result.problems:
+        sys.exit(1)
+
+def setup_subparser(subparser):
+    subparser.add_argument('-j', '--jobs', type=int, default=0,
+                           help='Number of parallel jobs '
+                                '(default: one per CPU)')
+    subparser.add_argument('-v', '--verbose', action='store_const',
+                           const=True, default=False,
+                           help='Print how many files were checked')
+    _common.add_cache_arguments(subparser,
+                                'Check every file, even ones which passed '
+                                'before')
+    subparser.add_argument('input', help='Name of input file')
+    subparser.add_argument('files', nargs='*',
+                           help='Only check these chapter and recipe files')
+    subparser.set_defaults(func=main)
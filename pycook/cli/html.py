@@ -18,33 +18,97 @@
 import os
 import shutil
 import subprocess
+import sys
 import tempfile
 
-from ..cookbook import Cookbook
+from . import _common
+from .. import timing
 
-def main(args):
-    tmpdir = tempfile.mkdtemp(prefix='cookbook')
-    pkgpath = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+def _copy_if_changed(src, dst):
+    with open(src, 'rb') as f:
+        data = f.read()
     try:
-        c = Cookbook.load(args.input)
-        c.dump_rst(tmpdir)
-        shutil.copyfile(os.path.join(pkgpath, 'sphinx_conf_py'),
-                        os.path.join(tmpdir, 'conf.py'))
+        with open(dst, 'rb') as f:
+            if f.read() == data:
+                return
+    except FileNotFoundError:
+        pass
+    with open(dst, 'wb') as f:
+        f.write(data)
+
+def write_sphinx_sources(c, build_dir, verbose=False,
+                         timings=timing.NULL_TIMINGS):
+    """Writes the RST sources and Sphinx configuration into build_dir"""
+    pkgpath = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    src_dir = os.path.join(build_dir, 'src')
 
-        subprocess.run([
-            'sphinx-build',
-            '-b', 'html',
-            tmpdir,
-            args.output
-        ])
+    num_changed = c.dump_rst(src_dir, timings=timings)
+    _copy_if_changed(os.path.join(pkgpath, 'sphinx_conf_py'),
+                     os.path.join(src_dir, 'conf.py'))
+    if verbose:
+        print('RST files: {} written'.format(num_changed), file=sys.stderr)
 
-    except:
-        shutil.rmtree(tmpdir)
-        raise
+def sphinx_build_command(build_dir, output, jobs=1):
+    return [
+        'sphinx-build',
+        '-b', 'html',
+        '-d', os.path.join(build_dir, 'doctrees'),
+        '-j', str(jobs) if jobs else 'auto',
+        os.path.join(build_dir, 'src'),
+        output
+    ]
 
-    shutil.rmtree(tmpdir)
+def _sphinx_build(c, build_dir, output, jobs=1, verbose=False,
+                  timings=timing.NULL_TIMINGS):
+    write_sphinx_sources(c, build_dir, verbose, timings)
+    with timings.phase('sphinx-build'):
+        subprocess.run(sphinx_build_command(build_dir, output, jobs))
+
+def build(c, args, timings=None):
+    if timings is None:
+        timings = timing.NULL_TIMINGS
+
+    if args.engine == 'native':
+        num_changed = c.dump_html(args.output, jobs=args.jobs,
+                                  timings=timings)
+        if args.verbose:
+            print('HTML files: {} written'.format(num_changed),
+                  file=sys.stderr)
+    elif args.build_dir:
+        _sphinx_build(c, args.build_dir, args.output, args.jobs, args.verbose,
+                      timings)
+    elif not args.no_cache:
+        build_dir = os.path.join(_common.cache_dir(args), 'html')
+        _sphinx_build(c, build_dir, args.output, args.jobs, args.verbose,
+                      timings)
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='cookbook')
+        try:
+            _sphinx_build(c, tmpdir, args.output, args.jobs, args.verbose,
+                          timings)
+        finally:
+            shutil.rmtree(tmpdir)
+
+def main(args):
+    _common.apply_template_arguments(args)
+    def run(timings):
+        build(_common.load_cookbook(args, timings=timings), args, timings)
+    _common.run_instrumented(args, run)
 
 def setup_subparser(subparser):
+    subparser.add_argument('-e', '--engine', choices=['sphinx', 'native'],
+                           default='sphinx',
+                           help='Build with Sphinx or write HTML directly')
+    subparser.add_argument('--build-dir',
+                           help='Persistent directory for the generated RST '
+                                'and Sphinx doctrees (default: html in the '
+                                'cache directory)')
+    subparser.add_argument('-v', '--verbose', action='store_const',
+                           const=True, default=False,
+                           help='Print build statistics')
+    _common.add_load_arguments(subparser)
+    _common.add_timing_arguments(subparser)
+    _common.add_template_arguments(subparser)
     subparser.add_argument('input', help='Name of input file', )
     subparser.add_argument('output', help='Name of output directory')
     subparser.set_defaults(func=main)
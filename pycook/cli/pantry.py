@@ -0,0 +1,73 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+
+from . import _common
+
+def main(args):
+    from .. import pantry
+
+    recipes = _common.recipe_cache(args)
+    if args.no_cache:
+        index = pantry.IngredientIndex()
+    else:
+        path = pantry.index_path(_common.cache_dir(args))
+        index = pantry.IngredientIndex.load(path)
+
+    errors = []
+    if index.update(args.input, recipes, errors) and not args.no_cache:
+        index.save(path)
+    _common.report_skipped_recipes(errors)
+
+    if args.list:
+        for name in index.ingredients():
+            print(name)
+        return
+
+    if args.all:
+        results = [r + ((),) for r in index.containing(args.ingredients)]
+    else:
+        results = index.makeable(args.ingredients,
+                                 max_missing=args.missing)
+
+    if not results:
+        print('No matching recipes', file=sys.stderr)
+        sys.exit(1)
+
+    for chapter, name, path, missing in results:
+        line = '{} / {}'.format(chapter, name)
+        if missing:
+            line += '  (missing: {})'.format(', '.join(missing))
+        print(line)
+
+def setup_subparser(subparser):
+    subparser.add_argument('-a', '--all', action='store_const',
+                           const=True, default=False,
+                           help='List recipes using all of the ingredients '
+                                'instead of ones made only from them')
+    subparser.add_argument('-m', '--missing', type=int, default=0,
+                           help='Allow recipes missing up to this many '
+                                'ingredients')
+    subparser.add_argument('-l', '--list', action='store_const',
+                           const=True, default=False,
+                           help='List all known ingredients')
+    _common.add_cache_arguments(subparser)
+    subparser.add_argument('input', help='Name of input file', )
+    subparser.add_argument('ingredients', nargs='*',
+                           help='Ingredients on hand')
+    subparser.set_defaults(func=main)
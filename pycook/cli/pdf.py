@@ -16,82 +16,221 @@
 # PyCook.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
+import re
 import shutil
 import subprocess
+import sys
 import tempfile
 
-from ..cookbook import Cookbook
+from . import _common
+from .. import timing
+
+_LATEXMK_RUN_RE = re.compile(r'Run number \d+ of rule')
+_NEXT_PAGE_RE = re.compile(r'PYCOOK-NEXT-PAGE=(\d+)')
+
+# The page number and hyperref anchor which end each line of a .toc file
+_TOC_LINK_RE = re.compile(r'\{(\d+)\}\{[^{}]*\}%$', re.M)
+_TOC_DEST_PREFIX = 'pycook.page.'
 
 def to_avery5389(infile, front_out, back_out=None):
-    from PyPDF2 import PdfFileReader, PdfFileWriter
-    from PyPDF2.pdf import PageObject
+    from .. import impose
+    impose.avery5389(infile, front_out, back_out)
 
-    inpdf = PdfFileReader(infile)
-    front_out_pdf = PdfFileWriter()
-    if back_out:
-        back_out_pdf = PdfFileWriter()
-    else:
-        back_out_pdf = front_out_pdf
-
-    num_in_pages = inpdf.getNumPages()
-    num_out_sheets = (num_in_pages + 3) // 4
-    for i in range(num_out_sheets):
-        front = PageObject.createBlankPage(None, 612, 792)
-        back = PageObject.createBlankPage(None, 612, 792)
-
-        front.mergeTranslatedPage(inpdf.getPage(i * 4 + 0), 90, 396)
-        if i * 4 + 2 < num_in_pages:
-            front.mergeTranslatedPage(inpdf.getPage(i * 4 + 2), 90, 108)
-        if i * 4 + 1 < num_in_pages:
-            back.mergeTranslatedPage(inpdf.getPage(i * 4 + 1), 90, 396)
-        if i * 4 + 3 < num_in_pages:
-            back.mergeTranslatedPage(inpdf.getPage(i * 4 + 3), 90, 108)
-
-        front_out_pdf.addPage(front)
-        back_out_pdf.addPage(back)
-
-    with open(front_out, 'wb') as f:
-        front_out_pdf.write(f)
-    if back_out:
-        with open(back_out, 'wb') as f:
-            back_out_pdf.write(f)
+def _latexmk(tex_path, timings):
+    cmd = ['latexmk', '-cd', '-pdf', tex_path]
+    with timings.phase('latexmk') as phase:
+        if timings is timing.NULL_TIMINGS:
+            subprocess.run(cmd)
+            return
 
-def main(args):
-    if args.style == 'avery5389':
-        style = '4x6cards'
-    else:
-        style = args.style
+        # Capture the output so we can count how many passes were needed
+        p = subprocess.run(cmd, stdout=subprocess.PIPE,
+                           stderr=subprocess.STDOUT)
+        sys.stdout.buffer.write(p.stdout)
+        sys.stdout.flush()
+        phase.info['passes'] = len(_LATEXMK_RUN_RE.findall(
+            p.stdout.decode(errors='replace')))
 
-    tmpdir = tempfile.mkdtemp(prefix='cookbook')
-    try:
-        background = None
-        if args.background:
-            background = os.path.basename(args.background)
-            shutil.copyfile(args.background, os.path.join(tmpdir, background))
-
-        c = Cookbook.load(args.input)
-        with open(os.path.join(tmpdir, 'cookbook.tex'), 'w') as f:
-            f.write(c.to_latex(style=style, background=background))
-
-        subprocess.run([
-            'latexmk',
-            '-cd',
-            '-pdf',
-            os.path.join(tmpdir, 'cookbook.tex')
-        ])
-
-        if args.style == 'cookbook' or args.style == '4x6cards':
-            shutil.copyfile(os.path.join(tmpdir, 'cookbook.pdf'), args.output)
-        elif args.style == 'avery5389':
-            if args.separate:
-                base, ext = os.path.splitext(args.output)
+def quiet_latexmk_command(tex_path):
+    return ['latexmk', '-cd', '-pdf', '-interaction=nonstopmode', tex_path]
+
+def _latexmk_quiet(tex_path):
+    # Several of these run at once so keep their output to ourselves unless
+    # something goes wrong, and never stop to ask for input.
+    p = subprocess.run(quiet_latexmk_command(tex_path),
+                       stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                       stderr=subprocess.STDOUT)
+    if p.returncode != 0:
+        sys.stdout.buffer.write(p.stdout)
+        sys.stdout.flush()
+        raise Exception('latexmk failed on ' + os.path.basename(tex_path))
+
+def _next_page(tex_path):
+    # Each part logs the number its successor should start on
+    with open(os.path.splitext(tex_path)[0] + '.log', errors='replace') as f:
+        pages = _NEXT_PAGE_RE.findall(f.read())
+    assert pages, 'No page count in the log for ' + tex_path
+    return int(pages[-1])
+
+def _toc_page_link(m):
+    # Chapters are separate documents so their own anchors don't exist in
+    # the joined PDF, and may even clash.  Link to the page instead.
+    return '{{{}}}{{{}}}%'.format(m.group(1), _TOC_DEST_PREFIX + m.group(1))
+
+def _build_by_chapter(c, tmpdir, jobs, cache, timings):
+    """Compiles each chapter as its own document and stitches them together
+
+    Chapters are compiled in parallel assuming they all start on page one.
+    Once the front matter and every chapter have been compiled, their
+    lengths are known and any chapter which starts somewhere else is
+    renumbered and compiled again.  The table of contents is built from
+    the chapters' .toc files so it always has the final page numbers.
+    Its entries link to named destinations for their page numbers, which
+    are added once the pages of the joined PDF are known.
+    """
+    import concurrent.futures
+    from PyPDF2 import PdfFileMerger
+    from .. import latex
+
+    if not jobs:
+        jobs = os.cpu_count() or 1
+
+    def write_chapter(i, first_page, timings=timings):
+        path = os.path.join(tmpdir, 'chapter-{}.tex'.format(i + 1))
+        with open(path, 'w') as f:
+            latex.write_chapter(c.chapters[i], i + 1, f,
+                                first_page=first_page, cache=cache,
+                                timings=timings)
+        return path
+
+    def compile_all(paths):
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            list(executor.map(_latexmk_quiet, paths))
+
+    front_path = os.path.join(tmpdir, 'front.tex')
+    def compile_front():
+        with open(os.path.join(tmpdir, 'contents.toc'), 'w') as toc:
+            for path in chapter_paths:
+                with open(os.path.splitext(path)[0] + '.toc') as f:
+                    toc.write(_TOC_LINK_RE.sub(_toc_page_link, f.read()))
+        with open(front_path, 'w') as f:
+            latex.write_front_matter(c, f, 'contents.toc')
+        _latexmk_quiet(front_path)
+
+    first_pages = [1] * len(c.chapters)
+    with timings.phase('render LaTeX'):
+        chapter_paths = [write_chapter(i, first_pages[i])
+                         for i in range(len(c.chapters))]
+    with timings.phase('latexmk chapters'):
+        compile_all(chapter_paths)
+
+    # The length of the contents only depends on the number of entries so
+    # this gets the length of the front matter right the first time.
+    with timings.phase('latexmk front matter'):
+        compile_front()
+
+    next_page = _next_page(front_path)
+    stale = []
+    for i, path in enumerate(chapter_paths):
+        num_pages = _next_page(path) - first_pages[i]
+        if first_pages[i] != next_page:
+            first_pages[i] = next_page
+            # Recipes were already timed the first time around
+            write_chapter(i, next_page, timing.NULL_TIMINGS)
+            stale.append(path)
+        next_page += num_pages
+
+    if stale:
+        with timings.phase('latexmk renumbered chapters') as phase:
+            phase.info['chapters'] = len(stale)
+            compile_all(stale)
+        with timings.phase('latexmk front matter'):
+            compile_front()
+
+    with timings.phase('stitch'):
+        merger = PdfFileMerger()
+        for path in [front_path] + chapter_paths:
+            merger.append(os.path.splitext(path)[0] + '.pdf',
+                          import_bookmarks=True)
+            if path == front_path:
+                num_front_pages = len(merger.pages)
+
+        # pdfTeX points the contents' links, which it couldn't resolve, at
+        # the first page of the front matter.  Point them at the right
+        # pages instead.
+        merger.named_dests = [d for d in merger.named_dests
+                              if not d.title.startswith(_TOC_DEST_PREFIX)]
+        for i, page in enumerate(merger.pages[num_front_pages:]):
+            merger.addNamedDestination(
+                _TOC_DEST_PREFIX + str(first_pages[0] + i), page.id)
+        merger.addMetadata({
+            '/Title': str(c.title),
+            '/Author': str(c.author),
+        })
+        with open(os.path.join(tmpdir, 'cookbook.pdf'), 'wb') as f:
+            merger.write(f)
+        merger.close()
+
+def write_sources(c, tmpdir, style, background=None, cache=None,
+                  timings=None):
+    """Writes cookbook.tex for the given PDF style, and its background, to
+    tmpdir and returns the path to cookbook.tex"""
+    if background:
+        shutil.copyfile(background,
+                        os.path.join(tmpdir, os.path.basename(background)))
+        background = os.path.basename(background)
+
+    tex_path = os.path.join(tmpdir, 'cookbook.tex')
+    with open(tex_path, 'w') as f:
+        c.write_latex(f, style='4x6cards' if style == 'avery5389' else style,
+                      background=background, cache=cache, timings=timings)
+    return tex_path
+
+def finish(tmpdir, style, output, separate=False, timings=None):
+    """Copies the compiled cookbook.pdf in tmpdir to output, imposing it
+    first if the style calls for it"""
+    if timings is None:
+        timings = timing.NULL_TIMINGS
+
+    if style == 'cookbook' or style == '4x6cards':
+        shutil.copyfile(os.path.join(tmpdir, 'cookbook.pdf'), output)
+    elif style == 'avery5389':
+        with timings.phase('impose'):
+            if separate:
+                base, ext = os.path.splitext(output)
                 to_avery5389(os.path.join(tmpdir, 'cookbook.pdf'),
                              base + '-front' + ext, base + '-back' + ext)
             else:
-                to_avery5389(os.path.join(tmpdir, 'cookbook.pdf'),
-                             args.output)
+                to_avery5389(os.path.join(tmpdir, 'cookbook.pdf'), output)
+    else:
+        assert False
+
+def build(c, args, timings=None):
+    if timings is None:
+        timings = timing.NULL_TIMINGS
+
+    if args.by_chapter and args.style != 'cookbook':
+        raise Exception('--by-chapter only works with the cookbook style')
+
+    tmpdir = tempfile.mkdtemp(prefix='cookbook')
+    try:
+        fragments = _common.fragment_cache(args, 'latex')
+        if args.by_chapter:
+            _build_by_chapter(c, tmpdir, args.jobs, fragments, timings)
         else:
-            assert False
+            tex_path = write_sources(c, tmpdir, args.style, args.background,
+                                     fragments, timings)
+
+        if fragments is not None:
+            fragments.prune()
+            if args.verbose:
+                print('LaTeX fragments: {} cached, {} rendered'.format(
+                      fragments.hits, fragments.misses), file=sys.stderr)
+
+        if not args.by_chapter:
+            _latexmk(tex_path, timings)
+
+        finish(tmpdir, args.style, args.output, args.separate, timings)
 
     except:
         shutil.rmtree(tmpdir)
@@ -99,6 +238,12 @@ def main(args):
 
     shutil.rmtree(tmpdir)
 
+def main(args):
+    _common.apply_template_arguments(args)
+    def run(timings):
+        build(_common.load_cookbook(args, timings=timings), args, timings)
+    _common.run_instrumented(args, run)
+
 def setup_subparser(subparser):
     subparser.add_argument('-s', '--style', type=str, default='cookbook',
                            choices=['cookbook', '4x6cards', 'avery5389'],
@@ -107,6 +252,17 @@ def setup_subparser(subparser):
                            const=True, default=False,
                            help='Produce separate front and back PDFs')
     subparser.add_argument('-b', '--background', help='Background image')
+    subparser.add_argument('--by-chapter', action='store_const',
+                           const=True, default=False,
+                           help='Compile chapters as separate documents in '
+                                'parallel, using --jobs LaTeX processes, and '
+                                'join them (cookbook style only)')
+    subparser.add_argument('-v', '--verbose', action='store_const',
+                           const=True, default=False,
+                           help='Print build statistics')
+    _common.add_load_arguments(subparser)
+    _common.add_timing_arguments(subparser)
+    _common.add_template_arguments(subparser)
     subparser.add_argument('input', help='Name of input file', )
     subparser.add_argument('output', help='Name of output file')
     subparser.set_defaults(func=main)
@@ -0,0 +1,56 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+
+from . import _common
+
+def main(args):
+    from .. import search
+
+    recipes = _common.recipe_cache(args)
+    if args.no_cache:
+        index = search.SearchIndex()
+    else:
+        path = search.index_path(_common.cache_dir(args))
+        index = search.SearchIndex.load(path)
+
+    if not args.no_update or len(index) == 0:
+        errors = []
+        if index.update(args.input, recipes, errors) and not args.no_cache:
+            index.save(path)
+        _common.report_skipped_recipes(errors)
+
+    results = index.search(' '.join(args.query), limit=args.limit)
+    if not results:
+        print('No matches', file=sys.stderr)
+        sys.exit(1)
+
+    for res in results:
+        print('{:6.2f}  {} / {}  ({})'.format(res.score, res.chapter,
+                                              res.name, res.path))
+
+def setup_subparser(subparser):
+    subparser.add_argument('-n', '--limit', type=int, default=10,
+                           help='Maximum number of results to show')
+    subparser.add_argument('--no-update', action='store_const',
+                           const=True, default=False,
+                           help="Don't check for changed recipes first")
+    _common.add_cache_arguments(subparser)
+    subparser.add_argument('input', help='Name of input file', )
+    subparser.add_argument('query', nargs='+', help='Words to search for')
+    subparser.set_defaults(func=main)
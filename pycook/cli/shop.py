@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+from . import _common
+from .. import yaml_util
+
+def _load_menu(path):
+    from .. import shopping
+
+    menu = yaml_util.read_yaml_file(path)
+    if isinstance(menu, list):
+        title = os.path.splitext(os.path.basename(path))[0]
+        return title, menu
+    if not isinstance(menu, dict) or \
+       not isinstance(menu.get('recipes'), list):
+        raise shopping.MenuError('No list of "recipes"')
+    return menu.get('title', os.path.basename(path)), menu['recipes']
+
+def main(args):
+    from .. import shopping
+
+    menus = []
+    try:
+        for path in args.menu:
+            menus.append((path, _load_menu(path)))
+    except shopping.MenuError as e:
+        print('{}: {}'.format(path, e), file=sys.stderr)
+        sys.exit(1)
+    if args.recipes:
+        menus.append(('command line', (None, args.recipes)))
+    if not menus:
+        print('No recipes or menus given', file=sys.stderr)
+        sys.exit(1)
+
+    c = _common.load_cookbook(args)
+    index = shopping.RecipeIndex(c)
+    lists = []
+    for source, (title, menu) in menus:
+        try:
+            lists.append(shopping.build_shopping_list(c, menu, title, index))
+        except shopping.MenuError as e:
+            print('{}: {}'.format(source, e), file=sys.stderr)
+            sys.exit(1)
+    out = '\n'.join(l.to_str(vulgar=args.vulgar) for l in lists)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(out)
+    else:
+        sys.stdout.write(out)
+
+def setup_subparser(subparser):
+    subparser.add_argument('-m', '--menu', action='append', default=[],
+                           help='YAML menu file listing recipes; may be '
+                                'given more than once for several lists')
+    subparser.add_argument('-o', '--output', help='Name of output file')
+    subparser.add_argument('--vulgar', action='store_const',
+                           const=True, default=False,
+                           help='Use unicode fraction characters')
+    _common.add_load_arguments(subparser)
+    subparser.add_argument('input', help='Name of input file', )
+    subparser.add_argument('recipes', nargs='*',
+                           help='Names of recipes to shop for')
+    subparser.set_defaults(func=main)
@@ -0,0 +1,262 @@
+#! /usr/bin/env python3
+#
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+
+from . import _common
+from . import html as _html
+from . import pdf as _pdf
+from .. import yaml_util
+
+def _is_relevant(path):
+    name = os.path.basename(path)
+    return name.endswith('.yaml') and not name.startswith('.')
+
+def _watch_dirs(input_path):
+    """Returns the directories which may contain cookbook files"""
+    input_dir = os.path.dirname(os.path.abspath(input_path))
+    dirs = [input_dir]
+    try:
+        config = yaml_util.read_yaml_file(input_path)
+        cb_dir = config.get('path', input_dir)
+    except Exception:
+        # We'll find out about a broken cookbook.yaml when we rebuild
+        return dirs
+
+    if cb_dir != input_dir:
+        dirs.append(cb_dir)
+
+    try:
+        with os.scandir(cb_dir) as it:
+            for d in it:
+                if d.is_dir() and not d.name.startswith('.'):
+                    dirs.append(d.path)
+    except FileNotFoundError:
+        pass
+
+    return dirs
+
+class _InotifyWatcher(object):
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_FROM = 0x00000040
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+    _IN_DELETE = 0x00000200
+    _IN_DELETE_SELF = 0x00000400
+    _IN_IGNORED = 0x00008000
+    _IN_ISDIR = 0x40000000
+
+    _MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | \
+            _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self, input_path):
+        self._input_path = input_path
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('Could not find libc')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._wd_to_dir = {}
+        self._dirs = set()
+
+    def watch(self):
+        for d in _watch_dirs(self._input_path):
+            if d in self._dirs:
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(d),
+                                              self._MASK)
+            if wd < 0:
+                continue
+            self._wd_to_dir[wd] = d
+            self._dirs.add(d)
+
+    def poll(self, timeout):
+        r, _, _ = select.select([self._fd], [], [], timeout)
+        if not r:
+            return set()
+
+        changed = set()
+        buf = os.read(self._fd, 64 * 1024)
+        i = 0
+        while i < len(buf):
+            wd, mask, _, name_len = self._EVENT.unpack_from(buf, i)
+            i += self._EVENT.size
+            name = os.fsdecode(buf[i:i + name_len].rstrip(b'\0'))
+            i += name_len
+
+            if mask & self._IN_IGNORED:
+                # The directory is gone (or was unmounted) and the kernel
+                # has dropped its watch.  A directory which is recreated at
+                # the same path gets a new watch from the next watch().
+                d = self._wd_to_dir.pop(wd, None)
+                if d is not None and d not in self._wd_to_dir.values():
+                    self._dirs.discard(d)
+                continue
+
+            d = self._wd_to_dir.get(wd)
+            if d is None:
+                continue
+            if mask & self._IN_DELETE_SELF:
+                changed.add(d)
+                continue
+            if not name:
+                continue
+            path = os.path.join(d, name)
+            if mask & self._IN_ISDIR:
+                if mask & self._IN_CREATE:
+                    # Start watching new chapter directories right away;
+                    # nothing needs rebuilding until a file shows up.
+                    self.watch()
+                elif not name.startswith('.'):
+                    self._dirs.discard(path)
+                    changed.add(path)
+            elif _is_relevant(path):
+                changed.add(path)
+
+        return changed
+
+class _PollWatcher(object):
+    def __init__(self, input_path, interval=0.5):
+        self.interval = interval
+        self._input_path = input_path
+        self._snapshot = {}
+
+    def _take_snapshot(self):
+        snapshot = {}
+        for d in _watch_dirs(self._input_path):
+            try:
+                with os.scandir(d) as it:
+                    for e in it:
+                        if not _is_relevant(e.path):
+                            continue
+                        try:
+                            st = e.stat()
+                        except FileNotFoundError:
+                            continue
+                        snapshot[e.path] = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                pass
+        return snapshot
+
+    def watch(self):
+        self._snapshot = self._take_snapshot()
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._take_snapshot()
+        changed = set(p for p in snapshot.keys() | self._snapshot.keys()
+                      if snapshot.get(p) != self._snapshot.get(p))
+        self._snapshot = snapshot
+        return changed
+
+def _make_watcher(input_path, use_polling):
+    if not use_polling and sys.platform.startswith('linux'):
+        try:
+            return _InotifyWatcher(input_path)
+        except OSError:
+            pass
+    return _PollWatcher(input_path)
+
+def _wait_for_changes(watcher, debounce):
+    # Block until something changes, then keep collecting events until
+    # things have been quiet for the debounce interval.  Editors tend to
+    # write files in several steps and we only want to rebuild once.
+    changed = set()
+    while not changed:
+        changed = watcher.poll(3600)
+    while True:
+        more = watcher.poll(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+def _rebuild(args, recipes):
+    def build(timings):
+        c = _common.load_cookbook(args, cache=recipes, timings=timings)
+        args.build(c, args, timings)
+
+    start = time.monotonic()
+    try:
+        _common.run_instrumented(args, build)
+    except Exception:
+        traceback.print_exc()
+        print('Build failed', file=sys.stderr)
+        return
+    print('Build finished in {:.2f}s'.format(time.monotonic() - start),
+          file=sys.stderr)
+
+def main(args):
+    from .. import cache
+
+    if args.rev is not None:
+        raise Exception('A git revision never changes; there is nothing '
+                        'to watch')
+
+    _common.apply_template_arguments(args)
+
+    # Always keep parsed recipes in memory so a rebuild only re-parses the
+    # files which changed, even if the on-disk cache is disabled.
+    if args.no_cache:
+        recipes = cache.RecipeCache(None)
+    else:
+        recipes = cache.RecipeCache(_common.cache_dir(args))
+
+    watcher = _make_watcher(args.input, args.poll)
+    watcher.watch()
+    _rebuild(args, recipes)
+
+    try:
+        while True:
+            changed = _wait_for_changes(watcher, args.debounce)
+            for path in sorted(changed):
+                print('Changed: ' + path, file=sys.stderr)
+            watcher.watch()
+            _rebuild(args, recipes)
+    except KeyboardInterrupt:
+        pass
+
+def setup_subparser(subparser):
+    subparser.add_argument('--debounce', type=float, default=0.3,
+                           help='Seconds to wait for further changes before '
+                                'rebuilding')
+    subparser.add_argument('--poll', action='store_const',
+                           const=True, default=False,
+                           help='Poll for changes instead of using inotify')
+    targets = subparser.add_subparsers(dest='target')
+    targets.required = True
+
+    pdf_parser = targets.add_parser('pdf', help='Rebuild a PDF')
+    _pdf.setup_subparser(pdf_parser)
+    pdf_parser.set_defaults(func=main, build=_pdf.build)
+
+    html_parser = targets.add_parser('html', help='Rebuild HTML')
+    _html.setup_subparser(html_parser)
+    html_parser.set_defaults(func=main, build=_html.build)
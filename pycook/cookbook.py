@@ -13,8 +13,17 @@
 # You should have received a copy of the GNU General Public License along with
 # PyCook.  If not, see <https://www.gnu.org/licenses/>.
 
-from . import latex, recipe, rst, yaml_util
+from . import bundle, html, latex, recipe, rst, timing, yaml_util
+import functools
 import os
+import time
+
+class LoadError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        msg = '\n'.join('{}: {}'.format(path, str(e) or type(e).__name__)
+                        for path, e in errors)
+        super().__init__(msg)
 
 class Chapter(object):
     def __init__(self, title, description=None, recipes=[]):
@@ -22,6 +31,127 @@ class Chapter(object):
         self.description = description=None
         self.recipes = recipes
 
+def _scan_chapters(cb_dir):
+    chapters = []
+    with os.scandir(cb_dir) as cit:
+        for c in cit:
+            if not c.is_dir():
+                continue
+
+            index_path = os.path.join(c.path, 'index.yaml')
+            try:
+                index = yaml_util.read_yaml_file(index_path)
+            except FileNotFoundError:
+                continue
+
+            recipe_paths = []
+            with os.scandir(c.path) as rit:
+                for r in rit:
+                    if not r.name.endswith('.yaml'):
+                        continue
+
+                    if r.name == 'index.yaml':
+                        continue
+
+                    recipe_paths.append(r.path)
+
+            chapters.append((index, recipe_paths))
+
+    return chapters
+
+def _load_recipe(path, cache=None):
+    """Returns a tuple of (recipe, exception, seconds taken)"""
+    start = time.perf_counter()
+    try:
+        if cache is not None:
+            r = cache.load_recipe(path)
+        else:
+            r = recipe.Recipe.load(path)
+        return r, None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+def _load_recipes(paths, jobs, cache=None, timings=timing.NULL_TIMINGS):
+    if jobs is None or jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    results = [None] * len(paths)
+    stamps = [None] * len(paths)
+    todo = []
+    for i, p in enumerate(paths):
+        if cache is not None:
+            try:
+                r, stamps[i] = cache.memoized(p)
+            except OSError:
+                r = None
+            if r is not None:
+                results[i] = (r, None)
+                continue
+        todo.append(i)
+
+    load = functools.partial(_load_recipe, cache=cache)
+    todo_paths = [paths[i] for i in todo]
+    if jobs == 1 or len(todo) <= 1:
+        loaded = [load(p) for p in todo_paths]
+    else:
+        import concurrent.futures
+
+        # Recipes are cheap to load individually so hand them to the
+        # workers in batches.  Executor.map() returns results in submission
+        # order which keeps the final cookbook ordering independent of
+        # scheduling.
+        chunksize = max(1, len(todo) // (jobs * 4))
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            loaded = list(executor.map(load, todo_paths, chunksize=chunksize))
+
+    for i, (r, e, seconds) in zip(todo, loaded):
+        results[i] = (r, e)
+        timings.item('load', paths[i], seconds)
+        if cache is not None and r is not None and stamps[i] is not None:
+            cache.memoize(paths[i], stamps[i], r)
+
+    return results
+
+def _lazy_recipes(paths, cache=None):
+    results = []
+    for p in paths:
+        if cache is not None:
+            loader = functools.partial(cache.load_recipe, p)
+        else:
+            loader = functools.partial(recipe.Recipe.load, p)
+
+        try:
+            results.append((recipe.LazyRecipe(loader, recipe.read_name(p)),
+                            None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+def _assemble(config, scanned, results):
+    """Builds a Cookbook from its configuration, the (index, recipe paths)
+    of each chapter, and an iterator over a (recipe, exception) pair for
+    each recipe path"""
+    chapters = []
+    errors = []
+    for index, recipe_paths in scanned:
+        recipes = []
+        for p in recipe_paths:
+            r, e = next(results)
+            if e is not None:
+                errors.append((p, e))
+            else:
+                recipes.append(r)
+
+        recipes.sort(key=lambda r : r.name)
+        chapters.append(Chapter(index['title'], index.get('description'),
+                                recipes))
+
+    if errors:
+        raise LoadError(errors) from errors[0][1]
+
+    chapters.sort(key=lambda r : r.title)
+    return Cookbook(config['title'], config['author'], chapters)
+
 class Cookbook(object):
     def __init__(self, title, author, chapters=[]):
         self.title = title
@@ -29,46 +159,66 @@ class Cookbook(object):
         self.chapters = chapters
 
     @staticmethod
-    def load(path):
-        config = yaml_util.read_yaml_file(path)
-        cb_title = config['title']
-        cb_author = config['author']
-        cb_dir = config.get('path', os.path.dirname(os.path.abspath(path)))
+    def load(path, jobs=1, cache=None, lazy=False, timings=None, rev=None):
+        """Loads a cookbook
 
-        chapters = []
-        with os.scandir(cb_dir) as cit:
-            for c in cit:
-                if not c.is_dir():
-                    continue
+        If lazy is True, only recipe names are read up-front; each recipe is
+        parsed the first time anything else about it is needed.  Errors in a
+        recipe then show up on first use rather than from load().
 
-                index_path = os.path.join(c.path, 'index.yaml')
-                try:
-                    index = yaml_util.read_yaml_file(index_path)
-                except FileNotFoundError:
-                    continue
+        If timings is a timing.Timings, the time spent scanning and parsing
+        and the time taken by each recipe are recorded in it.
 
-                c_title = index['title']
-                c_description = index.get('description')
+        If rev is given, the cookbook is read from that git revision of the
+        repository containing path instead of from the working tree.
+        """
+        if timings is None:
+            timings = timing.NULL_TIMINGS
 
-                recipes = []
-                with os.scandir(c.path) as rit:
-                    for r in rit:
-                        if not r.name.endswith('.yaml'):
-                            continue
+        if rev is not None:
+            from . import git
+            return git.load_cookbook(path, rev, jobs, cache, lazy, timings)
 
-                        if r.name == 'index.yaml':
-                            continue
+        with timings.phase('scan'):
+            config = yaml_util.read_yaml_file(path)
+            cb_dir = config.get('path',
+                                os.path.dirname(os.path.abspath(path)))
 
-                        recipes.append(recipe.Recipe.load(r.path))
+            scanned = _scan_chapters(cb_dir)
+            paths = [p for _, recipe_paths in scanned for p in recipe_paths]
 
-                recipes.sort(key=lambda r : r.name)
-                chapters.append(Chapter(c_title, c_description, recipes))
+        with timings.phase('parse recipes'):
+            if lazy:
+                results = iter(_lazy_recipes(paths, cache))
+            else:
+                results = iter(_load_recipes(paths, jobs, cache, timings))
 
-        chapters.sort(key=lambda r : r.title)
-        return Cookbook(cb_title, cb_author, chapters)
+        if cache is not None:
+            cache.prune()
+
+        return _assemble(config, scanned, results)
+
+    @staticmethod
+    def load_bundle(path):
+        """Loads a cookbook from a bundle written by write_bundle()
+
+        The bundle is memory-mapped and nothing is parsed.  Recipes are
+        created as they are first looked at and, like those from a lazy
+        load(), only decoded when something other than their name is needed.
+        """
+        return bundle.load(path)
+
+    def write_bundle(self, path):
+        return bundle.write(self, path)
 
     def to_latex(self, **kwargs):
         return latex.render_cookbook(self, **kwargs)
 
+    def write_latex(self, f, **kwargs):
+        return latex.write_cookbook(self, f, **kwargs)
+
     def dump_rst(self, path, **kwargs):
-        rst.dump_cookbook(self, path, **kwargs)
+        return rst.dump_cookbook(self, path, **kwargs)
+
+    def dump_html(self, path, **kwargs):
+        return html.dump_cookbook(self, path, **kwargs)
@@ -0,0 +1,241 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+from . import cookbook, recipe, timing, yaml_util
+import functools
+import hashlib
+import io
+import os
+import posixpath
+import subprocess
+import time
+
+def _git(cwd, *args):
+    p = subprocess.run(['git'] + list(args), cwd=cwd,
+                       stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        raise Exception('git {} failed: {}'.format(
+                        args[0], p.stderr.decode(errors='replace').strip()))
+    return os.fsdecode(p.stdout)
+
+class Revision(object):
+    """The files in one revision of a git repository
+
+    Files are listed with "git ls-tree" and their contents are streamed
+    through a single "git cat-file --batch" process, so reading any number
+    of them only ever starts one process.  Paths are relative to the top of
+    the repository and always use / as a separator.
+    """
+    def __init__(self, path, rev):
+        path = os.path.abspath(path)
+        cwd = path if os.path.isdir(path) else os.path.dirname(path)
+        self.toplevel = _git(cwd, 'rev-parse', '--show-toplevel').strip()
+        self.rev = rev
+        try:
+            self.commit = _git(cwd, 'rev-parse', '--verify', '--quiet',
+                               rev + '^{commit}').strip()
+        except Exception:
+            raise Exception('Unknown git revision "{}"'.format(rev)) from None
+        self._cat_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._cat_file is not None:
+            self._cat_file.stdin.close()
+            self._cat_file.wait()
+            self._cat_file.stdout.close()
+            self._cat_file = None
+
+    def relpath(self, path):
+        """Returns the repository path of a path in the working tree"""
+        rel = os.path.relpath(os.path.realpath(path),
+                              os.path.realpath(self.toplevel))
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            raise Exception('{} is not in the git repository at {}'.format(
+                            path, self.toplevel))
+        return '' if rel == os.curdir else rel.replace(os.sep, '/')
+
+    def name(self, path):
+        """Returns a name for path which says which revision it came from"""
+        return '{}:{}'.format(self.rev, path)
+
+    def list_files(self, directory):
+        """Returns {path: object ID} for every file under directory"""
+        args = ['ls-tree', '-r', '-z', self.commit]
+        if directory:
+            args += ['--', directory + '/']
+
+        files = {}
+        for entry in _git(self.toplevel, *args).split('\0'):
+            if not entry:
+                continue
+            info, path = entry.split('\t', 1)
+            mode, kind, oid = info.split(' ')
+            # Skip submodules and symlinks
+            if kind == 'blob' and mode != '120000':
+                files[path] = oid
+        return files
+
+    def read(self, obj):
+        """Returns the contents of obj, an object ID or "<rev>:<path>" """
+        if self._cat_file is None:
+            self._cat_file = subprocess.Popen(['git', 'cat-file', '--batch'],
+                                              cwd=self.toplevel,
+                                              stdin=subprocess.PIPE,
+                                              stdout=subprocess.PIPE)
+
+        self._cat_file.stdin.write(os.fsencode(obj) + b'\n')
+        self._cat_file.stdin.flush()
+        header = self._cat_file.stdout.readline()
+        if not header or header.endswith((b' missing\n', b' ambiguous\n')):
+            raise FileNotFoundError('{} does not exist'.format(obj))
+        _, kind, size = header.split()
+        data = self._cat_file.stdout.read(int(size))
+        # Each object is followed by a newline
+        self._cat_file.stdout.read(1)
+        if kind != b'blob':
+            raise Exception('{} is a {}, not a file'.format(obj,
+                                                           kind.decode()))
+        return data
+
+    def read_path(self, path):
+        return self.read('{}:{}'.format(self.commit, path))
+
+def _scan_chapters(tree, cb_dir):
+    files = tree.list_files(cb_dir)
+    prefix = cb_dir + '/' if cb_dir else ''
+
+    chapter_files = {}
+    for path in files:
+        parts = path[len(prefix):].split('/')
+        if len(parts) == 2 and parts[1].endswith('.yaml'):
+            chapter_files.setdefault(parts[0], []).append(path)
+
+    chapters = []
+    for name, paths in sorted(chapter_files.items()):
+        index_path = prefix + name + '/index.yaml'
+        if index_path not in files:
+            continue
+        index = yaml_util.read_yaml_file(
+            io.BytesIO(tree.read(files[index_path])))
+        chapters.append((index, sorted(p for p in paths if p != index_path)))
+
+    return chapters, files
+
+def _blob_key(oid):
+    # Blob IDs are already content hashes; this just keeps the key format
+    # apart from that of recipes read from the working tree.
+    return hashlib.sha256(b'git blob ' + oid.encode()).hexdigest()
+
+def _parse_blob(data):
+    """Returns a tuple of (recipe, exception, seconds taken)"""
+    start = time.perf_counter()
+    try:
+        r = recipe.Recipe.load(io.BytesIO(data))
+        return r, None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+def _load_blob(data, oid, cache=None):
+    r = recipe.Recipe.load(io.BytesIO(data))
+    if cache is not None:
+        cache.put(_blob_key(oid), r)
+    return r
+
+def _load_recipes(tree, names, oids, jobs, cache, lazy, timings):
+    if jobs is None or jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    # Recipes which haven't changed since any revision that was loaded
+    # before come straight from the cache without being read at all.
+    results = [None] * len(oids)
+    todo = []
+    for i, oid in enumerate(oids):
+        if cache is not None:
+            r = cache.get(_blob_key(oid))
+            if r is not None:
+                results[i] = (r, None)
+                continue
+        todo.append(i)
+
+    blobs = [tree.read(oids[i]) for i in todo]
+
+    if lazy:
+        for i, data in zip(todo, blobs):
+            loader = functools.partial(_load_blob, data, oids[i], cache)
+            try:
+                name = recipe.read_name_from_str(data.decode('utf-8'))
+                results[i] = (recipe.LazyRecipe(loader, name), None)
+            except Exception as e:
+                results[i] = (None, e)
+        return results
+
+    if jobs == 1 or len(todo) <= 1:
+        loaded = [_parse_blob(data) for data in blobs]
+    else:
+        import concurrent.futures
+
+        chunksize = max(1, len(todo) // (jobs * 4))
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            loaded = list(executor.map(_parse_blob, blobs,
+                                       chunksize=chunksize))
+
+    for i, (r, e, seconds) in zip(todo, loaded):
+        results[i] = (r, e)
+        timings.item('load', names[i], seconds)
+        if cache is not None and r is not None:
+            cache.put(_blob_key(oids[i]), r)
+
+    return results
+
+def load_cookbook(path, rev, jobs=1, cache=None, lazy=False,
+                  timings=timing.NULL_TIMINGS):
+    """Loads the cookbook at path as it was in the git revision rev
+
+    path is where cookbook.yaml is, or would be, in the working tree.
+    Nothing is checked out; files are read straight from the repository.
+    Recipes are cached by blob ID so any recipe which is the same in
+    several revisions is only parsed once.
+    """
+    with Revision(path, rev) as tree:
+        with timings.phase('scan'):
+            cb_path = tree.relpath(os.path.abspath(path))
+            config = yaml_util.read_yaml_file(
+                io.BytesIO(tree.read_path(cb_path)))
+            if 'path' in config:
+                cb_dir = tree.relpath(config['path'])
+            else:
+                cb_dir = posixpath.dirname(cb_path)
+
+            scanned, files = _scan_chapters(tree, cb_dir)
+            paths = [p for _, recipe_paths in scanned for p in recipe_paths]
+            names = [tree.name(p) for p in paths]
+
+        with timings.phase('parse recipes'):
+            results = _load_recipes(tree, names, [files[p] for p in paths],
+                                    jobs, cache, lazy, timings)
+
+    if cache is not None:
+        cache.prune()
+
+    scanned = [(index, [tree.name(p) for p in recipe_paths])
+               for index, recipe_paths in scanned]
+    return cookbook._assemble(config, scanned, iter(results))
@@ -0,0 +1,323 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+from . import rst, search, templates, timing, units
+import decimal
+import fractions
+import html
+import json
+import os
+import urllib.parse
+
+def escape_str_for_html(s):
+    return html.escape(s, quote=True)
+
+def to_html(t):
+    # Plain text is by far the most common token so check for it first
+    if isinstance(t, str):
+        return escape_str_for_html(t)
+    elif isinstance(t, list):
+        return ''.join(to_html(i) for i in t)
+    elif isinstance(t, units.Unit):
+        return escape_str_for_html(t.to_str())
+    elif isinstance(t, units.Quantity):
+        s = to_html(t.num)
+        if t.unit:
+            s += ' ' + escape_str_for_html(t.unit.to_str(num=t.num))
+        return s
+    elif isinstance(t, units.Range):
+        return to_html(t.min_num) + '–' + to_html(t.max_num)
+    elif isinstance(t, (int, fractions.Fraction, decimal.Decimal)):
+        return escape_str_for_html(units.number_to_str(t, vulgar=True))
+    else:
+        assert False, 'Unknown token'
+
+_PAGE_TEMPLATE = templates.Template('html-page', r"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>${title}</title>
+<link rel="stylesheet" href="${root}style.css">
+</head>
+<body>
+<header>
+<a class="home" href="${root}index.html">${to_html(cookbook.title)}</a>
+<form class="search" action="${root}search.html">
+<input type="search" name="q" placeholder="Search recipes">
+</form>
+</header>
+<main>
+${body}
+</main>
+% for script in scripts:
+<script src="${root}${script}"></script>
+% endfor
+</body>
+</html>
+""")
+
+_RECIPE_TEMPLATE = templates.Template('html-recipe', r"""
+<article class="recipe">
+<h1>${to_html(recipe.name)}</h1>
+% if recipe.from_name and recipe.from_url:
+<p class="from">From <a href="${escape(recipe.from_url)}">${to_html(recipe.from_name)}</a></p>
+% elif recipe.from_name:
+<p class="from">From ${to_html(recipe.from_name)}</p>
+% elif recipe.from_url:
+<p class="from">From <a href="${escape(recipe.from_url)}">${escape(recipe.from_url)}</a></p>
+% endif
+<h2>Ingredients</h2>
+<ul class="ingredients">
+% for i in recipe.ingredients:
+<li>${'<span class="qty">' + to_html(i.qty) + '</span> ' if i.qty else ''}${to_html(i.name)}</li>
+% endfor
+</ul>
+<h2>Instructions</h2>
+<ol class="instructions">
+% for i in recipe.instructions:
+<li>${to_html(i)}</li>
+% endfor
+</ol>
+% if recipe.note:
+<aside class="note">
+<h2>Note</h2>
+<p>${to_html(recipe.note)}</p>
+</aside>
+% endif
+</article>
+<nav class="chapter"><a href="../${chapter_file}">${to_html(chapter.title)}</a></nav>
+""")
+
+_CHAPTER_TEMPLATE = templates.Template('html-chapter', r"""
+<h1>${to_html(chapter.title)}</h1>
+<ul class="recipes">
+% for r in chapter.recipes:
+<li><a href="${to_href(chapter.title)}/${to_href(r.name)}.html">${to_html(r.name)}</a></li>
+% endfor
+</ul>
+""")
+
+_COOKBOOK_TEMPLATE = templates.Template('html-cookbook', r"""
+<h1>${to_html(cookbook.title)}</h1>
+<p class="author">${to_html(cookbook.author)}</p>
+% for c in cookbook.chapters:
+<section class="chapter">
+<h2><a href="${to_href(c.title)}.html">${to_html(c.title)}</a></h2>
+<ul class="recipes">
+% for r in c.recipes:
+<li><a href="${to_href(c.title)}/${to_href(r.name)}.html">${to_html(r.name)}</a></li>
+% endfor
+</ul>
+</section>
+% endfor
+""")
+
+_SEARCH_BODY = """
+<h1>Search</h1>
+<p id="search-status"></p>
+<ul id="search-results" class="recipes"></ul>
+"""
+
+_STYLE_CSS = """\
+body { font-family: sans-serif; max-width: 48em; margin: 0 auto;
+       padding: 0 1em; line-height: 1.4; color: #222; }
+header { display: flex; justify-content: space-between; align-items: center;
+         border-bottom: 1px solid #ccc; padding: 0.5em 0; }
+header .home { font-weight: bold; text-decoration: none; color: inherit; }
+a { color: #2a5db0; }
+.from, .author { font-style: italic; }
+.qty { font-weight: bold; }
+.note { background: #f6f6f0; border-left: 4px solid #cc9; padding: 0 1em; }
+nav.chapter { border-top: 1px solid #ccc; margin-top: 2em; padding: 0.5em 0; }
+@media print { header, nav.chapter { display: none; } }
+"""
+
+# Client-side search over searchindex.js.  The index is loaded with a
+# <script> tag rather than fetched so that it also works from file:// URLs.
+_SEARCH_JS = r"""(function() {
+  var index = PYCOOK_SEARCH_INDEX;
+  var query = new URLSearchParams(window.location.search).get('q') || '';
+  var box = document.querySelector('header input[name=q]');
+  box.value = query;
+
+  var words = query.toLowerCase().match(/[\p{L}\p{N}_]+/gu) || [];
+  var numDocs = index.docs.length;
+  var scores = {};
+  var terms = Object.keys(index.terms);
+  words.forEach(function(word) {
+    terms.forEach(function(term) {
+      if (term.lastIndexOf(word, 0) !== 0)
+        return;
+      // Prefix matches count for half as much as whole words
+      var postings = index.terms[term];
+      var boost = term === word ? 1.0 : 0.5;
+      var idf = Math.log(1 + numDocs / (postings.length / 2));
+      for (var i = 0; i < postings.length; i += 2) {
+        var doc = postings[i];
+        scores[doc] = (scores[doc] || 0) + boost * idf * postings[i + 1];
+      }
+    });
+  });
+
+  var docs = Object.keys(scores).sort(function(a, b) {
+    return scores[b] - scores[a];
+  });
+  var results = document.getElementById('search-results');
+  docs.slice(0, 50).forEach(function(doc) {
+    var d = index.docs[doc];
+    var li = document.createElement('li');
+    var a = document.createElement('a');
+    a.href = d[1];
+    a.textContent = d[0];
+    li.appendChild(a);
+    li.appendChild(document.createTextNode(' — ' + d[2]));
+    results.appendChild(li);
+  });
+  document.getElementById('search-status').textContent = !words.length ?
+    'Type something to search for.' :
+    docs.length + ' matching recipe' + (docs.length === 1 ? '' : 's');
+})();
+"""
+
+def _page(cookbook, title, root, body, scripts=()):
+    return _PAGE_TEMPLATE.render(cookbook=cookbook, title=title, root=root,
+                                 body=body, scripts=scripts,
+                                 to_html=to_html)
+
+def render_recipe(r, cookbook, chapter):
+    body = _RECIPE_TEMPLATE.render(recipe=r, chapter=chapter,
+                                   chapter_file=to_href(chapter.title) +
+                                                '.html',
+                                   to_html=to_html,
+                                   escape=escape_str_for_html)
+    return _page(cookbook, to_html(r.name), '../', body)
+
+def to_filename(s):
+    return rst.to_filename(s)
+
+def to_href(s):
+    return urllib.parse.quote(to_filename(s))
+
+def build_search_index(cb):
+    """Returns a compact search index for the cookbook as a JSON string
+
+    docs is a list of [name, url, chapter] and terms maps each search term
+    to a flat list of alternating document numbers and term weights.
+    """
+    docs = []
+    terms = {}
+    for c in cb.chapters:
+        for r in c.recipes:
+            doc = len(docs)
+            docs.append([rst.to_rst(r.name),
+                         to_href(c.title) + '/' + to_href(r.name) + '.html',
+                         rst.to_rst(c.title)])
+            for term, weight in search.recipe_terms(r).items():
+                terms.setdefault(term, []).extend((doc, round(weight)))
+
+    return json.dumps({ 'docs': docs, 'terms': terms },
+                      ensure_ascii=False, separators=(',', ':'))
+
+class _Titled(object):
+    def __init__(self, title):
+        self.title = title
+
+class _PageWriter(object):
+    """Renders recipe pages, possibly in a worker process
+
+    Only the cookbook's and chapters' titles are needed to render a page so
+    that's all that gets sent to the workers, along with the recipes.
+    """
+    def __init__(self, title):
+        self.cookbook = _Titled(title)
+
+    def __call__(self, tasks):
+        num_changed = 0
+        for fpath, r, chapter in tasks:
+            if rst._write_if_changed(fpath,
+                                     render_recipe(r, self.cookbook,
+                                                   chapter)):
+                num_changed += 1
+        return num_changed
+
+def dump_cookbook(cb, path, jobs=1, timings=None):
+    """Writes the cookbook as a static HTML site in path
+
+    Recipe pages are rendered by up to jobs processes.  As with the RST
+    output, unchanged files are left alone and pages an earlier dump wrote
+    which are now stale are removed.
+    Returns the number of files written.
+    """
+    if timings is None:
+        timings = timing.NULL_TIMINGS
+    if jobs is None or jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    with timings.phase('write HTML'):
+        os.makedirs(path, exist_ok=True)
+        manifest = rst._Manifest(path)
+        num_changed = 0
+
+        def write(fname, content):
+            nonlocal num_changed
+            fpath = os.path.join(path, fname)
+            manifest.add(fpath)
+            if rst._write_if_changed(fpath, content):
+                num_changed += 1
+
+        write('index.html', _page(cb, to_html(cb.title), '',
+            _COOKBOOK_TEMPLATE.render(cookbook=cb, to_html=to_html,
+                                      to_href=to_href)))
+        write('search.html', _page(cb, 'Search', '', _SEARCH_BODY,
+                                   scripts=['searchindex.js', 'search.js']))
+        write('style.css', _STYLE_CSS)
+        write('search.js', _SEARCH_JS)
+        write('searchindex.js', 'var PYCOOK_SEARCH_INDEX = ' +
+                                build_search_index(cb) + ';\n')
+
+        tasks = []
+        for c in cb.chapters:
+            chapter_file = to_filename(c.title)
+            write(chapter_file + '.html', _page(cb, to_html(c.title), '',
+                _CHAPTER_TEMPLATE.render(chapter=c, to_html=to_html,
+                                         to_href=to_href)))
+
+            chapter_path = os.path.join(path, chapter_file)
+            manifest.makedirs(chapter_path)
+            chapter = _Titled(c.title)
+            for r in c.recipes:
+                fpath = os.path.join(chapter_path,
+                                     to_filename(r.name) + '.html')
+                manifest.add(fpath)
+                tasks.append((fpath, r, chapter))
+
+        writer = _PageWriter(cb.title)
+        if jobs == 1 or len(tasks) <= 1:
+            num_changed += writer(tasks)
+        else:
+            import concurrent.futures
+
+            # Hand pages out in batches; rendering one is too cheap to be
+            # worth a round-trip to a worker.
+            chunksize = max(1, len(tasks) // (jobs * 4))
+            chunks = [tasks[i:i + chunksize]
+                      for i in range(0, len(tasks), chunksize)]
+            with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+                num_changed += sum(executor.map(writer, chunks))
+
+        manifest.finish()
+
+    return num_changed
@@ -0,0 +1,271 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+import itertools
+import os
+
+# PDF imposition: laying out several small pages on each sheet of paper.
+#
+# Rather than merging page content streams together, as PyPDF2's
+# mergeTranslatedPage() does, each input page is turned into a form XObject
+# which shares the page's original (still compressed) content stream and
+# resources.  Sheets just place those forms with a transformation matrix.
+# Sheets are written to the output as soon as they're built so memory use
+# doesn't grow with the size of the deck.
+
+# Avery 5389 postcards: four 4x6 cards per letter-size sheet, two on the
+# front and two on the back.  Each entry is (page offset, side, x, y).
+AVERY_5389_SHEET = (612, 792)
+AVERY_5389_SLOTS = [
+    (0, 0, 90, 396),
+    (2, 0, 90, 108),
+    (1, 1, 90, 396),
+    (3, 1, 90, 108),
+]
+
+class _StreamingPdfWriter(object):
+    """Writes a PDF one object at a time
+
+    Objects imported from a PdfFileReader are copied along with everything
+    they reference, exactly once, so resources shared between pages such
+    as fonts and background images are only written once.
+    """
+    def __init__(self, f):
+        self._f = f
+        self._offsets = [None]
+        self._imported = {}
+        self._kids = []
+
+        f.write(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n')
+        self._pages_id = self._reserve()
+        self._catalog_id = self._reserve()
+
+    def _reserve(self):
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def _ref(self, idnum):
+        from PyPDF2.generic import IndirectObject
+        return IndirectObject(idnum, 0, None)
+
+    def _write_object(self, idnum, obj):
+        self._offsets[idnum] = self._f.tell()
+        self._f.write('{} 0 obj\n'.format(idnum).encode())
+        obj.writeToStream(self._f, None)
+        self._f.write(b'\nendobj\n')
+
+    def _copy(self, obj, pending):
+        """Copies obj, renumbering any indirect references it contains
+
+        Referenced objects which haven't been imported yet are given an
+        output number and added to pending to be written later.
+        """
+        from PyPDF2 import generic
+
+        if isinstance(obj, generic.IndirectObject):
+            key = (obj.idnum, obj.generation)
+            idnum = self._imported.get(key)
+            if idnum is None:
+                idnum = self._reserve()
+                self._imported[key] = idnum
+                pending.append((idnum, obj))
+            return self._ref(idnum)
+        elif isinstance(obj, generic.StreamObject):
+            copy = type(obj)()
+            copy._data = obj._data
+            for k, v in obj.items():
+                if k != '/Length':
+                    copy[generic.NameObject(k)] = self._copy(v, pending)
+            return copy
+        elif isinstance(obj, generic.DictionaryObject):
+            copy = generic.DictionaryObject()
+            for k, v in obj.items():
+                copy[generic.NameObject(k)] = self._copy(v, pending)
+            return copy
+        elif isinstance(obj, generic.ArrayObject):
+            return generic.ArrayObject(self._copy(v, pending) for v in obj)
+        else:
+            return obj
+
+    def _write_pending(self, pending):
+        while pending:
+            idnum, ref = pending.pop()
+            self._write_object(idnum, self._copy(ref.getObject(), pending))
+
+    def add_form(self, page, inherited):
+        """Writes an input page as a form XObject and returns a reference
+
+        inherited holds the attributes the page inherits from the page tree.
+        """
+        from PyPDF2 import generic
+
+        contents = page.get('/Contents')
+        if contents is not None:
+            contents = contents.getObject()
+        if isinstance(contents, generic.StreamObject):
+            # Re-use the content stream as-is, filters and all
+            form = type(contents)()
+            form._data = contents._data
+            for k in ('/Filter', '/DecodeParms'):
+                if k in contents:
+                    form[generic.NameObject(k)] = contents[k]
+        else:
+            form = generic.DecodedStreamObject()
+            if contents is not None:
+                form.setData(b'\n'.join(c.getObject().getData()
+                                        for c in contents))
+            else:
+                form.setData(b'')
+
+        pending = []
+        form.update({
+            generic.NameObject('/Type'): generic.NameObject('/XObject'),
+            generic.NameObject('/Subtype'): generic.NameObject('/Form'),
+            generic.NameObject('/BBox'): generic.ArrayObject(
+                v.getObject() for v in inherited['/MediaBox'].getObject()),
+            generic.NameObject('/Resources'):
+                self._copy(inherited.get('/Resources',
+                                         generic.DictionaryObject()),
+                           pending),
+        })
+        idnum = self._reserve()
+        self._write_object(idnum, form)
+        self._write_pending(pending)
+        return self._ref(idnum)
+
+    def add_sheet(self, width, height, placements):
+        """Adds a page which draws each (form, x, y) in placements"""
+        from PyPDF2 import generic
+
+        xobjects = generic.DictionaryObject()
+        ops = []
+        for i, (form, x, y) in enumerate(placements):
+            name = '/P{}'.format(i)
+            xobjects[generic.NameObject(name)] = form
+            ops.append('q 1 0 0 1 {} {} cm {} Do Q'.format(x, y, name))
+
+        content = generic.DecodedStreamObject()
+        content.setData('\n'.join(ops).encode())
+        content_id = self._reserve()
+        self._write_object(content_id, content)
+
+        sheet = generic.DictionaryObject({
+            generic.NameObject('/Type'): generic.NameObject('/Page'),
+            generic.NameObject('/Parent'): self._ref(self._pages_id),
+            generic.NameObject('/MediaBox'): generic.ArrayObject([
+                generic.NumberObject(0), generic.NumberObject(0),
+                generic.NumberObject(width), generic.NumberObject(height)]),
+            generic.NameObject('/Resources'): generic.DictionaryObject({
+                generic.NameObject('/XObject'): xobjects,
+            }),
+            generic.NameObject('/Contents'): self._ref(content_id),
+        })
+        sheet_id = self._reserve()
+        self._write_object(sheet_id, sheet)
+        self._kids.append(sheet_id)
+
+    def close(self):
+        from PyPDF2 import generic
+
+        self._write_object(self._pages_id, generic.DictionaryObject({
+            generic.NameObject('/Type'): generic.NameObject('/Pages'),
+            generic.NameObject('/Kids'):
+                generic.ArrayObject(self._ref(k) for k in self._kids),
+            generic.NameObject('/Count'): generic.NumberObject(
+                len(self._kids)),
+        }))
+        self._write_object(self._catalog_id, generic.DictionaryObject({
+            generic.NameObject('/Type'): generic.NameObject('/Catalog'),
+            generic.NameObject('/Pages'): self._ref(self._pages_id),
+        }))
+
+        xref_offset = self._f.tell()
+        self._f.write('xref\n0 {}\n'.format(len(self._offsets)).encode())
+        self._f.write(b'0000000000 65535 f \n')
+        for offset in self._offsets[1:]:
+            assert offset is not None
+            self._f.write('{:010} 00000 n \n'.format(offset).encode())
+        self._f.write('trailer\n<< /Size {} /Root {} 0 R >>\n'
+                      'startxref\n{}\n%%EOF\n'.format(
+                      len(self._offsets), self._catalog_id,
+                      xref_offset).encode())
+
+_INHERITABLE = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+def _iter_pages(node, inherited={}):
+    """Yields (page, inherited attributes) for each page under node
+
+    Unlike PdfFileReader.getPage(), this doesn't build a list of every page
+    in the document up-front.
+    """
+    node = node.getObject()
+    attrs = dict(inherited)
+    for k in _INHERITABLE:
+        if k in node:
+            attrs[k] = node[k]
+
+    if node.get('/Type') == '/Pages':
+        for kid in node['/Kids']:
+            yield from _iter_pages(kid, attrs)
+    else:
+        yield node, attrs
+
+def impose(infile, sheet_size, slots, front_out, back_out=None):
+    """Lays the pages of infile out onto sheets
+
+    slots is a list of (page offset, side, x, y) tuples describing where
+    each page goes in a group of len(slots) pages; side 0 is the front of
+    the sheet and side 1 the back.  If back_out is None, fronts and backs
+    are interleaved in front_out.
+    """
+    from PyPDF2 import PdfFileReader
+
+    width, height = sheet_size
+    per_group = len(slots)
+    with open(infile, 'rb') as inf, \
+         open(front_out, 'wb') as front_f, \
+         (open(back_out, 'wb') if back_out else open(os.devnull, 'wb')) \
+            as back_f:
+        # Passing a file rather than a path keeps PyPDF2 from reading the
+        # whole input into memory.
+        inpdf = PdfFileReader(inf)
+        front = _StreamingPdfWriter(front_f)
+        back = _StreamingPdfWriter(back_f) if back_out else front
+
+        pages = _iter_pages(inpdf.trailer['/Root'].getObject()['/Pages'])
+        while True:
+            group = list(itertools.islice(pages, per_group))
+            if not group:
+                break
+
+            sides = ([], [])
+            for offset, side, x, y in slots:
+                if offset < len(group):
+                    writer = front if side == 0 else back
+                    form = writer.add_form(*group[offset])
+                    sides[side].append((form, x, y))
+            front.add_sheet(width, height, sides[0])
+            back.add_sheet(width, height, sides[1])
+
+            # PyPDF2 caches every object it parses.  Everything we need
+            # from this group has been written so let it all go.
+            inpdf.resolvedObjects.clear()
+
+        front.close()
+        if back_out:
+            back.close()
+
+def avery5389(infile, front_out, back_out=None):
+    impose(infile, AVERY_5389_SHEET, AVERY_5389_SLOTS, front_out, back_out)
@@ -13,10 +13,11 @@
 # You should have received a copy of the GNU General Public License along with
 # PyCook.  If not, see <https://www.gnu.org/licenses/>.
 
-from . import units
+from . import templates, timing, units
 import decimal
 import fractions
-import mako.template
+import hashlib
+import io
 import os
 import re
 
@@ -68,7 +69,7 @@ def to_latex(t):
         assert False, 'Unknown token'
 
 
-_RECIPE_TEMPLATE = mako.template.Template(r"""
+_RECIPE_TEMPLATE = templates.Template('latex-recipe', r"""
 \recipesection{${to_latex(recipe.name)}}
 \begin{recipe}
 % if recipe.from_name:
@@ -123,7 +124,7 @@ def render_recipe(r, ingredient_shuffle=lambda i : i):
             sys.exit(1)
         raise
 
-_COOKBOOK_TEMPLATE = mako.template.Template(r"""
+_COOKBOOK_PREAMBLE = r"""
 \documentclass[letterpaper]{report}
 
 \usepackage{units}
@@ -133,7 +134,10 @@ _COOKBOOK_TEMPLATE = mako.template.Template(r"""
 \usepackage[letterpaper]{hyperref}
 \usepackage{url}
 \usepackage{${pkgpath}/cookbook}
+"""
 
+_COOKBOOK_TEMPLATE = templates.Template('latex-cookbook',
+    _COOKBOOK_PREAMBLE + r"""
 \title{${to_latex(cookbook.title)}}
 \author{${to_latex(cookbook.author)}}
 
@@ -145,14 +149,51 @@ _COOKBOOK_TEMPLATE = mako.template.Template(r"""
 \clearpage
 \chapter{${to_latex(chapter.title)}}
 % for recipe in chapter.recipes:
-${recipe.to_latex()}
+${render_recipe(recipe)}
 % endfor
 % endfor
 
 \end{document}
 """)
 
-_RECIPE_CARD_TEMPLATE = mako.template.Template(r"""
+# The title page and table of contents of a cookbook compiled one chapter at
+# a time.  The contents are read from a file stitched together from the
+# chapters' own .toc files, with links to destinations which are only added
+# once everything is joined into one PDF.
+_FRONT_MATTER_TEMPLATE = templates.Template('latex-front-matter',
+    _COOKBOOK_PREAMBLE + r"""
+\title{${to_latex(cookbook.title)}}
+\author{${to_latex(cookbook.author)}}
+
+\begin{document}
+\maketitle
+\makeatletter
+\chapter*{\contentsname
+    \@mkboth{\MakeUppercase\contentsname}{\MakeUppercase\contentsname}}
+\@input{${toc}}
+\makeatother
+
+\clearpage
+\typeout{PYCOOK-NEXT-PAGE=\arabic{page}}
+\end{document}
+""")
+
+_CHAPTER_TEMPLATE = templates.Template('latex-chapter',
+    _COOKBOOK_PREAMBLE + r"""
+\begin{document}
+\setcounter{page}{${first_page}}
+\setcounter{chapter}{${number - 1}}
+\chapter{${to_latex(chapter.title)}}
+% for recipe in chapter.recipes:
+${render_recipe(recipe)}
+% endfor
+
+\clearpage
+\typeout{PYCOOK-NEXT-PAGE=\arabic{page}}
+\end{document}
+""")
+
+_RECIPE_CARD_TEMPLATE = templates.Template('latex-cards', r"""
 \documentclass[letterpaper]{report}
 
 \usepackage{units}
@@ -180,36 +221,132 @@ contents={\includegraphics[width=\paperwidth,height=\paperheight]{${background}}
 
 \pagestyle{empty}
 
-<%
-def shuffle_two_columns(list):
-    half_len = (len(list) + 1) // 2
-    for i in range(half_len):
-        yield list[i]
-        if half_len + i < len(list):
-            yield list[half_len + i]
-%>
-
 \begin{document}
 % for chapter in cookbook.chapters:
 % for recipe in chapter.recipes:
 \clearpage
 \ifodd\value{page}\else\hbox{}\newpage\fi
-${recipe.to_latex(ingredient_shuffle=shuffle_two_columns)}
+${render_recipe(recipe)}
 % endfor
 % endfor
 
 \end{document}
 """)
 
-def render_cookbook(b, style='cookbook', background=None):
+def shuffle_two_columns(list):
+    half_len = (len(list) + 1) // 2
+    for i in range(half_len):
+        yield list[i]
+        if half_len + i < len(list):
+            yield list[half_len + i]
+
+def render_recipe_cached(r, cache, ingredient_shuffle=None):
+    """Renders a recipe, re-using a cached fragment if there is one
+
+    The cache key covers the parsed recipe, the ingredient layout, and the
+    recipe template itself so any change to those forces a re-render.
+    """
+    if ingredient_shuffle is None:
+        shuffle_name = 'plain'
+        kwargs = {}
+    else:
+        shuffle_name = ingredient_shuffle.__name__
+        kwargs = { 'ingredient_shuffle': ingredient_shuffle }
+
+    if cache is None:
+        return render_recipe(r, **kwargs)
+
+    key = hashlib.sha256('\n'.join([
+        _RECIPE_TEMPLATE.source_hash(),
+        shuffle_name,
+        r.content_hash(),
+    ]).encode()).hexdigest()
+
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = render_recipe(r, **kwargs)
+        cache.put(key, fragment)
+    return fragment
+
+def _release(r):
+    # Lazily loaded recipes can drop their parsed contents once rendered
+    release = getattr(r, 'release', None)
+    if release is not None:
+        release()
+
+def write_cookbook(b, f, style='cookbook', background=None, cache=None,
+                   timings=None):
+    """Renders a cookbook, writing it to the file object f as it goes
+
+    Recipes are rendered one at a time and each fragment is written out
+    before the next is rendered so the whole document is never held in
+    memory.  Recipes in a lazily loaded cookbook are released again once
+    written, which bounds memory by the largest recipe.
+    """
+    if timings is None:
+        timings = timing.NULL_TIMINGS
+
     pkgpath = os.path.dirname(os.path.abspath(__file__))
     if style == 'cookbook':
         assert background is None
-        return _COOKBOOK_TEMPLATE.render(cookbook=b, to_latex=to_latex,
-                                         pkgpath=pkgpath)
+        def render(r):
+            with timings.timed('render', r.name):
+                fragment = render_recipe_cached(r, cache)
+            _release(r)
+            return fragment
+        template = _COOKBOOK_TEMPLATE
+        data = {}
     elif style == '4x6cards':
-        return _RECIPE_CARD_TEMPLATE.render(cookbook=b, to_latex=to_latex,
-                                            background=background,
-                                            pkgpath=pkgpath)
+        def render(r):
+            with timings.timed('render', r.name):
+                fragment = render_recipe_cached(r, cache,
+                    ingredient_shuffle=shuffle_two_columns)
+            _release(r)
+            return fragment
+        template = _RECIPE_CARD_TEMPLATE
+        data = { 'background': background }
     else:
         assert False
+
+    with timings.phase('render LaTeX'):
+        template.render_to(f, cookbook=b, to_latex=to_latex,
+                           render_recipe=render, pkgpath=pkgpath, **data)
+
+def write_front_matter(b, f, toc):
+    """Writes the title page and contents of a cookbook as a document
+
+    This is the first part of a cookbook compiled by chapter.  toc is the
+    path to the concatenated .toc files of the compiled chapters.
+    """
+    pkgpath = os.path.dirname(os.path.abspath(__file__))
+    _FRONT_MATTER_TEMPLATE.render_to(f, cookbook=b, to_latex=to_latex,
+                                     toc=toc, pkgpath=pkgpath)
+
+def write_chapter(chapter, number, f, first_page=1, cache=None,
+                  timings=None):
+    """Writes a single chapter of a cookbook as a standalone document
+
+    The chapter is numbered number and its first page is numbered
+    first_page so the compiled chapters can be concatenated into the same
+    book write_cookbook() produces.
+    """
+    if timings is None:
+        timings = timing.NULL_TIMINGS
+
+    pkgpath = os.path.dirname(os.path.abspath(__file__))
+    def render(r):
+        with timings.timed('render', r.name):
+            fragment = render_recipe_cached(r, cache)
+        _release(r)
+        return fragment
+
+    _CHAPTER_TEMPLATE.render_to(f, chapter=chapter, number=number,
+                                first_page=first_page, to_latex=to_latex,
+                                render_recipe=render, pkgpath=pkgpath)
+
+def render_cookbook(b, style='cookbook', background=None, cache=None,
+                    timings=None):
+    f = io.StringIO()
+    write_cookbook(b, f, style=style, background=background, cache=cache,
+                   timings=timings)
+    return f.getvalue()
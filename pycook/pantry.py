@@ -0,0 +1,126 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+from . import recipe, rst, search
+import array
+import os
+
+class IngredientIndex(search.FileIndex):
+    """A reverse index from ingredient to the recipes which use it
+
+    Ingredient names are normalized with recipe.normalize_name() and each
+    maps to a sorted array of document IDs.  For every recipe, the index
+    also records how many distinct ingredients it has so that pantry
+    queries can be answered by counting hits rather than by comparing
+    every recipe against the pantry.  Recipes are also grouped by that
+    count so ones which could be made without anything from the pantry
+    are found too.
+    """
+    VERSION = search.INDEX_VERSION + 1
+
+    def __init__(self):
+        super().__init__()
+        self._postings = {}
+        self._docs = {}
+        self._by_size = {}
+
+    def _add_doc(self, doc, path, r, chapter):
+        names = tuple(sorted(set(recipe.normalize_name(i.name)
+                                 for i in r.ingredients)))
+        for name in names:
+            posting = self._postings.get(name)
+            if posting is None:
+                posting = (array.array('I'),)
+                self._postings[name] = posting
+            search._posting_add(posting, doc)
+        self._docs[doc] = (path, rst.to_rst(r.name), chapter, names)
+        self._by_size.setdefault(len(names), set()).add(doc)
+
+    def _remove_doc(self, doc):
+        names = self._docs.pop(doc)[3]
+        for name in names:
+            search._posting_remove(self._postings[name], doc)
+            if not self._postings[name][0]:
+                del self._postings[name]
+        self._by_size[len(names)].discard(doc)
+        if not self._by_size[len(names)]:
+            del self._by_size[len(names)]
+
+    def ingredients(self):
+        """Returns all known ingredient names, most used first"""
+        return sorted(self._postings,
+                      key=lambda n: (-len(self._postings[n][0]), n))
+
+    def _posting(self, name):
+        posting = self._postings.get(recipe.normalize_name(name))
+        if posting is None:
+            return array.array('I')
+        return posting[0]
+
+    def _results(self, docs):
+        return sorted((self._docs[d][2], self._docs[d][1], self._docs[d][0])
+                      for d in docs)
+
+    def containing(self, names):
+        """Returns the recipes which use every ingredient in names
+
+        Results are (chapter, recipe name, path) tuples.
+        """
+        postings = sorted((self._posting(n) for n in names), key=len)
+        if not postings:
+            return []
+
+        # Intersect starting from the shortest posting list so the working
+        # set only ever shrinks.
+        docs = set(postings[0])
+        for posting in postings[1:]:
+            if not docs:
+                break
+            docs.intersection_update(posting)
+        return self._results(docs)
+
+    def makeable(self, pantry, max_missing=0):
+        """Returns the recipes which can be made from the pantry
+
+        A recipe qualifies if at most max_missing of its ingredients are
+        not in pantry.  Results are (chapter, recipe name, path, missing)
+        tuples where missing is a tuple of the absent ingredient names.
+        """
+        pantry = set(recipe.normalize_name(n) for n in pantry)
+        hits = {}
+        for name in pantry:
+            posting = self._postings.get(name)
+            if posting is None:
+                continue
+            for doc in posting[0]:
+                hits[doc] = hits.get(doc, 0) + 1
+
+        # Recipes with no more ingredients than may be missing qualify
+        # whether or not they use anything in the pantry
+        for size in range(max_missing + 1):
+            for doc in self._by_size.get(size, ()):
+                hits.setdefault(doc, 0)
+
+        results = []
+        for doc, count in hits.items():
+            path, name, chapter, names = self._docs[doc]
+            if len(names) - count <= max_missing:
+                missing = tuple(n for n in names if n not in pantry)
+                results.append((chapter, name, path, missing))
+        results.sort(key=lambda r: (len(r[3]), r[0], r[1]))
+        return results
+
+def index_path(cache_dir):
+    return os.path.join(cache_dir, 'ingredient-index')
@@ -16,12 +16,20 @@
 from . import latex, rst, tokenizer, units, yaml_util
 import decimal
 import fractions
+import hashlib
+import io
 import re
 
 class _NumberTokenizer:
     RE = units.NUMBER_RE
+    LEX_RE = re.compile(units._number_pattern('number'))
+    LEX_START = units.NUMBER_START_RE
     from_match = units.number_from_str
 
+    @staticmethod
+    def from_lex(m):
+        return units.intern_number(units._number_from_groups(m, 'number'))
+
 _TOKENIZER = tokenizer.Tokenizer([
     units.Quantity,
     units.Unit,
@@ -31,22 +39,57 @@ _TOKENIZER = tokenizer.Tokenizer([
 def _tokenize_str(s):
     return _TOKENIZER.tokenize(s)
 
+_PAREN_RE = re.compile(r'\([^)]*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+def normalize_name(name):
+    """Normalizes an ingredient name for matching across recipes
+
+    Preparation notes after a comma and anything in parentheses are
+    dropped so "Butter, melted" and "butter (softened)" both become
+    "butter".
+    """
+    name = name.split(',', 1)[0]
+    name = _PAREN_RE.sub(' ', name)
+    return _SPACE_RE.sub(' ', name).strip().lower()
+
 class Ingredient(object):
+    __slots__ = ('name', 'qty')
+
     def __init__(self, name, qty=None):
-        self.name = name
-        self.qty = qty
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'qty', qty)
+
+    __setattr__ = units._immutable_setattr
+    __delattr__ = units._immutable_setattr
+
+    def __reduce__(self):
+        return (Ingredient, (self.name, self.qty))
 
     @staticmethod
     def parse(s):
-        m = units.Quantity.RE.match(s)
+        m = units.Quantity.LEX_RE.match(s)
         if m:
             name = s[m.end():]
-            qty = units.Quantity.from_match(m)
+            qty = units.Quantity.from_lex(m)
         else:
             name = s
             qty = None
 
-        return Ingredient(name.strip(), qty)
+        return Ingredient(tokenizer.intern_text(name.strip()), qty)
+
+def _content_tuple(t):
+    if isinstance(t, list):
+        return tuple(_content_tuple(i) for i in t)
+    elif isinstance(t, Ingredient):
+        return ('I', t.name, _content_tuple(t.qty))
+    elif isinstance(t, units.Quantity):
+        return ('Q', _content_tuple(t.num), t.unit)
+    elif isinstance(t, units.Range):
+        return ('R', t.min_num, t.max_num)
+    else:
+        # Strings, numbers, units, and None all have an unambiguous repr()
+        return t
 
 class Recipe(object):
     _SECTIONS = set([
@@ -57,6 +100,7 @@ class Recipe(object):
         'instructions',
         'note',
     ])
+    _REQUIRED_SECTIONS = ['name', 'ingredients', 'instructions']
 
     def __init__(self):
         pass
@@ -68,6 +112,9 @@ class Recipe(object):
         for section in data.keys():
             if section not in Recipe._SECTIONS:
                 raise Exception('Invalid section "{}"'.format(section))
+        for section in Recipe._REQUIRED_SECTIONS:
+            if section not in data:
+                raise Exception('Missing section "{}"'.format(section))
 
         r = Recipe()
         r.name = _tokenize_str(str(data['name']))
@@ -82,8 +129,104 @@ class Recipe(object):
 
         return r
 
+    def content_hash(self):
+        """Returns a hash of the parsed recipe
+
+        Two recipes with the same hash render identically.
+        """
+        content = (
+            _content_tuple(self.name),
+            self.from_name,
+            self.from_url,
+            _content_tuple(self.ingredients),
+            _content_tuple(self.instructions),
+            _content_tuple(self.note),
+        )
+        return hashlib.sha256(repr(content).encode()).hexdigest()
+
     def to_latex(self, **kwargs):
         return latex.render_recipe(self, **kwargs)
 
     def to_rst(self, **kwargs):
         return rst.render_recipe(self, **kwargs)
+
+_NAME_LINE_RE = re.compile(r'^name:[ \t]*(?P<value>.*?)[ \t]*$', re.MULTILINE)
+# An indented line, even after blank ones, continues the value before it
+_CONTINUATION_RE = re.compile(r'(?:[ \t]*\n)*[ \t]+\S')
+
+def read_name(f):
+    """Reads just the name of the recipe in the given file
+
+    This avoids parsing the whole file when the name is a simple one-line
+    scalar, which it nearly always is.  Anything fancier falls back to
+    parsing the whole YAML file.
+    """
+    with io.open(f, 'r') as stream:
+        return read_name_from_str(stream.read())
+
+def read_name_from_str(text):
+    import yaml
+
+    m = _NAME_LINE_RE.search(text)
+    if m:
+        value = m.group('value')
+        rest = text[m.end() + 1:]
+        if value and value[0] not in '|>&*!' and \
+           not _CONTINUATION_RE.match(rest):
+            # A quoted value may still carry on over several lines
+            try:
+                data = yaml_util.read_yaml_file(io.StringIO(m.group(0)))
+            except yaml.YAMLError:
+                data = None
+            if isinstance(data, dict) and 'name' in data:
+                return _tokenize_str(str(data['name']))
+
+    data = yaml_util.read_yaml_file(io.StringIO(text))
+    return _tokenize_str(str(data['name']))
+
+class LazyRecipe(Recipe):
+    """A recipe which is only fully loaded when needed
+
+    Only the name is available up-front.  The first time any other attribute
+    is accessed, the loader is called to load the full recipe and the result
+    is memoized in the object.
+    """
+    def __init__(self, loader, name):
+        self._loader = loader
+        self.name = name
+
+    def _materialize(self):
+        r = self._loader()
+        self._reload = self.__dict__.pop('_loader')
+        self.__dict__.update(r.__dict__)
+
+    def release(self):
+        """Drops everything but the name until the recipe is needed again"""
+        reload = self.__dict__.get('_reload')
+        if reload is None:
+            return
+        name = self.name
+        self.__dict__.clear()
+        self._loader = reload
+        self.name = name
+
+    def __getattr__(self, attr):
+        # Only called for attributes which don't exist yet
+        if attr.startswith('__') or '_loader' not in self.__dict__:
+            raise AttributeError(attr)
+        self._materialize()
+        return getattr(self, attr)
+
+    def __reduce_ex__(self, protocol):
+        # Pickle as a plain, fully loaded recipe; the loader may not be
+        # picklable and is useless in another process anyway.
+        if '_loader' in self.__dict__:
+            self._materialize()
+        d = self.__dict__.copy()
+        del d['_reload']
+        return (_recipe_from_dict, (d,))
+
+def _recipe_from_dict(d):
+    r = Recipe()
+    r.__dict__.update(d)
+    return r
@@ -13,8 +13,7 @@
 # You should have received a copy of the GNU General Public License along with
 # PyCook.  If not, see <https://www.gnu.org/licenses/>.
 
-from . import units
-import mako.template
+from . import templates, timing, units
 import decimal
 import fractions
 import re
@@ -38,7 +37,7 @@ def to_rst(t):
     else:
         assert False, 'Unknown token'
 
-_RECIPE_TEMPLATE = mako.template.Template(r"""
+_RECIPE_TEMPLATE = templates.Template('rst-recipe', r"""
 ${to_rst(recipe.name)}
 ${'='*len(to_rst(recipe.name))}
 
@@ -77,7 +76,7 @@ def render_recipe(r):
     return _RECIPE_TEMPLATE.render(recipe=r, to_rst=to_rst,
                                    textwrap=textwrap)
 
-_CHAPTER_TEMPLATE = mako.template.Template(r"""
+_CHAPTER_TEMPLATE = templates.Template('rst-chapter', r"""
 ${to_rst(chapter.title)}
 ${'='*len(to_rst(chapter.title))}
 
@@ -91,7 +90,7 @@ ${'='*len(to_rst(chapter.title))}
 % endfor
 """)
 
-_COOKBOOK_TEMPLATE = mako.template.Template(r"""
+_COOKBOOK_TEMPLATE = templates.Template('rst-cookbook', r"""
 ${to_rst(cookbook.title)}
 ${'='*len(to_rst(cookbook.title))}
 
@@ -107,20 +106,136 @@ ${'='*len(to_rst(cookbook.title))}
 def to_filename(s):
     return re.sub(r'\W+', '-', to_rst(s).lower())
 
-def dump_cookbook(cb, path):
+def _write_if_changed(path, content):
+    # Leave unchanged files alone so their mtimes are preserved and Sphinx
+    # doesn't consider them out-of-date.
+    data = content.encode()
+    try:
+        # Only read the old file back if it could possibly match
+        if os.stat(path).st_size == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return False
+    except FileNotFoundError:
+        pass
+
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+class _Manifest(object):
+    """The files and directories a dump wrote into an output directory
+
+    The list is kept in the directory itself so that the next dump can
+    remove whatever this one wrote and it no longer does, without touching
+    anything else a user may have put there.
+    """
+    NAME = '.pycook-manifest'
+
+    def __init__(self, path):
+        self.path = path
+        self.files = set()
+        self.dirs = set()
+        self._old_files = set()
+        self._old_dirs = set()
+        try:
+            with open(os.path.join(path, self.NAME), encoding='utf-8') as f:
+                entries = f.read().splitlines()
+        except FileNotFoundError:
+            entries = []
+        for e in entries:
+            # Never follow an entry out of the output directory
+            if not e or os.path.isabs(e) or \
+               os.pardir in e.rstrip('/').split('/'):
+                continue
+            if e.endswith('/'):
+                self._old_dirs.add(e[:-1])
+            else:
+                self._old_files.add(e)
+
+    def _rel(self, fpath):
+        return os.path.relpath(fpath, self.path).replace(os.sep, '/')
+
+    def makedirs(self, dpath):
+        rel = self._rel(dpath)
+        if not os.path.isdir(dpath):
+            os.makedirs(dpath)
+            self.dirs.add(rel)
+        elif rel in self._old_dirs:
+            self.dirs.add(rel)
+
+    def add(self, fpath):
+        self.files.add(self._rel(fpath))
+
+    def finish(self):
+        """Removes what the last dump wrote and this one didn't"""
+        for rel in self._old_files - self.files:
+            try:
+                os.unlink(os.path.join(self.path, rel))
+            except FileNotFoundError:
+                pass
+        for rel in sorted(self._old_dirs - self.dirs, reverse=True):
+            try:
+                os.rmdir(os.path.join(self.path, rel))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Something else is in there now; try again next time
+                self.dirs.add(rel)
+
+        entries = sorted(self.files) + sorted(d + '/' for d in self.dirs)
+        _write_if_changed(os.path.join(self.path, self.NAME),
+                          ''.join(e + '\n' for e in entries))
+
+def dump_cookbook(cb, path, timings=None):
+    """Writes the cookbook as a tree of RST files in path
+
+    Files whose contents would not change are not rewritten and any files
+    an earlier dump wrote for recipes and chapters which have since been
+    renamed or deleted are removed.  Nothing else in path is touched.
+    Returns the number of files written.
+    """
+    if timings is None:
+        timings = timing.NULL_TIMINGS
+
+    with timings.phase('write RST'):
+        return _dump_cookbook(cb, path, timings)
+
+def _dump_cookbook(cb, path, timings):
     os.makedirs(path, exist_ok=True)
-    with open(os.path.join(path, 'index.rst'), 'w') as f:
-        f.write(_COOKBOOK_TEMPLATE.render(cookbook=cb, to_rst=to_rst,
-                                          to_filename=to_filename))
+    manifest = _Manifest(path)
+    num_changed = 0
+
+    def write(fpath, content):
+        nonlocal num_changed
+        manifest.add(fpath)
+        if _write_if_changed(fpath, content):
+            num_changed += 1
+
+    write(os.path.join(path, 'index.rst'),
+          _COOKBOOK_TEMPLATE.render(cookbook=cb, to_rst=to_rst,
+                                    to_filename=to_filename))
 
     for c in cb.chapters:
         chapter_path = os.path.join(path, to_filename(c.title))
-        os.makedirs(chapter_path, exist_ok=True)
-        with open(chapter_path + '.rst', 'w') as f:
-            f.write(_CHAPTER_TEMPLATE.render(chapter=c, to_rst=to_rst,
-                                             to_filename=to_filename))
+        manifest.makedirs(chapter_path)
+        write(chapter_path + '.rst',
+              _CHAPTER_TEMPLATE.render(chapter=c, to_rst=to_rst,
+                                       to_filename=to_filename))
 
         for r in c.recipes:
             recipe_path = os.path.join(chapter_path, to_filename(r.name))
-            with open(recipe_path + '.rst', 'w') as f:
-                f.write(render_recipe(r))
+            with timings.timed('render', r.name):
+                content = render_recipe(r)
+            write(recipe_path + '.rst', content)
+            del content
+
+            # Lazily loaded recipes can drop their parsed contents once
+            # written so only one is held in memory at a time.
+            release = getattr(r, 'release', None)
+            if release is not None:
+                release()
+
+    manifest.finish()
+
+    return num_changed
@@ -0,0 +1,83 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import concurrent.futures
+import time
+
+class ProcessFailed(Exception):
+    def __init__(self, cmd, returncode, output):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.output = output
+        super().__init__('{} exited with status {}'.format(cmd[0],
+                                                          returncode))
+
+def _timed(steps, step, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        steps.append((step, time.perf_counter() - start))
+
+class Scheduler(object):
+    """Runs the steps of several builds concurrently from asyncio
+
+    Rendering shares the cookbook, its lazily loaded recipes, and the
+    fragment cache between builds so it is done on a single thread, one
+    build at a time.  External tools run as subprocesses and other work,
+    such as imposition, runs on a thread pool; at most max_procs of those
+    run at once.  Each build moves on to its next step as soon as the
+    previous one is done so, for instance, one PDF is compiled while the
+    next is rendered.
+
+    Every method takes a list to which a (step name, seconds) pair is
+    appended once the step is done.  Time spent waiting for a turn isn't
+    counted.  Must be created with an event loop running.
+    """
+    def __init__(self, max_procs):
+        self._slots = asyncio.Semaphore(max_procs)
+        self._render_pool = concurrent.futures.ThreadPoolExecutor(1)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_procs)
+
+    def close(self):
+        self._render_pool.shutdown()
+        self._pool.shutdown()
+
+    async def render(self, steps, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._render_pool, _timed, steps,
+                                          'render', func, *args)
+
+    async def call(self, steps, step, func, *args):
+        loop = asyncio.get_event_loop()
+        async with self._slots:
+            return await loop.run_in_executor(self._pool, _timed, steps,
+                                              step, func, *args)
+
+    async def run(self, steps, step, cmd):
+        """Runs cmd, raising ProcessFailed with its output if it fails"""
+        async with self._slots:
+            start = time.perf_counter()
+            p = await asyncio.create_subprocess_exec(*cmd,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT)
+            output, _ = await p.communicate()
+            steps.append((step, time.perf_counter() - start))
+
+        if p.returncode != 0:
+            raise ProcessFailed(cmd, p.returncode,
+                                output.decode(errors='replace'))
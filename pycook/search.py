@@ -0,0 +1,262 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+from . import cache, cookbook, recipe, rst, units, yaml_util
+import array
+import bisect
+import math
+import os
+import pickle
+import re
+import tempfile
+
+# Bump this whenever the on-disk format or the way terms are extracted
+# changes.
+INDEX_VERSION = 1
+
+_WORD_RE = re.compile(r'\w+')
+
+# How much a term counts for depending on where in the recipe it appears
+_NAME_WEIGHT = 3.0
+_INGREDIENT_WEIGHT = 2.0
+_TEXT_WEIGHT = 1.0
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+
+def _words(s):
+    return _WORD_RE.findall(s.lower())
+
+def _token_words(tokens):
+    for t in tokens:
+        if isinstance(t, str):
+            yield from _words(t)
+        elif isinstance(t, units.Quantity) and t.unit is not None:
+            yield t.unit.name.lower()
+        elif isinstance(t, units.Unit):
+            yield t.name.lower()
+
+def recipe_terms(r):
+    """Returns a dict mapping each search term in a recipe to its weight
+
+    Terms are taken from the token lists produced by Recipe.load() so
+    quantities contribute their unit rather than their digits.
+    """
+    terms = {}
+    def add(words, weight):
+        for w in words:
+            terms[w] = terms.get(w, 0.0) + weight
+
+    add(_token_words(r.name), _NAME_WEIGHT)
+    for i in r.ingredients:
+        add(_words(i.name), _INGREDIENT_WEIGHT)
+    for step in r.instructions:
+        add(_token_words(step), _TEXT_WEIGHT)
+    if r.note:
+        add(_token_words(r.note), _TEXT_WEIGHT)
+    return terms
+
+class SearchResult(object):
+    def __init__(self, score, path, name, chapter):
+        self.score = score
+        self.path = path
+        self.name = name
+        self.chapter = chapter
+
+class FileIndex(object):
+    """Base class for indices built from the recipe files of a cookbook
+
+    Documents are numbered in the order they are added and keyed on their
+    file path.  Each remembers the file's mtime and size so that update()
+    only re-reads recipes which changed.  Subclasses implement _add_doc()
+    and _remove_doc().
+    """
+    VERSION = INDEX_VERSION
+
+    def __init__(self):
+        self.version = (type(self).__name__, self.VERSION,
+                        cache._units_stamp())
+        self._next_doc = 0
+        self._files = {}
+
+    def __len__(self):
+        return len(self._files)
+
+    def add(self, path, stamp, r, chapter):
+        if path in self._files:
+            self.remove(path)
+
+        doc = self._next_doc
+        self._next_doc += 1
+        self._add_doc(doc, path, r, chapter)
+        self._files[path] = (doc, stamp, chapter)
+
+    def remove(self, path):
+        doc, _, _ = self._files.pop(path)
+        self._remove_doc(doc)
+
+    def update(self, cookbook_path, recipe_cache=None, errors=None):
+        """Brings the index up-to-date with the cookbook on disk
+
+        Recipes which fail to load are left out of the index, and tried
+        again next time, rather than stopping the update.  If errors is a
+        list, a (path, exception) pair is appended to it for each of them.
+        Returns the number of recipes which were added, re-indexed or
+        removed, so the index needs saving if it isn't zero.
+        """
+        config = yaml_util.read_yaml_file(cookbook_path)
+        cb_dir = config.get('path',
+                            os.path.dirname(os.path.abspath(cookbook_path)))
+
+        seen = set()
+        num_changed = 0
+        for index, paths in cookbook._scan_chapters(cb_dir):
+            chapter = index['title']
+            for path in paths:
+                seen.add(path)
+                st = os.stat(path)
+                stamp = (st.st_mtime_ns, st.st_size)
+                if self._files.get(path, (None, None, None))[1:] == \
+                   (stamp, chapter):
+                    continue
+
+                try:
+                    if recipe_cache is not None:
+                        r = recipe_cache.load_recipe(path)
+                    else:
+                        r = recipe.Recipe.load(path)
+                except Exception as e:
+                    if path in self._files:
+                        self.remove(path)
+                        num_changed += 1
+                    if errors is not None:
+                        errors.append((path, e))
+                    continue
+                self.add(path, stamp, r, chapter)
+                num_changed += 1
+
+        for path in list(self._files.keys()):
+            if path not in seen:
+                self.remove(path)
+                num_changed += 1
+
+        return num_changed
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(
+                                            os.path.abspath(path)),
+                                        prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """Loads an index from disk
+
+        Returns a new, empty index if there isn't a usable one at path.
+        """
+        try:
+            with open(path, 'rb') as f:
+                index = pickle.load(f)
+        except Exception:
+            return cls()
+
+        if not isinstance(index, cls) or index.version != cls().version:
+            return cls()
+        return index
+
+def _posting_add(posting, doc, *values):
+    # Document IDs only ever increase so appending keeps the postings
+    # sorted.
+    posting[0].append(doc)
+    for a, v in zip(posting[1:], values):
+        a.append(v)
+
+def _posting_remove(posting, doc):
+    i = bisect.bisect_left(posting[0], doc)
+    for a in posting:
+        del a[i]
+
+class SearchIndex(FileIndex):
+    """An inverted index over the recipes in a cookbook
+
+    Each term maps to a pair of parallel arrays holding sorted document IDs
+    and term weights.
+    """
+    def __init__(self):
+        super().__init__()
+        self._postings = {}
+        self._docs = {}
+        self._total_length = 0.0
+
+    def _add_doc(self, doc, path, r, chapter):
+        terms = recipe_terms(r)
+        for term, weight in terms.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = (array.array('I'), array.array('f'))
+                self._postings[term] = posting
+            _posting_add(posting, doc, weight)
+
+        length = sum(terms.values())
+        self._docs[doc] = (path, rst.to_rst(r.name), chapter,
+                           length, tuple(terms))
+        self._total_length += length
+
+    def _remove_doc(self, doc):
+        _, _, _, length, terms = self._docs.pop(doc)
+        self._total_length -= length
+        for term in terms:
+            _posting_remove(self._postings[term], doc)
+            if not self._postings[term][0]:
+                del self._postings[term]
+
+    def search(self, query, limit=10):
+        """Returns the best matches for query as a list of SearchResults"""
+        num_docs = len(self._docs)
+        if num_docs == 0:
+            return []
+        avg_length = self._total_length / num_docs
+
+        scores = {}
+        for term in set(_words(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            docs, weights = posting
+            idf = math.log(1 + (num_docs - len(docs) + 0.5) /
+                               (len(docs) + 0.5))
+            for doc, tf in zip(docs, weights):
+                length = self._docs[doc][3]
+                norm = _K1 * (1 - _B + _B * length / avg_length)
+                scores[doc] = scores.get(doc, 0.0) + \
+                              idf * tf * (_K1 + 1) / (tf + norm)
+
+        best = sorted(scores.items(), key=lambda s: (-s[1], s[0]))[:limit]
+        results = []
+        for doc, score in best:
+            path, name, chapter, _, _ = self._docs[doc]
+            results.append(SearchResult(score, path, name, chapter))
+        return results
+
+def index_path(cache_dir):
+    return os.path.join(cache_dir, 'search-index')
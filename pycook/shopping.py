@@ -0,0 +1,211 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+from . import batch, recipe, rst, units
+import decimal
+import fractions
+
+def _to_fraction(n):
+    return n if isinstance(n, fractions.Fraction) else fractions.Fraction(n)
+
+def _exact_number(n, unit):
+    if n.denominator == 1:
+        return int(n)
+    if unit is not None and unit.system == units.METRIC:
+        # Metric amounts are written as decimals when that's exact
+        d = decimal.Decimal(n.numerator) / decimal.Decimal(n.denominator)
+        if d == n:
+            return d
+    return n
+
+class ShoppingItem(object):
+    """One line of a shopping list
+
+    Amounts are kept in buckets of compatible units.  Units with a
+    dimension (volume, mass) are summed in the dimension's base unit so cups
+    and tablespoons add up; everything else (cans, bare counts) is summed
+    per unit.  A bucket whose amounts all used the same unit is given
+    exactly in that unit; only mixed units are converted and rounded.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.recipes = []
+        self._buckets = {}
+        self._order = []
+        self.unquantified = False
+
+    def add(self, qty):
+        if qty is None:
+            self.unquantified = True
+            return
+
+        unit = qty.unit
+        if unit is not None and unit.factor is not None and \
+           unit.dimension != units.TIME:
+            key = unit.dimension
+            factor = unit.factor
+        else:
+            key = unit
+            factor = 1
+
+        if isinstance(qty.num, units.Range):
+            amount = (_to_fraction(qty.num.min_num) * factor,
+                      _to_fraction(qty.num.max_num) * factor)
+        else:
+            amount = _to_fraction(qty.num) * factor
+            amount = (amount, amount)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # Remember the first unit so we present the total in its system
+            self._buckets[key] = [amount[0], amount[1], unit, True]
+            self._order.append(key)
+        else:
+            bucket[0] += amount[0]
+            bucket[1] += amount[1]
+            if unit is not bucket[2]:
+                bucket[3] = False
+
+    def quantities(self):
+        """Returns the summed amounts as a list of Quantity objects"""
+        result = []
+        for key in self._order:
+            min_num, max_num, unit, same_unit = self._buckets[key]
+            nums = [min_num] if min_num == max_num else [min_num, max_num]
+            if isinstance(key, str) and not same_unit:
+                system = unit.system or units.METRIC
+                result.append(units.from_base(nums, key, system))
+            else:
+                if isinstance(key, str):
+                    nums = [n / unit.factor for n in nums]
+                nums = [_exact_number(n, unit) for n in nums]
+                if len(nums) == 2:
+                    num = units.Range(nums[0], nums[1])
+                else:
+                    num = nums[0]
+                result.append(units.Quantity(num, unit))
+        return result
+
+    def to_str(self, vulgar=False):
+        amounts = ' + '.join(q.to_str(vulgar) for q in self.quantities())
+        if not amounts:
+            return self.name
+        if self.unquantified:
+            # Some recipes use it without saying how much, so get extra
+            return amounts + ' ' + self.name + ' (plus some unmeasured)'
+        return amounts + ' ' + self.name
+
+class ShoppingList(object):
+    """A list of ingredients aggregated over several recipes
+
+    Ingredients are matched on recipe.normalize_name() through a hash index
+    so adding a recipe costs time proportional to its ingredient count.
+    """
+    def __init__(self, title=None):
+        self.title = title
+        self.items = []
+        self._index = {}
+
+    def add_recipe(self, r, scale=None):
+        if scale is not None and scale != 1:
+            table = batch.collect([r])
+            table.scale(scale)
+            r = batch.apply([r], table)[0]
+
+        recipe_name = rst.to_rst(r.name)
+        for ingredient in r.ingredients:
+            key = recipe.normalize_name(ingredient.name)
+            item = self._index.get(key)
+            if item is None:
+                display_name = ingredient.name.split(',', 1)[0].strip()
+                item = ShoppingItem(display_name)
+                self._index[key] = item
+                self.items.append(item)
+            item.add(ingredient.qty)
+            if recipe_name not in item.recipes:
+                item.recipes.append(recipe_name)
+
+    def sorted_items(self):
+        return sorted(self.items, key=lambda i: i.name.lower())
+
+    def to_str(self, vulgar=False):
+        lines = []
+        if self.title:
+            lines.append(self.title)
+            lines.append('=' * len(self.title))
+            lines.append('')
+        for item in self.sorted_items():
+            lines.append('- ' + item.to_str(vulgar))
+        return '\n'.join(lines) + '\n'
+
+class MenuError(ValueError):
+    """A menu names a recipe which doesn't exist or is malformed"""
+    pass
+
+class RecipeIndex(object):
+    """Looks up recipes in a cookbook by (case-insensitive) name"""
+    def __init__(self, cb):
+        self._recipes = {}
+        for c in cb.chapters:
+            for r in c.recipes:
+                self._recipes[rst.to_rst(r.name).lower()] = r
+
+    def find(self, name):
+        try:
+            return self._recipes[name.lower()]
+        except KeyError:
+            raise MenuError('No recipe named "{}"'.format(name)) from None
+
+def _menu_entry(entry):
+    if not isinstance(entry, dict):
+        return str(entry), None
+    if 'recipe' not in entry:
+        raise MenuError('Menu entry {} has no "recipe"'.format(entry))
+    scale = entry.get('scale')
+    if scale is not None:
+        try:
+            scale = fractions.Fraction(str(scale))
+        except (ValueError, ZeroDivisionError):
+            scale = None
+        if scale is None or scale <= 0:
+            raise MenuError('Invalid scale "{}" for "{}"'.format(
+                            entry['scale'], entry['recipe']))
+    return str(entry['recipe']), scale
+
+def build_shopping_list(cb, menu, title=None, index=None):
+    """Builds a ShoppingList for a menu
+
+    menu is a list of recipe names or {'recipe': name, 'scale': factor}
+    dictionaries.  Pass a RecipeIndex to re-use one across many lists.
+    Raises MenuError if an entry is malformed or names an unknown recipe.
+    """
+    if index is None:
+        index = RecipeIndex(cb)
+
+    shopping_list = ShoppingList(title)
+    for entry in menu:
+        name, scale = _menu_entry(entry)
+        shopping_list.add_recipe(index.find(name), scale)
+    return shopping_list
+
+def build_shopping_lists(cb, menus):
+    """Builds a ShoppingList for each of several menus at once
+
+    menus is a list of (title, menu) pairs.  The cookbook is only indexed
+    once for the whole batch.
+    """
+    index = RecipeIndex(cb)
+    return [build_shopping_list(cb, menu, title, index)
+            for title, menu in menus]
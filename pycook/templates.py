@@ -0,0 +1,204 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+import tempfile
+
+# Mako compiles every template to a Python module.  Doing that on every run
+# adds up when pycook is run many times, so compiled templates are kept in
+# a per-user cache directory.  Mako only caches templates loaded from
+# files, so each template's source is first written to a file named after
+# its content hash; a changed template gets a new file and a new module.
+#
+# Mako itself is only imported once a template is rendered so that merely
+# importing the renderers stays cheap.
+
+_override_dir = None
+_override_lookup = None
+_override_dir_hash = None
+
+def cache_dir():
+    """Returns the directory compiled templates are kept in
+
+    This is $PYCOOK_TEMPLATE_CACHE if set, otherwise pycook/templates
+    under $XDG_CACHE_HOME or ~/.cache.  Setting $PYCOOK_TEMPLATE_CACHE to
+    an empty string disables the cache.
+    """
+    path = os.environ.get('PYCOOK_TEMPLATE_CACHE')
+    if path is not None:
+        return path or None
+    base = os.environ.get('XDG_CACHE_HOME') or \
+           os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pycook', 'templates')
+
+def set_override_dir(path):
+    """Uses templates from path in place of the built-in ones
+
+    A file in path named after a template plus .mako, such as
+    latex-recipe.mako, replaces that template.  Templates without a file
+    in path keep their built-in source.  Overrides may <%include> or
+    <%inherit> other .mako files in path.
+    """
+    global _override_dir, _override_lookup, _override_dir_hash
+    _override_dir = path
+    _override_lookup = None
+    _override_dir_hash = None
+    for t in _TEMPLATES.values():
+        t._source = None
+        t._overridden = False
+        t._hash = None
+        t._template = None
+
+def _write_source(path, text):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                    prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(text.encode('utf-8'))
+        os.replace(tmp_path, path)
+    except:
+        os.unlink(tmp_path)
+        raise
+
+def _compile(name, text):
+    import mako.template
+
+    root = cache_dir()
+    if root is not None:
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+        fname = '{}-{}.mako'.format(name, digest)
+        src_dir = os.path.join(root, 'src')
+        path = os.path.join(src_dir, fname)
+        try:
+            if not os.path.exists(path):
+                os.makedirs(src_dir, exist_ok=True)
+                _write_source(path, text)
+            return mako.template.Template(filename=path, uri=fname,
+                module_directory=os.path.join(root, 'modules'),
+                input_encoding='utf-8')
+        except OSError:
+            # Fall back to compiling in memory if the cache isn't writable
+            pass
+    return mako.template.Template(text)
+
+def _lookup():
+    # Overrides are compiled through one TemplateLookup so they can refer
+    # to each other by file name.  Mako only checks a compiled module
+    # against its source's mtime, to the second, so each version of each
+    # override directory gets a module directory of its own.
+    global _override_lookup
+    import mako.lookup
+
+    if _override_lookup is None:
+        module_dir = None
+        root = cache_dir()
+        if root is not None:
+            key = hashlib.sha256(os.fsencode(
+                os.path.abspath(_override_dir)) +
+                _override_hash().encode()).hexdigest()[:16]
+            module_dir = os.path.join(root, 'modules', 'overrides-' + key)
+        _override_lookup = mako.lookup.TemplateLookup(
+            directories=[_override_dir], module_directory=module_dir,
+            input_encoding='utf-8')
+    return _override_lookup
+
+def _compile_override(name):
+    global _override_lookup
+    import mako.lookup
+
+    try:
+        return _lookup().get_template(name + '.mako')
+    except OSError:
+        # Fall back to compiling in memory if the cache isn't writable
+        _override_lookup = mako.lookup.TemplateLookup(
+            directories=[_override_dir], input_encoding='utf-8')
+        return _override_lookup.get_template(name + '.mako')
+
+def _override_hash():
+    # An override may include any other file in the directory, so a change
+    # to any of them has to invalidate output rendered from it.
+    global _override_dir_hash
+    if _override_dir_hash is None:
+        h = hashlib.sha256()
+        for fname in sorted(os.listdir(_override_dir)):
+            if not fname.endswith('.mako'):
+                continue
+            with open(os.path.join(_override_dir, fname), 'rb') as f:
+                data = f.read()
+            h.update(repr((fname, len(data))).encode())
+            h.update(data)
+        _override_dir_hash = h.hexdigest()
+    return _override_dir_hash
+
+class Template(object):
+    """A named Mako template which is compiled the first time it's used
+
+    The source may be overridden by set_override_dir().
+    """
+    def __init__(self, name, text):
+        assert name not in _TEMPLATES
+        self.name = name
+        self.text = text
+        self._source = None
+        self._overridden = False
+        self._hash = None
+        self._template = None
+        _TEMPLATES[name] = self
+
+    @property
+    def source(self):
+        if self._source is None:
+            self._source = self.text
+            self._overridden = False
+            if _override_dir is not None:
+                path = os.path.join(_override_dir, self.name + '.mako')
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        self._source = f.read()
+                    self._overridden = True
+                except FileNotFoundError:
+                    pass
+        return self._source
+
+    def source_hash(self):
+        if self._hash is None:
+            h = hashlib.sha256(self.source.encode('utf-8'))
+            if self._overridden:
+                h.update(_override_hash().encode())
+            self._hash = h.hexdigest()
+        return self._hash
+
+    def _get(self):
+        if self._template is None:
+            source = self.source
+            if self._overridden:
+                self._template = _compile_override(self.name)
+            else:
+                self._template = _compile(self.name, source)
+        return self._template
+
+    def render(self, **kwargs):
+        return self._get().render(**kwargs)
+
+    def render_to(self, f, **kwargs):
+        """Renders the template, writing the output to the file object f"""
+        import mako.runtime
+        self._get().render_context(mako.runtime.Context(f, **kwargs))
+
+_TEMPLATES = {}
+
+def names():
+    return sorted(_TEMPLATES)
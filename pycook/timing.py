@@ -0,0 +1,187 @@
+# Copyright © 2020 Jason Ekstrand
+#
+# PyCook is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# PyCook is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# PyCook.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import json
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def _max_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def _plain_name(name):
+    if isinstance(name, str):
+        return name
+    from . import rst
+    return rst.to_rst(name)
+
+class Phase(object):
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.seconds = None
+        self.max_rss = None
+        self.peak_traced = None
+        self.info = {}
+
+    def to_dict(self):
+        d = {
+            'name': self.name,
+            'depth': self.depth,
+            'seconds': self.seconds,
+            'max_rss': self.max_rss,
+        }
+        if self.peak_traced is not None:
+            d['peak_traced'] = self.peak_traced
+        d.update(self.info)
+        return d
+
+def _reset_traced_peak():
+    # tracemalloc.reset_peak() is new in Python 3.9.  Without it, each
+    # phase's peak is the highest usage since tracing started instead.
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+class Timings(object):
+    """Collects wall time and memory use for the phases of a build
+
+    Code being measured wraps each phase in "with timings.phase(name):" and
+    reports individual recipes with item().  Phases may nest.  Subclasses
+    can override phase_done() and item_done() to be told about each
+    measurement as it happens.
+
+    Memory is reported as the process's peak RSS at the end of each phase.
+    If trace_memory is True, the peak Python heap usage within each phase
+    is also measured with tracemalloc, which slows things down a lot.
+    """
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.phases = []
+        self.items = {}
+        self._depth = 0
+        self._peaks = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        p = Phase(name, self._depth)
+        self.phases.append(p)
+        self._depth += 1
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1],
+                                      tracemalloc.get_traced_memory()[1])
+            _reset_traced_peak()
+            self._peaks.append(0)
+
+        start = time.perf_counter()
+        try:
+            yield p
+        finally:
+            p.seconds = time.perf_counter() - start
+            p.max_rss = _max_rss()
+            if self.trace_memory:
+                p.peak_traced = max(self._peaks.pop(),
+                                    tracemalloc.get_traced_memory()[1])
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], p.peak_traced)
+                else:
+                    tracemalloc.stop()
+            self._depth -= 1
+            self.phase_done(p)
+
+    def item(self, kind, name, seconds):
+        """Records how long a single item, such as a recipe, took"""
+        name = _plain_name(name)
+        self.items.setdefault(kind, []).append((seconds, name))
+        self.item_done(kind, name, seconds)
+
+    @contextlib.contextmanager
+    def timed(self, kind, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.item(kind, name, time.perf_counter() - start)
+
+    def phase_done(self, phase):
+        pass
+
+    def item_done(self, kind, name, seconds):
+        pass
+
+    def slowest(self, kind, n=5):
+        return sorted(self.items.get(kind, []), reverse=True)[:n]
+
+    def to_dict(self, num_slowest=5):
+        return {
+            'phases': [p.to_dict() for p in self.phases],
+            'slowest': {
+                kind: [{ 'name': name, 'seconds': seconds }
+                       for seconds, name in self.slowest(kind, num_slowest)]
+                for kind in sorted(self.items)
+            },
+        }
+
+    def to_json(self, num_slowest=5):
+        return json.dumps(self.to_dict(num_slowest), indent=2)
+
+    def to_str(self, num_slowest=5):
+        lines = []
+        for p in self.phases:
+            line = '{:32} {:8.3f} s'.format('  ' * p.depth + p.name,
+                                            p.seconds)
+            if p.max_rss is not None:
+                line += '  {:7.1f} MiB max RSS'.format(p.max_rss / (1 << 20))
+            if p.peak_traced is not None:
+                line += '  {:7.1f} MiB peak heap'.format(
+                        p.peak_traced / (1 << 20))
+            for key, value in sorted(p.info.items()):
+                line += '  {}={}'.format(key, value)
+            lines.append(line)
+
+        for kind in sorted(self.items):
+            lines.append('')
+            lines.append('Slowest recipes to {}:'.format(kind))
+            for seconds, name in self.slowest(kind, num_slowest):
+                lines.append('  {:8.4f} s  {}'.format(seconds, name))
+
+        return '\n'.join(lines)
+
+class _NullTimings(Timings):
+    """A Timings which measures nothing, used when no one is listening"""
+    @contextlib.contextmanager
+    def phase(self, name):
+        yield Phase(name, 0)
+
+    def item(self, kind, name, seconds):
+        pass
+
+    @contextlib.contextmanager
+    def timed(self, kind, name):
+        yield
+
+NULL_TIMINGS = _NullTimings()
@@ -17,25 +17,71 @@
 
 import re
 
+# Short chunks of text such as whitespace and joining words repeat constantly
+# across recipes.  Keep a single copy of each; longer text is nearly always
+# unique so it isn't worth the lookup.
+_INTERN_MAX_LEN = 32
+_INTERN_LIMIT = 1 << 16
+_interned_text = {}
+
+def intern_text(s):
+    if len(s) > _INTERN_MAX_LEN:
+        return s
+    interned = _interned_text.get(s)
+    if interned is not None:
+        return interned
+    if len(_interned_text) < _INTERN_LIMIT:
+        _interned_text[s] = s
+    return s
+
 class Tokenizer(object):
+    """Splits strings into a list of plain-text chunks and tokens
+
+    All of the token classes are combined into one regular expression with
+    a named group per class so each string is scanned exactly once and the
+    group which matched tells us which class to build the token from.
+
+    Each class provides either LEX_RE, a regular expression, and
+    from_lex(), which builds a token from the match object, or RE and
+    from_match(), which builds a token from the matched string.  Group names
+    in LEX_RE must be unique across all of the classes.
+
+    Classes may also provide LEX_START, a regular expression matching the
+    first character of any of their tokens.  If every class has one, they
+    are combined into a lookahead in front of the whole expression.  Most
+    of the text we tokenize is plain words and this lets the regex engine
+    reject those positions with a single character test instead of trying
+    each alternative in turn.
+    """
     def __init__(self, classes):
         self.classes = classes
         chunks = []
-        for c in classes:
-            chunks.append(r'(?:' + c.RE.pattern + ')')
-        self.re = re.compile('(' + '|'.join(chunks) + ')')
-
-    def _str_to_token(self, s):
-        for c in self.classes:
-            if c.RE.match(s):
-                return c.from_match(s)
-        return s
+        self._builders = {}
+        for i, c in enumerate(classes):
+            name = '_tok{}'.format(i)
+            if hasattr(c, 'LEX_RE'):
+                chunks.append('(?P<{}>{})'.format(name, c.LEX_RE.pattern))
+                self._builders[name] = c.from_lex
+            else:
+                chunks.append('(?P<{}>{})'.format(name, c.RE.pattern))
+                self._builders[name] = \
+                    lambda m, name=name, c=c: c.from_match(m.group(name))
+        pattern = '|'.join(chunks)
+        if all(hasattr(c, 'LEX_START') for c in classes):
+            starts = '|'.join(c.LEX_START.pattern for c in classes)
+            pattern = '(?=' + starts + ')(?:' + pattern + ')'
+        self.re = re.compile(pattern)
 
     def _tokenize(self, s):
-        for c in self.re.split(s):
-            if not c:
-                continue
-            yield self._str_to_token(c)
+        pos = 0
+        for m in self.re.finditer(s):
+            start, end = m.span()
+            if start > pos:
+                yield intern_text(s[pos:start])
+            yield self._builders[m.lastgroup](m)
+            pos = end
+        if pos < len(s):
+            yield intern_text(s[pos:])
 
     def tokenize(self, s):
         t = list(self._tokenize(s))
@@ -23,21 +23,33 @@ import re
 class Unit(object):
     RE = re.compile(r'\[\w+\]')
     _RE = re.compile(r'\[(?P<unit>\w+)\]')
+    LEX_RE = _RE
+    LEX_START = re.compile(r'\[')
 
     _name_to_unit = {}
+    _units = []
 
     def __init__(self, name, text, plural=None,
-                 is_english=False, is_metric=False):
+                 is_english=False, is_metric=False,
+                 dimension=None, factor=None):
         self.name = name
         self.text = text
         self.plural = plural if plural else text
         assert not (is_metric and is_english)
-        self.is_english = is_english,
+        self.is_english = is_english
         self.is_metric = is_metric
 
+        # The dimension (VOLUME, MASS, etc.) this unit measures and how many
+        # of the dimension's base unit make up one of this unit.  Units
+        # without a factor can't be converted, at least not by scaling.
+        self.dimension = dimension
+        self.factor = fractions.Fraction(factor) if factor else None
+
         # Register this unit
         assert name not in Unit._name_to_unit
         Unit._name_to_unit[name] = self
+        self.id = len(Unit._units)
+        Unit._units.append(self)
 
         # TODO: Once we get auto-plurals working, get rid of this
         if plural:
@@ -46,9 +58,22 @@ class Unit(object):
     def __repr__(self):
         return '[' + self.name + ']'
 
+    def __reduce__(self):
+        # Units are singletons; make sure pickling preserves identity
+        return (Unit.from_name, (self.name,))
+
     def __str__(self):
         return self.text
 
+    @property
+    def system(self):
+        if self.is_english:
+            return ENGLISH
+        elif self.is_metric:
+            return METRIC
+        else:
+            return None
+
     def to_str(self, num=None, plural=False):
         # If specified, num overrides plural
         if num is not None:
@@ -62,6 +87,10 @@ class Unit(object):
     def from_name(name):
         return Unit._name_to_unit[name]
 
+    @staticmethod
+    def from_id(unit_id):
+        return Unit._units[unit_id]
+
     @staticmethod
     def from_match(m):
         if isinstance(m, re.Match):
@@ -69,38 +98,93 @@ class Unit(object):
         m = Unit._RE.match(m)
         return Unit.from_name(m.group('unit'))
 
+    @staticmethod
+    def from_lex(m):
+        return Unit.from_name(m.group('unit'))
+
+ENGLISH = 'english'
+METRIC = 'metric'
+
+VOLUME = 'volume'
+MASS = 'mass'
+TEMPERATURE = 'temperature'
+LENGTH = 'length'
+TIME = 'time'
+
+# Exact definitions of the US customary units in terms of the metric base
+# units so that conversions can be done with exact Fraction arithmetic.
+_ML_PER_TSP = fractions.Fraction('4.92892159375')
+_G_PER_OZ = fractions.Fraction('28.349523125')
+_CM_PER_IN = fractions.Fraction('2.54')
+
 # TODO: These are really bad units; we should get rid of them
 BAG = Unit('bag', 'bag')
 CAN = Unit('can', 'can', plural='cans')
 PACKAGE = Unit('pkg', 'pkg.')
 
 # General units
-MINUTE = Unit('min', 'min.')
-HOUR = Unit('hour', 'hour', plural='hours')
-DAY = Unit('day', 'day', plural='days')
+MINUTE = Unit('min', 'min.', dimension=TIME, factor=1)
+HOUR = Unit('hour', 'hour', plural='hours', dimension=TIME, factor=60)
+DAY = Unit('day', 'day', plural='days', dimension=TIME, factor=24 * 60)
 CLOVE = Unit('clove', 'clove', plural='cloves')
 STRIP = Unit('strip', 'strip', plural='strips')
 
 # English Units
-CUP = Unit('cup', 'cup', plural='cups', is_english=True)
-TABLESPOON = Unit('tbsp', 'tbsp.', is_english=True)
-TEASPOON = Unit('tsp', 'tsp.', is_english=True)
-POUND = Unit('lb', 'lb.', is_english=True)
-OUNCE = Unit('oz', 'oz.', is_english=True)
-DEGREES_FAHRENHEIT = Unit('degF', '°F', is_english=True)
-INCH = Unit('in', 'in.', is_english=True)
-GALLON = Unit('gal', 'gal.', is_english=True)
+CUP = Unit('cup', 'cup', plural='cups', is_english=True,
+           dimension=VOLUME, factor=48 * _ML_PER_TSP)
+TABLESPOON = Unit('tbsp', 'tbsp.', is_english=True,
+                  dimension=VOLUME, factor=3 * _ML_PER_TSP)
+TEASPOON = Unit('tsp', 'tsp.', is_english=True,
+                dimension=VOLUME, factor=_ML_PER_TSP)
+POUND = Unit('lb', 'lb.', is_english=True,
+             dimension=MASS, factor=16 * _G_PER_OZ)
+OUNCE = Unit('oz', 'oz.', is_english=True,
+             dimension=MASS, factor=_G_PER_OZ)
+DEGREES_FAHRENHEIT = Unit('degF', '°F', is_english=True,
+                          dimension=TEMPERATURE)
+INCH = Unit('in', 'in.', is_english=True,
+            dimension=LENGTH, factor=_CM_PER_IN)
+GALLON = Unit('gal', 'gal.', is_english=True,
+              dimension=VOLUME, factor=768 * _ML_PER_TSP)
 
 # Metric Units
-GRAM = Unit('g', 'g', is_metric=True)
-MILLILETER = Unit('ml', 'ml', is_metric=True)
-DEGREES_CELSIUS = Unit('degC', '°C', is_metric=True)
-CENTIMETER = Unit('cm', 'cm', is_metric=True)
+GRAM = Unit('g', 'g', is_metric=True, dimension=MASS, factor=1)
+MILLILETER = Unit('ml', 'ml', is_metric=True, dimension=VOLUME, factor=1)
+DEGREES_CELSIUS = Unit('degC', '°C', is_metric=True, dimension=TEMPERATURE)
+CENTIMETER = Unit('cm', 'cm', is_metric=True, dimension=LENGTH, factor=1)
 
 
 NUMBER_RE = re.compile(r'(?:\d+\s+)?\d/\d|\d*\.\d+|\d+')
+NUMBER_START_RE = re.compile(r'[\d.]')
 _FRAC_RE = re.compile(r'(?:(?P<whole>\d+)\s+)?(?P<frac>\d/\d)')
 
+def _number_pattern(name):
+    """Returns NUMBER_RE with named groups for each kind of number
+
+    All of the groups are prefixed with the given name so that several
+    numbers can appear in one regular expression.
+    """
+    return (r'(?P<{0}>(?:(?P<{0}_whole>\d+)\s+)?' +
+            r'(?P<{0}_numer>\d)/(?P<{0}_denom>\d)|' +
+            r'(?P<{0}_dec>\d*\.\d+)|' +
+            r'(?P<{0}_int>\d+))').format(name)
+
+def _number_from_groups(m, name):
+    i = m.group(name + '_int')
+    if i is not None:
+        return int(i)
+
+    d = m.group(name + '_dec')
+    if d is not None:
+        return decimal.Decimal(d)
+
+    n = fractions.Fraction(int(m.group(name + '_numer')),
+                           int(m.group(name + '_denom')))
+    whole = m.group(name + '_whole')
+    if whole:
+        n += int(whole)
+    return n
+
 def number_from_str(s):
     try:
         return int(s)
@@ -135,12 +219,54 @@ _VULGAR_FRACTIONSS = {
     (7, 8): '⅞',
 }
 
+# Parsed recipes contain lots of identical numbers and quantities so we keep
+# one shared instance of each.  The tables are capped so pathological input
+# can't grow them without bound.
+_INTERN_LIMIT = 1 << 16
+_interned_numbers = {}
+_interned_quantities = {}
+
+def _number_key(n):
+    # Equal numbers of different types (or Decimals with different
+    # precision) print differently so the key has to include both.
+    if isinstance(n, Range):
+        return (Range, _number_key(n.min_num), _number_key(n.max_num))
+    return (type(n), str(n))
+
+def intern_number(n):
+    key = _number_key(n)
+    interned = _interned_numbers.get(key)
+    if interned is not None:
+        return interned
+    if len(_interned_numbers) < _INTERN_LIMIT:
+        _interned_numbers[key] = n
+    return n
+
+def _immutable_setattr(self, name, value):
+    raise AttributeError(type(self).__name__ + ' objects are immutable')
+
 class Range(object):
+    __slots__ = ('min_num', 'max_num')
+
     def __init__(self, min_num, max_num):
         assert isinstance(min_num, (int, fractions.Fraction, decimal.Decimal))
         assert isinstance(max_num, (int, fractions.Fraction, decimal.Decimal))
-        self.min_num = min_num
-        self.max_num = max_num
+        object.__setattr__(self, 'min_num', min_num)
+        object.__setattr__(self, 'max_num', max_num)
+
+    __setattr__ = _immutable_setattr
+    __delattr__ = _immutable_setattr
+
+    def __reduce__(self):
+        return (Range, (self.min_num, self.max_num))
+
+    def __eq__(self, other):
+        if not isinstance(other, Range):
+            return NotImplemented
+        return self.min_num == other.min_num and self.max_num == other.max_num
+
+    def __hash__(self):
+        return hash((self.min_num, self.max_num))
 
 def number_to_str(n, vulgar=False):
     if isinstance(n, Range):
@@ -159,7 +285,7 @@ def number_to_str(n, vulgar=False):
         if whole > 0:
             s += str(whole)
         if num > 0:
-            if vulgar:
+            if vulgar and (num, denom) in _VULGAR_FRACTIONSS:
                 s += _VULGAR_FRACTIONSS[(num, denom)]
             else:
                 if whole:
@@ -169,21 +295,40 @@ def number_to_str(n, vulgar=False):
     else:
         assert False, 'Not a number type'
 
+def _intern_quantity(num, unit):
+    key = (unit, _number_key(num))
+    q = _interned_quantities.get(key)
+    if q is None:
+        q = Quantity(num, unit)
+        if len(_interned_quantities) < _INTERN_LIMIT:
+            _interned_quantities[key] = q
+    return q
+
 class Quantity(object):
+    __slots__ = ('num', 'unit')
+
     RE = re.compile(r'(?:(?:' + NUMBER_RE.pattern + r')\s*-+\s*)?' +
                     r'(?:' + NUMBER_RE.pattern + r')' +
                     r'(?:\s*' + Unit.RE.pattern + r')?')
-    _RE = re.compile(r'(?:(?P<min_num>' + NUMBER_RE.pattern + r')\s*-+\s*)?' +
-                     r'(?P<num>' + NUMBER_RE.pattern + r')' +
-                     r'(?:\s*(?P<unit>' + Unit.RE.pattern + r'))?')
+    _RE = re.compile(r'(?:' + _number_pattern('qty_min') + r'\s*-+\s*)?' +
+                     _number_pattern('qty_num') +
+                     r'(?:\s*\[(?P<qty_unit>\w+)\])?')
+    LEX_RE = _RE
+    LEX_START = NUMBER_START_RE
 
     def __init__(self, num, unit=None):
         assert isinstance(num, (Range, int, fractions.Fraction,
                                 decimal.Decimal))
-        assert num != 0
+        assert num != 0, 'Quantities can not be zero'
         assert unit is None or isinstance(unit, Unit)
-        self.num = num
-        self.unit = unit
+        object.__setattr__(self, 'num', num)
+        object.__setattr__(self, 'unit', unit)
+
+    __setattr__ = _immutable_setattr
+    __delattr__ = _immutable_setattr
+
+    def __reduce__(self):
+        return (_intern_quantity, (self.num, self.unit))
 
     def __repr__(self):
         return 'Quantity("' + self.to_str() + '")'
@@ -194,6 +339,9 @@ class Quantity(object):
 
         return self.num == other.num
 
+    def __hash__(self):
+        return hash((self.unit, self.num))
+
     def __lt__(self, other):
         if self.unit != other.unit:
             return False
@@ -209,18 +357,198 @@ class Quantity(object):
     @staticmethod
     def from_match(m):
         if isinstance(m, re.Match):
+            if 'qty_num' in m.re.groupindex:
+                return Quantity.from_lex(m)
             m = m.group(0)
-        m = Quantity._RE.match(m)
-        num = number_from_str(m.group('num'))
-        if m.group('min_num'):
-            min_num = number_from_str(m.group('min_num'))
+        return Quantity.from_lex(Quantity._RE.match(m))
+
+    @staticmethod
+    def from_lex(m):
+        """Builds a Quantity directly from a match of Quantity.LEX_RE
+
+        The returned Quantity is interned.
+        """
+        num = intern_number(_number_from_groups(m, 'qty_num'))
+        if m.group('qty_min'):
+            min_num = intern_number(_number_from_groups(m, 'qty_min'))
             num = Range(min_num, num)
-        if m.group('unit'):
-            unit = Unit.from_match(m.group('unit'))
+        unit = m.group('qty_unit')
+        if unit:
+            unit = Unit.from_name(unit)
         else:
             unit = None
-        return Quantity(num, unit)
+        return _intern_quantity(num, unit)
 
     @staticmethod
     def from_str(s):
         return Quantity.from_match(Quantity.RE.match(s))
+
+
+# The units we convert into for each dimension and system, largest first,
+# along with the smallest amount of each that still reads naturally.  We
+# pick the first unit in which the converted amount reaches that minimum.
+_TARGET_UNITS = {
+    (VOLUME, ENGLISH): [
+        (GALLON, 1),
+        (CUP, fractions.Fraction(1, 4)),
+        (TABLESPOON, 1),
+        (TEASPOON, 0),
+    ],
+    (VOLUME, METRIC): [(MILLILETER, 0)],
+    (MASS, ENGLISH): [(POUND, 1), (OUNCE, 0)],
+    (MASS, METRIC): [(GRAM, 0)],
+    (LENGTH, ENGLISH): [(INCH, 0)],
+    (LENGTH, METRIC): [(CENTIMETER, 0)],
+    (TEMPERATURE, ENGLISH): [(DEGREES_FAHRENHEIT, 0)],
+    (TEMPERATURE, METRIC): [(DEGREES_CELSIUS, 0)],
+}
+
+def _build_conversions():
+    """Precomputes the candidate target units for each unit and system
+
+    Each entry is a list of (target unit, factor, minimum) tuples where
+    multiplying an amount in the source unit by factor gives the amount in
+    the target unit.  This keeps each conversion down to a dict lookup and
+    a handful of multiplications.
+    """
+    conversions = {}
+    for unit in set(Unit._name_to_unit.values()):
+        if unit.dimension is None or unit.system is None:
+            continue
+
+        for system in (ENGLISH, METRIC):
+            if system == unit.system:
+                continue
+
+            candidates = []
+            for target, minimum in _TARGET_UNITS[(unit.dimension, system)]:
+                if unit.factor is not None:
+                    factor = unit.factor / target.factor
+                else:
+                    factor = None
+                candidates.append((target, factor, minimum))
+            conversions[(unit, system)] = candidates
+    return conversions
+
+_CONVERSIONS = _build_conversions()
+
+def _to_fraction(n):
+    if isinstance(n, fractions.Fraction):
+        return n
+    return fractions.Fraction(n)
+
+def _round_english(n):
+    # Round to the nearest eighth, or to a whole number for larger amounts,
+    # so the result can be written with a common fraction.
+    if n >= 10:
+        n = fractions.Fraction(round(n))
+    else:
+        n = fractions.Fraction(round(n * 8), 8)
+        if n == 0:
+            n = fractions.Fraction(1, 8)
+    return int(n) if n.denominator == 1 else n
+
+def _round_metric(n):
+    # Metric amounts are written as decimals: whole numbers for larger
+    # amounts and one decimal place for smaller ones.
+    if n >= 10:
+        return int(round(n))
+    d = decimal.Decimal(n.numerator) / decimal.Decimal(n.denominator)
+    d = d.quantize(decimal.Decimal('0.1'))
+    if d == 0:
+        d = decimal.Decimal('0.1')
+    if d == d.to_integral_value():
+        return int(d)
+    return d
+
+def _round_temperature(n):
+    # Oven temperatures are given in multiples of 5
+    if n >= 100:
+        return int(round(n / 5)) * 5
+    return int(round(n))
+
+def _convert_temperature(n, target):
+    if target is DEGREES_CELSIUS:
+        return _round_temperature((n - 32) * fractions.Fraction(5, 9))
+    else:
+        return _round_temperature(n * fractions.Fraction(9, 5) + 32)
+
+def convert_number(n, from_unit, to_unit):
+    """Converts a number between units of the same dimension exactly
+
+    Returns a Fraction.  Temperatures can't be converted this way since
+    they aren't related by a simple factor.
+    """
+    assert from_unit.dimension == to_unit.dimension
+    assert from_unit.factor is not None and to_unit.factor is not None
+    return _to_fraction(n) * from_unit.factor / to_unit.factor
+
+_converted = {}
+
+def from_base(nums, dimension, system):
+    """Builds a readable Quantity from amounts in a dimension's base unit
+
+    nums is a list of one number or two for a range.  The unit is chosen
+    the same way as for convert().  Temperatures aren't supported.
+    """
+    round_num = _round_english if system == ENGLISH else _round_metric
+    nums = [_to_fraction(n) for n in nums]
+    for target, minimum in _TARGET_UNITS[(dimension, system)]:
+        if round_num(nums[-1] / target.factor) >= minimum:
+            break
+    nums = [intern_number(round_num(n / target.factor)) for n in nums]
+    if len(nums) == 2:
+        num = Range(nums[0], nums[1])
+    else:
+        num = nums[0]
+    return _intern_quantity(num, target)
+
+def _convert(qty, system, candidates):
+    if isinstance(qty.num, Range):
+        nums = [_to_fraction(qty.num.min_num), _to_fraction(qty.num.max_num)]
+    else:
+        nums = [_to_fraction(qty.num)]
+
+    if qty.unit.dimension == TEMPERATURE:
+        target = candidates[0][0]
+        nums = [_convert_temperature(n, target) for n in nums]
+        if 0 in nums:
+            # Quantities can't be zero so leave freezing point alone
+            return qty
+    else:
+        round_num = _round_english if system == ENGLISH else _round_metric
+        for target, factor, minimum in candidates:
+            if round_num(nums[-1] * factor) >= minimum:
+                break
+        nums = [round_num(n * factor) for n in nums]
+
+    if len(nums) == 2:
+        num = Range(intern_number(nums[0]), intern_number(nums[1]))
+    else:
+        num = intern_number(nums[0])
+    return _intern_quantity(num, target)
+
+def convert(qty, system):
+    """Converts a Quantity to the given system (ENGLISH or METRIC)
+
+    Quantities which are already in the requested system or which don't
+    have a convertible unit are returned unchanged.  Otherwise, the most
+    readable target unit is chosen based on the (maximum) amount and the
+    result is rounded to something a cook would write down.
+    """
+    if qty.unit is None:
+        return qty
+
+    candidates = _CONVERSIONS.get((qty.unit, system))
+    if candidates is None:
+        return qty
+
+    # The same few quantities show up over and over again in a cookbook.
+    # The result only depends on the value and unit, so remember it.
+    key = (qty, system)
+    converted = _converted.get(key)
+    if converted is None:
+        converted = _convert(qty, system, candidates)
+        if len(_converted) < _INTERN_LIMIT:
+            _converted[key] = converted
+    return converted
@@ -16,14 +16,35 @@
 # PyCook.  If not, see <https://www.gnu.org/licenses/>.
 
 import io
-import yaml
-try:
-    from yaml import CLoader as Loader
-except ImportError:
-    from yaml import Loader
+
+_Loader = None
+
+def _loader():
+    # yaml is only imported once something needs parsing so that commands
+    # which never read a file, like --help, don't pay for it.
+    global _Loader
+    if _Loader is None:
+        try:
+            from yaml import CLoader as Loader
+        except ImportError:
+            from yaml import Loader
+        _Loader = Loader
+    return _Loader
 
 def read_yaml_file(f):
     if isinstance(f, str):
         with io.open(f, "r") as stream:
             return read_yaml_file(stream)
-    return yaml.load(f, Loader=Loader)
+    import yaml
+    return yaml.load(f, Loader=_loader())
+
+def compose_yaml(text):
+    """Parses text into YAML nodes without constructing any objects
+
+    Every node records the line and column it came from.
+    """
+    loader = _loader()(text)
+    try:
+        return loader.get_single_node()
+    finally:
+        loader.dispose()